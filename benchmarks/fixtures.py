@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Generated audio fixtures for benchmarks
+Writes speech-like WAV (tone bursts separated by short silences, so
+silencedetect finds cut points) in a few lengths, then converts each to the
+other formats recorders produce. Existing fixtures are reused
+"""
+
+import os
+import math
+import wave
+import array
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+FIXTURE_DIR = Path(__file__).parent / 'fixtures'
+SAMPLE_RATE = 16000
+
+# name -> length in seconds; "long" is past 1.5x the default chunk length
+LENGTHS = {
+    'short': 30,
+    'medium': 5 * 60,
+    'long': 25 * 60,
+}
+
+# extension -> ffmpeg encoder arguments (wav is written directly)
+FORMATS = {
+    'wav': None,
+    'm4a': ['-c:a', 'aac', '-b:a', '64k', '-ar', '44100', '-ac', '2'],
+    'mp3': ['-c:a', 'libmp3lame', '-b:a', '128k', '-ar', '44100', '-ac', '2'],
+    # Already at the upload settings: exercises the ffprobe passthrough path
+    'lowmp3': ['-c:a', 'libmp3lame', '-b:a', '32k', '-ar', '16000', '-ac', '1'],
+}
+
+
+def _speech_like_second(second: int) -> bytes:
+    """One second of 16-bit mono audio: a wobbling tone, or silence every 8th second"""
+    if second % 8 == 7:
+        return bytes(SAMPLE_RATE * 2)
+    pitch = 140 + 40 * math.sin(second)
+    samples = array.array('h', (
+        int(9000 * math.sin(2 * math.pi * pitch * n / SAMPLE_RATE)
+            * (0.6 + 0.4 * math.sin(2 * math.pi * 3 * n / SAMPLE_RATE)))
+        for n in range(SAMPLE_RATE)
+    ))
+    return samples.tobytes()
+
+
+def write_wav(path: Path, seconds: int):
+    # Eight distinct seconds repeated keeps generation fast for long fixtures
+    blocks = [_speech_like_second(second) for second in range(8)]
+    tmp_path = path.with_suffix('.tmp.wav')
+    with wave.open(str(tmp_path), 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(SAMPLE_RATE)
+        for second in range(seconds):
+            out.writeframes(blocks[second % 8])
+    os.replace(tmp_path, path)
+
+
+def fixture_name(length: str, fmt: str) -> str:
+    # Date-stamped names so the workflow groups them under one note
+    extension = 'mp3' if fmt == 'lowmp3' else fmt
+    suffix = '_low' if fmt == 'lowmp3' else ''
+    return f"20250716_0930{list(LENGTHS).index(length):02d}_{length}{suffix}.{extension}"
+
+
+def generate(lengths: List[str] = None, formats: List[str] = None,
+             directory: Path = FIXTURE_DIR) -> List[Dict]:
+    """
+    Create any missing fixtures; returns [{path, length, format, seconds, bytes}]
+    Formats other than wav need ffmpeg
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    fixtures = []
+    for length in lengths or list(LENGTHS):
+        seconds = LENGTHS[length]
+        wav_path = directory / fixture_name(length, 'wav')
+        if not wav_path.exists():
+            write_wav(wav_path, seconds)
+        for fmt in formats or list(FORMATS):
+            path = directory / fixture_name(length, fmt)
+            if not path.exists():
+                tmp_path = path.with_name('tmp_' + path.name)
+                cmd = ['ffmpeg', '-v', 'error', '-y', '-i', str(wav_path)] + FORMATS[fmt] + [str(tmp_path)]
+                subprocess.run(cmd, check=True)
+                os.replace(tmp_path, path)
+            fixtures.append({
+                'path': str(path),
+                'length': length,
+                'format': fmt,
+                'seconds': seconds,
+                'bytes': path.stat().st_size,
+            })
+    return fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate benchmark audio fixtures')
+    parser.add_argument('--lengths', default=','.join(LENGTHS), help='Comma-separated subset of: ' + ', '.join(LENGTHS))
+    parser.add_argument('--formats', default=','.join(FORMATS), help='Comma-separated subset of: ' + ', '.join(FORMATS))
+    args = parser.parse_args()
+    for fixture in generate(args.lengths.split(','), args.formats.split(',')):
+        print(f"{fixture['path']}  {fixture['seconds']}s  {fixture['bytes'] / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
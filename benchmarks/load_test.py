@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for web_server.py
+Launches the web server against the stub transcription API and the fake
+osascript (or targets an already running server), then runs concurrent
+virtual users that mix /process, /batch_process, /status and /health
+requests for a fixed duration. Reports per-endpoint latency percentiles and
+error rates, end-to-end job completion times, and how the server's thread
+count and memory grow over the run
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+
+BENCH_DIR = Path(__file__).parent
+PROJECT_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(BENCH_DIR))
+
+from fixtures import generate
+from run_benchmarks import FAKE_BIN, percentile
+from stub_api import StubAPIServer, StubConfig
+
+DEFAULT_MIX = 'process=4,batch=1,status=4,health=1'
+STATUS_POLL_INTERVAL = 0.5
+SAMPLE_INTERVAL = 1.0
+REQUEST_TIMEOUT = 120
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ('process', 'batch', 'status', 'health'):
+            raise ValueError(f"Unknown action: {name}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+class Recorder:
+    """Thread-safe request and job timing collector"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}  # endpoint -> {'latencies': [], 'errors': 0, 'rejected': 0}
+        self.submitted = {}  # task_id -> submit time
+        self.completed = {}  # task_id -> (seconds, status)
+
+    def request(self, endpoint: str, seconds: float, status_code: Optional[int]):
+        with self._lock:
+            stats = self.requests.setdefault(endpoint, {'latencies': [], 'errors': 0, 'rejected': 0})
+            stats['latencies'].append(seconds)
+            if status_code == 503:
+                stats['rejected'] += 1
+            elif status_code is None or status_code >= 400:
+                stats['errors'] += 1
+
+    def submit(self, task_ids: List[str]):
+        now = time.perf_counter()
+        with self._lock:
+            for task_id in task_ids:
+                self.submitted[task_id] = now
+
+    def pending(self) -> List[str]:
+        with self._lock:
+            return [task_id for task_id in self.submitted if task_id not in self.completed]
+
+    def known_tasks(self) -> List[str]:
+        with self._lock:
+            return list(self.submitted)
+
+    def complete(self, task_id: str, status: str):
+        with self._lock:
+            if task_id not in self.completed:
+                self.completed[task_id] = (time.perf_counter() - self.submitted[task_id], status)
+
+
+class LoadTest:
+    def __init__(self, base_url: str, fixtures: List[Dict], mix: Dict[str, int],
+                 batch_files: int, recorder: Recorder):
+        self.base_url = base_url.rstrip('/')
+        self.fixtures = fixtures
+        self.actions = [name for name, weight in mix.items() for _ in range(weight)]
+        self.batch_files = batch_files
+        self.recorder = recorder
+        self.stop = threading.Event()
+
+    def _timed(self, endpoint: str, method: str, path: str, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            response = requests.request(method, self.base_url + path, timeout=REQUEST_TIMEOUT, **kwargs)
+        except requests.RequestException:
+            self.recorder.request(endpoint, time.perf_counter() - started_at, None)
+            return None
+        self.recorder.request(endpoint, time.perf_counter() - started_at, response.status_code)
+        return response
+
+    def _upload(self, endpoint: str, path: str, field: str, count: int):
+        chosen = [random.choice(self.fixtures) for _ in range(count)]
+        handles = [open(fixture['path'], 'rb') for fixture in chosen]
+        try:
+            files = [(field, (Path(f['path']).name, handle, 'application/octet-stream'))
+                     for f, handle in zip(chosen, handles)]
+            response = self._timed(endpoint, 'POST', path, files=files)
+        finally:
+            for handle in handles:
+                handle.close()
+        if response is not None and response.ok:
+            body = response.json()
+            task_ids = [t for t in body.get('task_ids', [body.get('task_id')]) if t]
+            self.recorder.submit(task_ids)
+
+    def user_loop(self):
+        while not self.stop.is_set():
+            action = random.choice(self.actions)
+            if action == 'process':
+                self._upload('/process', '/process', 'audio', 1)
+            elif action == 'batch':
+                self._upload('/batch_process', '/batch_process', 'files[]', self.batch_files)
+            elif action == 'status':
+                known = self.recorder.known_tasks()
+                if known:
+                    self._timed('/status/<id>', 'GET', f"/status/{random.choice(known)}")
+                else:
+                    self.stop.wait(0.1)
+            elif action == 'health':
+                self._timed('/health', 'GET', '/health')
+
+    def completion_loop(self, until: threading.Event):
+        """Bulk-poll outstanding tasks and record when each finishes"""
+        while not until.is_set():
+            pending = self.recorder.pending()
+            if pending:
+                try:
+                    response = requests.post(self.base_url + '/status', json={'task_ids': pending},
+                                             timeout=REQUEST_TIMEOUT)
+                    for task_id, state in response.json().get('tasks', {}).items():
+                        if state and state.get('status') in ('success', 'error'):
+                            self.recorder.complete(task_id, state['status'])
+                except (requests.RequestException, ValueError):
+                    pass
+            until.wait(STATUS_POLL_INTERVAL)
+
+
+def sample_process(pid: int) -> Optional[Dict]:
+    """Thread count and RSS (MB) of a process, via /proc or ps"""
+    status_path = Path(f"/proc/{pid}/status")
+    if status_path.exists():
+        fields = {}
+        for line in status_path.read_text().splitlines():
+            key, _, value = line.partition(':')
+            fields[key] = value.strip()
+        return {'threads': int(fields.get('Threads', 0)),
+                'rss_mb': int(fields.get('VmRSS', '0 kB').split()[0]) / 1024}
+    try:
+        rss = subprocess.run(['ps', '-o', 'rss=', '-p', str(pid)], capture_output=True, text=True).stdout
+        threads = subprocess.run(['ps', '-M', '-p', str(pid)], capture_output=True, text=True).stdout
+        return {'threads': max(0, len(threads.splitlines()) - 1), 'rss_mb': int(rss.strip() or 0) / 1024}
+    except (OSError, ValueError):
+        return None
+
+
+def start_server(port: int, api_url: str, scratch: Path, args) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        'PATH': str(FAKE_BIN) + os.pathsep + env.get('PATH', ''),
+        'VOICE_NOTES_PORT': str(port),
+        'VOICE_NOTES_API_URL': api_url,
+        'ELEVENLABS_API_KEY': 'sk_loadtest',
+        'VOICE_NOTES_BACKUP_ROOT': str(scratch / 'backup'),
+        'VOICE_NOTES_TASK_DB': str(scratch / 'tasks.db'),
+        'VOICE_NOTES_SYNC_TIMEOUT': str(args.sync_timeout),
+        'FAKE_OSASCRIPT_DELAY': str(args.osascript_delay),
+    })
+    if args.workers:
+        env['VOICE_NOTES_WORKERS'] = str(args.workers)
+    if args.max_queue:
+        env['VOICE_NOTES_MAX_QUEUE'] = str(args.max_queue)
+    log = open(scratch / 'server.log', 'w')
+    process = subprocess.Popen([sys.executable, str(PROJECT_ROOT / 'web_server.py')],
+                               env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"web_server.py exited early, see {scratch / 'server.log'}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=2)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("web_server.py did not start within 30s")
+
+
+def format_report(recorder: Recorder, samples: List[Dict], duration: float) -> str:
+    lines = [f"{'endpoint':<16}{'count':>7}{'rps':>7}{'err %':>7}{'503 %':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"]
+    lines.append('-' * len(lines[0]))
+    for endpoint, stats in sorted(recorder.requests.items()):
+        latencies = stats['latencies']
+        count = len(latencies)
+        lines.append(
+            f"{endpoint:<16}{count:>7}{count / duration:>7.1f}"
+            f"{stats['errors'] * 100 / count:>7.1f}{stats['rejected'] * 100 / count:>7.1f}"
+            f"{percentile(latencies, 0.50) * 1000:>9.0f}{percentile(latencies, 0.95) * 1000:>9.0f}"
+            f"{percentile(latencies, 0.99) * 1000:>9.0f}{max(latencies) * 1000:>9.0f}"
+        )
+
+    completions = [seconds for seconds, _ in recorder.completed.values()]
+    failed = sum(1 for _, status in recorder.completed.values() if status == 'error')
+    lines.append('')
+    lines.append(f"jobs: submitted {len(recorder.submitted)}, finished {len(completions)} "
+                 f"({failed} failed), unfinished {len(recorder.submitted) - len(completions)}")
+    if completions:
+        lines.append(f"job completion: p50 {percentile(completions, 0.5):.2f}s, "
+                     f"p95 {percentile(completions, 0.95):.2f}s, max {max(completions):.2f}s")
+
+    if samples:
+        first, last = samples[0], samples[-1]
+        lines.append(f"server threads: start {first['threads']}, end {last['threads']}, "
+                     f"max {max(s['threads'] for s in samples)}")
+        lines.append(f"server RSS MB: start {first['rss_mb']:.1f}, end {last['rss_mb']:.1f}, "
+                     f"max {max(s['rss_mb'] for s in samples):.1f}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent load test for web_server.py')
+    parser.add_argument('--users', type=int, default=8, help='Concurrent virtual users (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds of load (default: %(default)s)')
+    parser.add_argument('--drain', type=float, default=120, help='Seconds to wait for queued jobs afterwards (default: %(default)s)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Weighted actions (default: %(default)s)')
+    parser.add_argument('--batch-files', type=int, default=4, help='Files per /batch_process request (default: %(default)s)')
+    parser.add_argument('--formats', default='m4a', help='Fixture formats to upload (default: %(default)s)')
+    parser.add_argument('--server-url', help='Target an already running server instead of launching one')
+    parser.add_argument('--workers', type=int, help='VOICE_NOTES_WORKERS for the launched server')
+    parser.add_argument('--max-queue', type=int, help='VOICE_NOTES_MAX_QUEUE for the launched server')
+    parser.add_argument('--latency', type=float, default=0.5, help='Stub API base latency (default: %(default)s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Stub API 503 rate (default: %(default)s)')
+    parser.add_argument('--osascript-delay', type=float, default=0.05, help='Fake osascript latency (default: %(default)s)')
+    parser.add_argument('--sync-timeout', type=float, default=1.0, help='Notes sync wait cap for the launched server (default: %(default)s)')
+    parser.add_argument('--output', metavar='PATH', help='Write raw results as JSON')
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    formats = args.formats.split(',')
+    if not args.server_url and shutil.which('ffmpeg') is None:
+        print("Error: ffmpeg is required by the launched server (use --server-url to target another host)")
+        return 1
+    fixtures = generate(['short'], formats)
+
+    scratch = Path(tempfile.mkdtemp(prefix='vtn_load_'))
+    stub = None
+    server = None
+    try:
+        base_url = args.server_url
+        if not base_url:
+            stub = StubAPIServer(config=StubConfig(latency=args.latency, error_rate=args.error_rate)).start()
+            port = free_port()
+            server = start_server(port, stub.url, scratch, args)
+            base_url = f"http://127.0.0.1:{port}"
+
+        recorder = Recorder()
+        test = LoadTest(base_url, fixtures, mix, args.batch_files, recorder)
+        samples = []
+        sampling_done = threading.Event()
+
+        def sampler():
+            while not sampling_done.is_set():
+                if server is not None:
+                    sample = sample_process(server.pid)
+                    if sample:
+                        samples.append(dict(sample, at=time.time()))
+                sampling_done.wait(SAMPLE_INTERVAL)
+
+        completion_done = threading.Event()
+        background = [
+            threading.Thread(target=sampler, daemon=True),
+            threading.Thread(target=test.completion_loop, args=(completion_done,), daemon=True),
+        ]
+        for thread in background:
+            thread.start()
+
+        print(f"Load: {args.users} users for {args.duration:g}s against {base_url}")
+        users = [threading.Thread(target=test.user_loop, daemon=True) for _ in range(args.users)]
+        started_at = time.perf_counter()
+        for thread in users:
+            thread.start()
+        time.sleep(args.duration)
+        test.stop.set()
+        for thread in users:
+            thread.join()
+        duration = time.perf_counter() - started_at
+
+        print("Waiting for queued jobs to finish...")
+        drain_deadline = time.time() + args.drain
+        while recorder.pending() and time.time() < drain_deadline:
+            time.sleep(STATUS_POLL_INTERVAL)
+        completion_done.set()
+        sampling_done.set()
+
+        print()
+        print(format_report(recorder, samples, duration))
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'config': vars(args),
+                    'duration': duration,
+                    'requests': recorder.requests,
+                    'jobs': {task_id: {'seconds': seconds, 'status': status}
+                             for task_id, (seconds, status) in recorder.completed.items()},
+                    'unfinished': recorder.pending(),
+                    'samples': samples,
+                }, f, indent=2)
+        return 0
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if stub is not None:
+            stub.stop()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    exit(main())
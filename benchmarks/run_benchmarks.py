@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark runner
+Starts the stub transcription API, puts the fake osascript first on PATH and
+drives VoiceToNotesWorkflow.process_audio_files and
+ElevenLabsTranscriber.process_audio_file over the generated fixtures at
+several batch sizes. Each scenario runs in its own interpreter so peak RSS
+is per scenario. Reports throughput, p50/p95 per-file latency and peak RSS,
+and can save a run as a named baseline or compare against one.
+--compare-encodings instead encodes the fixture set with each upload
+encoding profile and reports bytes uploaded and encode time per profile
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+BENCH_DIR = Path(__file__).parent
+PROJECT_ROOT = BENCH_DIR.parent
+BASELINE_DIR = BENCH_DIR / 'baselines'
+FAKE_BIN = BENCH_DIR / 'bin'
+
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(PROJECT_ROOT / 'scripts' / 'python'))
+
+from streaming_upload import DEFAULT_ENCODING, ENCODING_PROFILES
+
+STUB_API_KEY = 'sk_benchmark'
+DEFAULT_BATCH_SIZES = (1, 5, 20)
+COMPARE_FIELDS = ('files_per_second', 'p50', 'p95', 'peak_rss_mb')
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def peak_rss_mb(who: int) -> float:
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    value = resource.getrusage(who).ru_maxrss
+    return value / (1024 * 1024) if sys.platform == 'darwin' else value / 1024
+
+
+def stage_inputs(fixtures: List[Dict], count: int, directory: Path) -> List[Dict]:
+    """Hardlink (or copy) fixtures into a scratch dir under unique names, cycling as needed"""
+    staged = []
+    for index in range(count):
+        fixture = fixtures[index % len(fixtures)]
+        source = Path(fixture['path'])
+        target = directory / f"{source.stem}_{index:03d}{source.suffix}"
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+        staged.append(dict(fixture, path=str(target)))
+    return staged
+
+
+# Child process: one scenario
+
+def run_workflow_scenario(spec: Dict, inputs: List[Dict], scratch: Path) -> Dict:
+    from voice_to_notes_workflow import VoiceToNotesWorkflow
+
+    finished_at = {}
+
+    def on_stage(audio_file, stage):
+        if stage in ('done', 'failed'):
+            finished_at[audio_file] = (time.perf_counter(), stage)
+
+    workflow = VoiceToNotesWorkflow(
+        STUB_API_KEY,
+        use_cache=False,
+        stream_upload=spec.get('stream', True),
+        client_options={'api_url': spec['api_url'], 'backoff_base': 0.05, 'backoff_max': 0.5},
+        notes_probe=lambda: True,
+        sync_timeout=spec.get('sync_timeout', 5),
+        on_stage=on_stage,
+        backup_root=str(scratch / 'backup'),
+        journal_dir=str(scratch / 'journal'),
+        encoding=spec.get('encoding')
+    )
+    started_at = time.perf_counter()
+    workflow.process_audio_files([item['path'] for item in inputs])
+    wall = time.perf_counter() - started_at
+
+    latencies = [at - started_at for at, stage in finished_at.values() if stage == 'done']
+    failed = len(inputs) - len(latencies)
+    return {'wall_seconds': wall, 'latencies': latencies, 'failed': failed}
+
+
+def run_transcriber_scenario(spec: Dict, inputs: List[Dict], scratch: Path) -> Dict:
+    from transcribe_audio import ElevenLabsTranscriber
+
+    transcriber = ElevenLabsTranscriber(
+        STUB_API_KEY,
+        use_cache=False,
+        client_options={'api_url': spec['api_url'], 'backoff_base': 0.05, 'backoff_max': 0.5},
+        encoding=spec.get('encoding')
+    )
+    latencies = []
+    failed = 0
+    started_at = time.perf_counter()
+    for item in inputs:
+        file_started = time.perf_counter()
+        try:
+            transcriber.process_audio_file(item['path'], str(scratch / 'out'), compress=spec.get('compress', True))
+            latencies.append(time.perf_counter() - file_started)
+        except Exception as e:
+            print(f"Failed: {item['path']}: {e}", file=sys.stderr)
+            failed += 1
+    return {'wall_seconds': time.perf_counter() - started_at, 'latencies': latencies, 'failed': failed}
+
+
+def run_child(spec: Dict) -> Dict:
+    from fixtures import generate
+    from metrics import UPLOAD_BYTES
+
+    fixtures = generate(spec['lengths'], spec['formats'])
+    scratch = Path(tempfile.mkdtemp(prefix='vtn_bench_'))
+    try:
+        inputs = stage_inputs(fixtures, spec['batch_size'], scratch)
+        runner = run_workflow_scenario if spec['scenario'] == 'workflow' else run_transcriber_scenario
+        outcome = runner(spec, inputs, scratch)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    latencies = outcome['latencies']
+    wall = outcome['wall_seconds']
+    audio_seconds = sum(item['seconds'] for item in inputs)
+    return {
+        'scenario': spec['scenario'],
+        'batch_size': spec['batch_size'],
+        'files': len(inputs),
+        'failed': outcome['failed'],
+        'wall_seconds': round(wall, 3),
+        'files_per_second': round(len(latencies) / wall, 4) if wall else 0.0,
+        'audio_x_realtime': round(audio_seconds / wall, 2) if wall else 0.0,
+        'p50': round(percentile(latencies, 0.50), 3),
+        'p95': round(percentile(latencies, 0.95), 3),
+        'input_bytes': sum(item['bytes'] for item in inputs),
+        'bytes_uploaded': int(UPLOAD_BYTES.value()),
+        'peak_rss_mb': round(peak_rss_mb(resource.RUSAGE_SELF), 1),
+        'children_peak_rss_mb': round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    }
+
+
+# Encoding profile comparison (no API involved)
+
+def compare_encodings(fixtures: List[Dict], profiles: List[str]) -> List[Dict]:
+    """Encode every fixture with each profile; what each would upload and how long encoding takes"""
+    from streaming_upload import ffmpeg_compress_command, get_encoding
+
+    audio_seconds = sum(fixture['seconds'] for fixture in fixtures)
+    rows = []
+    scratch = Path(tempfile.mkdtemp(prefix='vtn_encode_'))
+    try:
+        for name in profiles:
+            profile = get_encoding(name)
+            output = scratch / f"encoded.{profile['extension']}"
+            encoded_bytes = 0
+            encode_seconds = 0.0
+            failed = 0
+            for fixture in fixtures:
+                started_at = time.perf_counter()
+                result = subprocess.run(ffmpeg_compress_command(fixture['path'], str(output), profile=profile),
+                                        stdin=subprocess.DEVNULL, capture_output=True)
+                elapsed = time.perf_counter() - started_at
+                if result.returncode != 0:
+                    print(f"{name}: encoding {Path(fixture['path']).name} failed", file=sys.stderr)
+                    failed += 1
+                    continue
+                encoded_bytes += output.stat().st_size
+                encode_seconds += elapsed
+            rows.append({
+                'profile': name,
+                'mime_type': profile['mime_type'],
+                'files': len(fixtures),
+                'failed': failed,
+                'input_bytes': sum(fixture['bytes'] for fixture in fixtures),
+                'bytes_uploaded': encoded_bytes,
+                'kbps': round(encoded_bytes * 8 / audio_seconds / 1000, 1) if audio_seconds else 0.0,
+                'encode_seconds': round(encode_seconds, 3),
+                'encode_x_realtime': round(audio_seconds / encode_seconds, 1) if encode_seconds else 0.0,
+            })
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return rows
+
+
+def format_encoding_table(rows: List[Dict]) -> str:
+    header = (f"{'profile':<12}{'mime':<12}{'ok':>5}{'fail':>5}{'up KB':>10}{'vs first':>10}"
+              f"{'kbps':>8}{'encode s':>10}{'x rt':>8}")
+    lines = [header, '-' * len(header)]
+    reference = rows[0]['bytes_uploaded'] if rows else 0
+    for row in rows:
+        change = (row['bytes_uploaded'] - reference) / reference * 100 if reference else 0.0
+        lines.append(
+            f"{row['profile']:<12}{row['mime_type']:<12}{row['files'] - row['failed']:>5}{row['failed']:>5}"
+            f"{row['bytes_uploaded'] / 1024:>10.1f}{change:>+9.1f}%{row['kbps']:>8.1f}"
+            f"{row['encode_seconds']:>10.2f}{row['encode_x_realtime']:>8.1f}"
+        )
+    return '\n'.join(lines)
+
+
+# Parent process: orchestration and reporting
+
+def run_scenario(spec: Dict, env: Dict) -> Dict:
+    cmd = [sys.executable, str(Path(__file__).resolve()), '--child', json.dumps(spec)]
+    log = None if spec.get('verbose') else subprocess.DEVNULL
+    result = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=log, text=True)
+    if spec.get('verbose'):
+        sys.stdout.write(result.stdout)
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith('BENCH_RESULT '):
+            return json.loads(line[len('BENCH_RESULT '):])
+    raise RuntimeError(f"{spec['scenario']} x{spec['batch_size']} failed (exit {result.returncode})")
+
+
+def format_table(results: List[Dict], baseline: Dict = None) -> str:
+    header = (f"{'scenario':<12}{'batch':>6}{'ok':>5}{'fail':>5}{'wall s':>9}{'files/s':>9}"
+              f"{'x rt':>8}{'p50 s':>8}{'p95 s':>8}{'up MB':>8}{'rss MB':>8}")
+    lines = [header, '-' * len(header)]
+    for row in results:
+        lines.append(
+            f"{row['scenario']:<12}{row['batch_size']:>6}{row['files'] - row['failed']:>5}{row['failed']:>5}"
+            f"{row['wall_seconds']:>9.2f}{row['files_per_second']:>9.3f}{row['audio_x_realtime']:>8.1f}"
+            f"{row['p50']:>8.2f}{row['p95']:>8.2f}{row['bytes_uploaded'] / 1024 / 1024:>8.1f}"
+            f"{row['peak_rss_mb']:>8.1f}"
+        )
+        reference = (baseline or {}).get((row['scenario'], row['batch_size']))
+        if reference:
+            deltas = []
+            for field in COMPARE_FIELDS:
+                if reference.get(field):
+                    change = (row[field] - reference[field]) / reference[field] * 100
+                    deltas.append(f"{field} {change:+.1f}%")
+            lines.append(f"{'':<12}{'vs baseline:':>6} " + ', '.join(deltas))
+    return '\n'.join(lines)
+
+
+def load_baseline(name: str) -> Dict:
+    with open(BASELINE_DIR / f"{name}.json", 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {(row['scenario'], row['batch_size']): row for row in data['results']}
+
+
+def save_baseline(name: str, results: List[Dict], config: Dict):
+    BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(PROJECT_ROOT),
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    data = {
+        'name': name,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'config': config,
+        'results': results,
+    }
+    path = BASELINE_DIR / f"{name}.json"
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    print(f"Baseline saved: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks against a stub API and fake osascript')
+    parser.add_argument('--scenarios', default='workflow,transcriber',
+                        help='Comma-separated: workflow, transcriber (default: %(default)s)')
+    parser.add_argument('--batch-sizes', default=','.join(map(str, DEFAULT_BATCH_SIZES)),
+                        help='Comma-separated batch sizes (default: %(default)s)')
+    parser.add_argument('--lengths', default='short,medium', help='Fixture lengths to cycle through (default: %(default)s)')
+    parser.add_argument('--formats', default='wav,m4a,mp3,lowmp3', help='Fixture formats to cycle through (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.2, help='Stub API base latency in seconds (default: %(default)s)')
+    parser.add_argument('--latency-per-mb', type=float, default=0.05, help='Stub API latency per uploaded MB (default: %(default)s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of stub API requests answered 503 (default: %(default)s)')
+    parser.add_argument('--osascript-delay', type=float, default=0.05, help='Fake osascript latency per call (default: %(default)s)')
+    parser.add_argument('--no-stream', action='store_true', help='Workflow: compress to a temp file before uploading')
+    parser.add_argument('--encoding', default=DEFAULT_ENCODING,
+                        help='Upload encoding profile for the scenarios (default: %(default)s)')
+    parser.add_argument('--compare-encodings', nargs='?', const=','.join(ENCODING_PROFILES), metavar='PROFILES',
+                        help='Only encode the fixtures with each profile (default: all) and report '
+                             'bytes uploaded and encode time per profile')
+    parser.add_argument('--save-baseline', metavar='NAME', help='Save results as benchmarks/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='Compare against benchmarks/baselines/NAME.json')
+    parser.add_argument('--output', metavar='PATH', help='Also write raw results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='Show workflow output from each scenario')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_child(json.loads(args.child))
+        print('BENCH_RESULT ' + json.dumps(result))
+        return 0
+
+    if shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None:
+        print("Error: ffmpeg and ffprobe are required to generate fixtures and compress audio")
+        return 1
+
+    from fixtures import generate
+    from stub_api import StubAPIServer, StubConfig
+
+    lengths = args.lengths.split(',')
+    formats = args.formats.split(',')
+    print("Preparing fixtures...")
+    fixtures = generate(lengths, formats)
+
+    if args.compare_encodings:
+        profiles = args.compare_encodings.split(',')
+        for name in profiles + [args.encoding]:
+            if name not in ENCODING_PROFILES:
+                print(f"Error: unknown encoding profile '{name}' (choose from: {', '.join(ENCODING_PROFILES)})")
+                return 1
+        rows = compare_encodings(fixtures, profiles)
+        print()
+        print(format_encoding_table(rows))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'config': {'lengths': lengths, 'formats': formats}, 'encodings': rows}, f, indent=2)
+        return 0
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    config = {
+        'lengths': lengths, 'formats': formats,
+        'latency': args.latency, 'latency_per_mb': args.latency_per_mb,
+        'error_rate': args.error_rate, 'osascript_delay': args.osascript_delay,
+        'stream': not args.no_stream,
+        'encoding': args.encoding,
+    }
+
+    server = StubAPIServer(config=StubConfig(
+        latency=args.latency, latency_per_mb=args.latency_per_mb, error_rate=args.error_rate
+    )).start()
+    env = dict(os.environ)
+    env['PATH'] = str(FAKE_BIN) + os.pathsep + env.get('PATH', '')
+    env['FAKE_OSASCRIPT_DELAY'] = str(args.osascript_delay)
+
+    results = []
+    try:
+        for scenario in args.scenarios.split(','):
+            for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+                spec = dict(config, scenario=scenario, batch_size=batch_size,
+                            api_url=server.url, verbose=args.verbose)
+                print(f"Running {scenario} x{batch_size}...")
+                results.append(run_scenario(spec, env))
+    finally:
+        server.stop()
+
+    print()
+    print(format_table(results, baseline))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results, config)
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the ElevenLabs speech-to-text endpoint
+Accepts the same multipart uploads (including chunked transfer encoding),
+drains the body, waits a configurable latency and answers with a
+transcription-shaped JSON response. A configurable fraction of requests
+fail with a retryable status so retry/backoff paths get exercised too.
+GET /stats returns request and byte counters; POST /reset clears them
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+API_PATH = '/v1/speech-to-text'
+READ_SIZE = 64 * 1024
+FIELD_SCAN_BYTES = 64 * 1024  # form fields precede the file part, so only the start is inspected
+SAMPLE_TEXT = '今天下午三点和设计团队确认首页改版方案，记得把会议纪要发给产品经理。'
+
+
+class StubConfig:
+    def __init__(self, latency: float = 0.2, latency_per_mb: float = 0.05,
+                 error_rate: float = 0.0, error_status: int = 503, retry_after: str = '0',
+                 response_chars: int = 400, seed: int = None):
+        self.latency = latency
+        self.latency_per_mb = latency_per_mb
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.response_chars = response_chars
+        self.random = random.Random(seed)
+
+
+def build_response(chars: int, want_srt: bool) -> Dict:
+    """Transcription-shaped result with word timings (and SRT if requested)"""
+    text = (SAMPLE_TEXT * (chars // len(SAMPLE_TEXT) + 1))[:chars]
+    words = [
+        {'text': char, 'start': round(index * 0.25, 3), 'end': round(index * 0.25 + 0.2, 3), 'type': 'word'}
+        for index, char in enumerate(text)
+    ]
+    result = {'language_code': 'zho', 'language_probability': 0.99, 'text': text, 'words': words}
+    if want_srt:
+        cues = []
+        for cue, start in enumerate(range(0, len(text), 20), 1):
+            begin, end = start * 0.25, min(len(text), start + 20) * 0.25
+            cues.append(f"{cue}\n{_srt_time(begin)} --> {_srt_time(end)}\n{text[start:start + 20]}")
+        result['additional_formats'] = [{
+            'requested_format': 'srt', 'file_extension': 'srt',
+            'content_type': 'text/srt', 'is_base64_encoded': False,
+            'content': '\n\n'.join(cues) + '\n'
+        }]
+    return result
+
+
+def _srt_time(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+class StubAPIServer:
+    """Threaded stub server; port=0 picks a free port"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, config: StubConfig = None):
+        self.config = config or StubConfig()
+        self._lock = threading.Lock()
+        self.reset()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{API_PATH}"
+
+    def reset(self):
+        with self._lock:
+            self.counters = {'requests': 0, 'errors': 0, 'bytes_received': 0, 'status': {}}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return json.loads(json.dumps(self.counters))
+
+    def _count(self, status: int, received: int):
+        with self._lock:
+            self.counters['requests'] += 1
+            self.counters['bytes_received'] += received
+            if status != 200:
+                self.counters['errors'] += 1
+            key = str(status)
+            self.counters['status'][key] = self.counters['status'].get(key, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='stub-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict, headers: Dict = None):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _drain_body(self):
+                """Read the whole request body; returns (bytes read, leading bytes)"""
+                head = b''
+                total = 0
+                if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                    while True:
+                        size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                        if size == 0:
+                            # Trailer section ends with an empty line
+                            while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                                pass
+                            break
+                        remaining = size
+                        while remaining:
+                            data = self.rfile.read(min(READ_SIZE, remaining))
+                            if not data:
+                                return total, head
+                            remaining -= len(data)
+                            total += len(data)
+                            if len(head) < FIELD_SCAN_BYTES:
+                                head += data[:FIELD_SCAN_BYTES - len(head)]
+                        self.rfile.readline()
+                else:
+                    remaining = int(self.headers.get('Content-Length') or 0)
+                    while remaining:
+                        data = self.rfile.read(min(READ_SIZE, remaining))
+                        if not data:
+                            break
+                        remaining -= len(data)
+                        total += len(data)
+                        if len(head) < FIELD_SCAN_BYTES:
+                            head += data[:FIELD_SCAN_BYTES - len(head)]
+                return total, head
+
+            def do_GET(self):
+                if self.path == '/stats':
+                    self._send_json(200, server.stats())
+                else:
+                    self._send_json(404, {'detail': 'not found'})
+
+            def do_POST(self):
+                if self.path == '/reset':
+                    self._drain_body()
+                    server.reset()
+                    self._send_json(200, {'ok': True})
+                    return
+                if self.path != API_PATH:
+                    self._drain_body()
+                    self._send_json(404, {'detail': 'not found'})
+                    return
+
+                started_at = time.perf_counter()
+                received, head = self._drain_body()
+                config = server.config
+                if not self.headers.get('xi-api-key'):
+                    server._count(401, received)
+                    self._send_json(401, {'detail': 'missing api key'})
+                    return
+                if config.error_rate and config.random.random() < config.error_rate:
+                    server._count(config.error_status, received)
+                    self._send_json(config.error_status, {'detail': 'stub failure'},
+                                    {'Retry-After': config.retry_after})
+                    return
+
+                delay = config.latency + config.latency_per_mb * received / (1024 * 1024)
+                remaining = delay - (time.perf_counter() - started_at)
+                if remaining > 0:
+                    time.sleep(remaining)
+                want_srt = b'name="additional_formats"' in head
+                server._count(200, received)
+                self._send_json(200, build_response(config.response_chars, want_srt))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub speech-to-text API for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2, help='Base response latency in seconds')
+    parser.add_argument('--latency-per-mb', type=float, default=0.05, help='Extra latency per MB uploaded')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--response-chars', type=int, default=400, help='Length of the returned transcript text')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = StubAPIServer(args.host, args.port, StubConfig(
+        latency=args.latency, latency_per_mb=args.latency_per_mb,
+        error_rate=args.error_rate, error_status=args.error_status,
+        response_chars=args.response_chars, seed=args.seed
+    ))
+    print(f"Stub API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
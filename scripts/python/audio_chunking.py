@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Silence-aware chunking for long recordings
+Finds silences with ffmpeg's silencedetect filter, plans chunk boundaries at
+the silence nearest each target cut point, and stitches per-chunk
+transcription results (text, word timestamps, SRT cues) back together with
+global time offsets
+"""
+
+import re
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+CHUNK_SECONDS = 600.0  # target chunk length
+CHUNK_WORKERS = 4  # chunks transcribed concurrently
+CHUNK_SEARCH_WINDOW = 90.0  # look this far either side of a target cut for a silence
+SILENCE_NOISE_DB = -30  # below this level counts as silence
+SILENCE_MIN_DURATION = 0.5  # seconds of silence needed to count as a gap
+
+_SILENCE_START = re.compile(r'silence_start:\s*(-?[\d.]+)')
+_SILENCE_END = re.compile(r'silence_end:\s*([\d.]+)')
+_SRT_TIMING = re.compile(
+    r'(\d+):(\d{2}):(\d{2})[,.](\d{3})\s*-->\s*(\d+):(\d{2}):(\d{2})[,.](\d{3})(.*)'
+)
+_CJK = re.compile(r'[　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯]')
+
+
+def probe_duration(audio_path: str) -> Optional[float]:
+    """Duration in seconds via ffprobe, or None if it cannot be determined"""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        audio_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        return float(result.stdout.strip())
+    except (OSError, ValueError):
+        return None
+
+
+def detect_silences(audio_path: str, noise_db: float = SILENCE_NOISE_DB,
+                    min_duration: float = SILENCE_MIN_DURATION) -> List[Tuple[float, float]]:
+    """(start, end) of every silence ffmpeg's silencedetect reports"""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostats',
+        '-i', audio_path,
+        '-vn',
+        '-af', f'silencedetect=noise={noise_db}dB:d={min_duration}',
+        '-f', 'null', '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"silencedetect failed: {result.stderr[-500:]}")
+
+    silences = []
+    start = None
+    for line in result.stderr.splitlines():
+        match = _SILENCE_START.search(line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = _SILENCE_END.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    return silences
+
+
+def plan_chunks(duration: float, silences: List[Tuple[float, float]],
+                chunk_seconds: float = CHUNK_SECONDS,
+                window: float = CHUNK_SEARCH_WINDOW) -> List[Tuple[float, float]]:
+    """
+    Split [0, duration] into (start, end) chunks of roughly chunk_seconds,
+    cutting in the middle of the silence closest to each target point.
+    Falls back to a hard cut when no silence is within the window
+    """
+    midpoints = [(start + end) / 2 for start, end in silences]
+    chunks = []
+    cursor = 0.0
+    # Don't leave a tiny tail chunk: only cut while more than 1.5 chunks remain
+    while duration - cursor > chunk_seconds * 1.5:
+        target = cursor + chunk_seconds
+        candidates = [
+            point for point in midpoints
+            if abs(point - target) <= window and point > cursor + chunk_seconds / 2
+        ]
+        cut = min(candidates, key=lambda point: abs(point - target)) if candidates else target
+        chunks.append((cursor, cut))
+        cursor = cut
+    chunks.append((cursor, duration))
+    return chunks
+
+
+def _format_srt_time(seconds: float) -> str:
+    millis = max(0, int(round(seconds * 1000)))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def _srt_seconds(hours: str, minutes: str, secs: str, millis: str) -> float:
+    return int(hours) * 3600 + int(minutes) * 60 + int(secs) + int(millis) / 1000
+
+
+def shift_srt(content: str, offset: float, first_index: int = 1) -> Tuple[List[str], int]:
+    """
+    Parse SRT cues, shift their timings by offset and renumber them from
+    first_index. Returns the rewritten cue blocks and the next free index
+    """
+    blocks = []
+    index = first_index
+    for block in re.split(r'\r?\n\s*\r?\n', content.strip()):
+        lines = block.strip().splitlines()
+        timing_line = next((i for i, line in enumerate(lines) if _SRT_TIMING.search(line)), None)
+        if timing_line is None:
+            continue
+        match = _SRT_TIMING.search(lines[timing_line])
+        start = _srt_seconds(*match.group(1, 2, 3, 4)) + offset
+        end = _srt_seconds(*match.group(5, 6, 7, 8)) + offset
+        text_lines = lines[timing_line + 1:]
+        blocks.append('\n'.join(
+            [str(index), f"{_format_srt_time(start)} --> {_format_srt_time(end)}{match.group(9)}"]
+            + text_lines
+        ))
+        index += 1
+    return blocks, index
+
+
+def _join_text(left: str, right: str) -> str:
+    left = left.rstrip()
+    right = right.lstrip()
+    if not left or not right:
+        return left + right
+    # CJK text has no spaces between words
+    if _CJK.match(left[-1]) or _CJK.match(right[0]):
+        return left + right
+    return left + ' ' + right
+
+
+def stitch_results(results: List[Dict], offsets: List[float]) -> Dict:
+    """
+    Merge per-chunk API results into one result shaped like a single-shot
+    response: joined text, words shifted to global time, one renumbered SRT.
+    Speaker ids are left as each chunk returned them and do not match across
+    chunks, so only stitch results requested without diarization
+    """
+    stitched = {key: value for key, value in results[0].items()
+                if key not in ('text', 'words', 'additional_formats')}
+
+    text = ''
+    words = []
+    srt_blocks = []
+    next_index = 1
+    srt_format = None
+
+    for result, offset in zip(results, offsets):
+        text = _join_text(text, result.get('text', ''))
+
+        for word in result.get('words', []) or []:
+            shifted = dict(word)
+            for key in ('start', 'end'):
+                if isinstance(shifted.get(key), (int, float)):
+                    shifted[key] = round(shifted[key] + offset, 3)
+            words.append(shifted)
+
+        formats = result.get('additional_formats') or []
+        if formats:
+            if srt_format is None:
+                srt_format = dict(formats[0])
+            blocks, next_index = shift_srt(formats[0].get('content', ''), offset, next_index)
+            srt_blocks.extend(blocks)
+
+    stitched['text'] = text
+    stitched['words'] = words
+    if srt_format is not None:
+        srt_format['content'] = '\n\n'.join(srt_blocks) + ('\n' if srt_blocks else '')
+        stitched['additional_formats'] = [srt_format]
+    return stitched
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Single-pass recording metadata for audio inputs
+Each file is stat'ed once and its container header is read for the
+recorder's embedded creation time (MP4/M4A/MOV mvhd, WAV bext or LIST/INFO
+ICRD) without decoding any audio. The result feeds both date grouping and
+ordering within a date
+"""
+
+import os
+import re
+import struct
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+# Dates in file names: YYYYMMDD, YYYY-MM-DD or YYYY_MM_DD, optionally
+# followed by a time (HHMMSS, HH-MM-SS, HH.MM.SS, ...). Not preceded by a
+# digit, so upload prefixes like "1752651025123_" are not mistaken for dates
+FILENAME_DATETIME = re.compile(
+    r'(?<!\d)(\d{4})([-_]?)(\d{2})\2(\d{2})'
+    r'(?:[ _T-]?(\d{2})([-_.]?)(\d{2})\6(\d{2}))?'
+)
+
+MP4_EXTENSIONS = {'.m4a', '.mp4', '.mov', '.3gp', '.aac'}
+WAV_EXTENSIONS = {'.wav'}
+
+# Seconds between the MP4 epoch (1904-01-01 UTC) and the Unix epoch
+MP4_EPOCH_OFFSET = 2082844800
+
+# Only boxes/chunks are walked, never payloads; cap the walk on odd files
+MAX_HEADER_ENTRIES = 256
+
+
+def _valid_datetime(*parts: int) -> Optional[datetime]:
+    try:
+        value = datetime(*parts)
+    except ValueError:
+        return None
+    return value if 2000 <= value.year <= 2100 else None
+
+
+def parse_filename_datetime(name: str) -> Tuple[Optional[datetime], bool]:
+    """
+    First plausible date in a file name, and whether it carried a time of day
+    """
+    for match in FILENAME_DATETIME.finditer(name):
+        year, _, month, day, hour, _, minute, second = match.groups()
+        date = _valid_datetime(int(year), int(month), int(day))
+        if date is None:
+            continue
+        if hour is not None:
+            with_time = _valid_datetime(date.year, date.month, date.day, int(hour), int(minute), int(second))
+            if with_time is not None:
+                return with_time, True
+        return date, False
+    return None, False
+
+
+def _read_box_header(f, end: int) -> Optional[Tuple[bytes, int, int]]:
+    """(type, payload start, box end) of the MP4 box at the current offset"""
+    start = f.tell()
+    if start + 8 > end:
+        return None
+    header = f.read(8)
+    if len(header) < 8:
+        return None
+    size, box_type = struct.unpack('>I4s', header)
+    payload = start + 8
+    if size == 1:
+        large = f.read(8)
+        if len(large) < 8:
+            return None
+        size = struct.unpack('>Q', large)[0]
+        payload += 8
+    elif size == 0:
+        size = end - start
+    if size < payload - start:
+        return None
+    return box_type, payload, min(start + size, end)
+
+
+def mp4_creation_time(f, file_size: int) -> Optional[datetime]:
+    """moov/mvhd creation_time; moov may sit after mdat, which is skipped by seeking"""
+    f.seek(0)
+    end = file_size
+    in_moov = False
+    for _ in range(MAX_HEADER_ENTRIES):
+        box = _read_box_header(f, end)
+        if box is None:
+            return None
+        box_type, payload, box_end = box
+        if box_type == b'moov' and not in_moov:
+            in_moov = True
+            end = box_end
+            f.seek(payload)
+            continue
+        if box_type == b'mvhd' and in_moov:
+            f.seek(payload)
+            version = f.read(4)[:1]
+            if version == b'\x01':
+                raw = f.read(8)
+                seconds = struct.unpack('>Q', raw)[0] if len(raw) == 8 else 0
+            else:
+                raw = f.read(4)
+                seconds = struct.unpack('>I', raw)[0] if len(raw) == 4 else 0
+            if seconds <= MP4_EPOCH_OFFSET:
+                # 0 means "not set"; anything before 1970 is bogus too
+                return None
+            try:
+                utc = datetime.fromtimestamp(seconds - MP4_EPOCH_OFFSET, timezone.utc)
+            except (OverflowError, OSError, ValueError):
+                return None
+            local = utc.astimezone().replace(tzinfo=None)
+            return local if 2000 <= local.year <= 2100 else None
+        f.seek(box_end)
+    return None
+
+
+def _parse_wav_datetime(date_text: str, time_text: str = '') -> Optional[datetime]:
+    digits = re.findall(r'\d+', f"{date_text} {time_text}")
+    if len(digits) < 3 or len(digits[0]) != 4:
+        return None
+    parts = [int(d) for d in digits[:6]]
+    return _valid_datetime(*parts) if len(parts) == 6 else _valid_datetime(*parts[:3])
+
+
+def wav_creation_time(f, file_size: int) -> Optional[datetime]:
+    """bext OriginationDate/Time, else LIST/INFO ICRD; the data chunk is skipped by seeking"""
+    f.seek(0)
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return None
+    recorded = None
+    offset = 12
+    for _ in range(MAX_HEADER_ENTRIES):
+        if offset + 8 > file_size:
+            break
+        f.seek(offset)
+        chunk_id, size = struct.unpack('<4sI', f.read(8))
+        if chunk_id == b'bext' and size >= 338:
+            body = f.read(338)
+            value = _parse_wav_datetime(body[320:330].decode('ascii', 'ignore'),
+                                        body[330:338].decode('ascii', 'ignore'))
+            if value is not None:
+                return value
+        elif chunk_id == b'LIST' and recorded is None and size >= 4:
+            body = f.read(min(size, 64 * 1024))
+            if body[:4] == b'INFO':
+                pos = 4
+                while pos + 8 <= len(body):
+                    sub_id, sub_size = struct.unpack('<4sI', body[pos:pos + 8])
+                    if sub_id == b'ICRD':
+                        text = body[pos + 8:pos + 8 + sub_size].split(b'\0')[0]
+                        recorded = _parse_wav_datetime(text.decode('ascii', 'ignore'))
+                        break
+                    pos += 8 + sub_size + (sub_size & 1)
+        offset += 8 + size + (size & 1)
+    return recorded
+
+
+def container_creation_time(path: str, file_size: int) -> Optional[datetime]:
+    """Recorder creation time from the container header, or None"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in MP4_EXTENSIONS:
+        reader = mp4_creation_time
+    elif extension in WAV_EXTENSIONS:
+        reader = wav_creation_time
+    else:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return reader(f, file_size)
+    except (OSError, struct.error):
+        return None
+
+
+def scan(path: str) -> Dict:
+    """
+    Stat a file once and work out when it was recorded:
+      date        grouping date; a date in the file name wins, as before
+      recorded_at ordering time: file name date+time, container creation
+                  time, file birth time, then modification time
+      source      which of those recorded_at came from
+    Raises OSError if the file can't be stat'ed
+    """
+    stat = os.stat(path)
+    name_time, name_has_time = parse_filename_datetime(os.path.splitext(os.path.basename(path))[0])
+    container_time = container_creation_time(path, stat.st_size)
+
+    if name_time is not None and name_has_time:
+        recorded_at, source = name_time, 'filename'
+    elif container_time is not None:
+        recorded_at, source = container_time, 'container'
+    elif hasattr(stat, 'st_birthtime'):
+        recorded_at, source = datetime.fromtimestamp(stat.st_birthtime), 'birthtime'
+    else:
+        recorded_at, source = datetime.fromtimestamp(stat.st_mtime), 'mtime'
+
+    return {
+        'path': path,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'date': name_time if name_time is not None else recorded_at,
+        'recorded_at': recorded_at,
+        'source': source,
+    }
+
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+ffprobe-based inspection of audio inputs
+Lets the pipeline pass files that already match the compression target
+straight to the upload instead of re-encoding them
+"""
+
+import json
+import subprocess
+from typing import Dict, Optional
+
+from streaming_upload import get_encoding
+
+# Encoders don't hit the nominal bitrate exactly
+BITRATE_TOLERANCE = 1.1
+
+
+def probe_audio(audio_path: str) -> Optional[Dict]:
+    """
+    Codec, container, bitrate, sample rate and channel count of the first
+    audio stream, or None if ffprobe is unavailable or the file unreadable
+    """
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name,sample_rate,channels,bit_rate:format=format_name,bit_rate',
+        '-of', 'json',
+        audio_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        info = json.loads(result.stdout or '{}')
+    except (OSError, ValueError):
+        return None
+
+    streams = info.get('streams') or []
+    if result.returncode != 0 or not streams:
+        return None
+
+    stream = streams[0]
+    container = info.get('format') or {}
+
+    def as_int(value) -> Optional[int]:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        'codec': stream.get('codec_name'),
+        'container': container.get('format_name'),
+        'bitrate': as_int(stream.get('bit_rate')) or as_int(container.get('bit_rate')),
+        'sample_rate': as_int(stream.get('sample_rate')),
+        'channels': as_int(stream.get('channels')),
+    }
+
+
+def is_upload_ready(info: Optional[Dict], profile: Dict = None) -> bool:
+    """
+    True when the probed audio is already at or below the encoding profile's
+    target (default MP3; same codec, container and channel count, no
+    higher sample rate or bitrate), so re-encoding would only cost time
+    """
+    if not info:
+        return False
+    profile = profile or get_encoding()
+    return (
+        info['codec'] == profile['codec']
+        and info['container'] == profile['container']
+        and info['channels'] == profile['channels']
+        and info['sample_rate'] is not None and info['sample_rate'] <= profile['sample_rate']
+        and info['bitrate'] is not None and info['bitrate'] <= profile['bitrate'] * BITRATE_TOLERANCE
+    )
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+按内容去重的音频备份存储
+每段录音的数据只在 .blobs/ 下按SHA-256保存一份，日期目录（YYYY/MM/DD）中的文件是指向它的硬链接；
+SQLite索引记录每个日期目录中已使用的文件名和对应的内容哈希，
+分配不重名的文件名只需要查询索引，不必逐个stat
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Tuple
+
+from disk_cache import file_sha256
+from file_transfer import copy_file
+
+BLOB_DIR = '.blobs'
+INDEX_FILE = '.backup_index.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256      TEXT PRIMARY KEY,
+    path        TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS names (
+    dir         TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    sha256      TEXT,
+    created_at  REAL NOT NULL,
+    PRIMARY KEY (dir, name)
+);
+CREATE TABLE IF NOT EXISTS name_counters (
+    dir         TEXT NOT NULL,
+    stem        TEXT NOT NULL,
+    suffix      TEXT NOT NULL,
+    next        INTEGER NOT NULL,
+    PRIMARY KEY (dir, stem, suffix)
+);
+CREATE TABLE IF NOT EXISTS scanned_dirs (
+    dir         TEXT PRIMARY KEY
+);
+'''
+
+
+class BackupStore:
+    """
+    store() 把音频保存到日期目录并返回使用的文件名。
+    每次备份都分配一个新的文件名（笔记条目按文件名区分，同一笔记中不能出现两个同名条目）；
+    已有相同内容时（无论哪个日期）只新建指向同一blob的硬链接，不再写入数据。
+    引入索引之前已存在的备份文件在第一次写入该目录时登记（只占用文件名，不参与去重）
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.blob_dir = self.root / BLOB_DIR
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / INDEX_FILE), check_same_thread=False,
+                                     isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _relative_dir(self, backup_dir: str) -> str:
+        return Path(backup_dir).resolve().relative_to(self.root.resolve()).as_posix()
+
+    def _ensure_scanned(self, rel_dir: str):
+        """登记目录中索引之外已存在的文件（每个目录只扫描一次），调用方需已开启事务"""
+        if self._conn.execute('SELECT 1 FROM scanned_dirs WHERE dir = ?', (rel_dir,)).fetchone():
+            return
+        now = time.time()
+        try:
+            existing = [entry.name for entry in os.scandir(self.root / rel_dir) if entry.is_file()]
+        except FileNotFoundError:
+            existing = []
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO names (dir, name, sha256, created_at) VALUES (?, ?, NULL, ?)',
+            [(rel_dir, name, now) for name in existing]
+        )
+        self._conn.execute('INSERT INTO scanned_dirs (dir) VALUES (?)', (rel_dir,))
+
+    def _taken(self, rel_dir: str, name: str) -> bool:
+        return self._conn.execute(
+            'SELECT 1 FROM names WHERE dir = ? AND name = ?', (rel_dir, name)
+        ).fetchone() is not None
+
+    def _allocate(self, rel_dir: str, filename: str) -> str:
+        """不重名的文件名：原名，已占用时为 stem_(n)suffix，n 从计数器继续，调用方需已开启事务"""
+        if not self._taken(rel_dir, filename):
+            return filename
+        stem, suffix = os.path.splitext(filename)
+        row = self._conn.execute(
+            'SELECT next FROM name_counters WHERE dir = ? AND stem = ? AND suffix = ?',
+            (rel_dir, stem, suffix)
+        ).fetchone()
+        counter = row[0] if row else 1
+        while self._taken(rel_dir, f"{stem}_({counter}){suffix}"):
+            counter += 1
+        self._conn.execute(
+            '''INSERT INTO name_counters (dir, stem, suffix, next) VALUES (?, ?, ?, ?)
+               ON CONFLICT(dir, stem, suffix) DO UPDATE SET next = excluded.next''',
+            (rel_dir, stem, suffix, counter + 1)
+        )
+        return f"{stem}_({counter}){suffix}"
+
+    def _reserve(self, rel_dir: str, filename: str, sha256: str) -> str:
+        """在同一个写事务中分配并占用文件名"""
+        with self._lock:
+            # BEGIN IMMEDIATE 让多个工作流实例（各自的连接）分配文件名时也互斥
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._ensure_scanned(rel_dir)
+                name = self._allocate(rel_dir, filename)
+                self._conn.execute(
+                    'INSERT INTO names (dir, name, sha256, created_at) VALUES (?, ?, ?, ?)',
+                    (rel_dir, name, sha256, time.time())
+                )
+                self._conn.execute('COMMIT')
+                return name
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def _release(self, rel_dir: str, name: str, keep: bool = False):
+        """写入失败时释放文件名；keep=True 表示文件名被索引之外的文件占用，保留占位"""
+        with self._lock:
+            if keep:
+                self._conn.execute('UPDATE names SET sha256 = NULL WHERE dir = ? AND name = ?', (rel_dir, name))
+            else:
+                self._conn.execute('DELETE FROM names WHERE dir = ? AND name = ?', (rel_dir, name))
+
+    def _blob_path(self, sha256: str, filename: str) -> Path:
+        return self.blob_dir / sha256[:2] / (sha256 + os.path.splitext(filename)[1].lower())
+
+    def _ensure_blob(self, audio_file: str, sha256: str, filename: str,
+                     transfer: Callable[[str, str], str]) -> Tuple[Path, str]:
+        """返回内容对应的blob路径，以及写入方式（已存在时为 'link'，只新建硬链接）"""
+        with self._lock:
+            row = self._conn.execute('SELECT path FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        if row and (self.root / row[0]).exists():
+            return self.root / row[0], 'link'
+
+        blob_path = self._blob_path(sha256, filename)
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = blob_path.with_name(f".{blob_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            method = transfer(audio_file, str(tmp_path))
+            os.replace(tmp_path, blob_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        with self._lock:
+            self._conn.execute(
+                '''INSERT INTO blobs (sha256, path, size, created_at) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(sha256) DO UPDATE SET path = excluded.path''',
+                (sha256, blob_path.relative_to(self.root).as_posix(), blob_path.stat().st_size, time.time())
+            )
+        return blob_path, method
+
+    def store(self, audio_file: str, backup_dir: str, filename: str,
+              transfer: Callable[[str, str], str] = copy_file) -> Tuple[str, str]:
+        """
+        把 audio_file 以 filename（重名时自动加计数器）备份到 backup_dir，
+        transfer(src, dst) 负责把数据写入blob（复制或移动）。
+        返回 (使用的文件名, 写入方式)：'link' 表示已有相同内容的备份（同一天重复提交时也是如此），
+        只新建了硬链接
+        """
+        sha256 = file_sha256(audio_file)
+        rel_dir = self._relative_dir(backup_dir)
+        method = None
+        while True:
+            name = self._reserve(rel_dir, filename, sha256)
+            target = self.root / rel_dir / name
+            try:
+                blob_path, step = self._ensure_blob(audio_file, sha256, filename, transfer)
+                # 换文件名重试时blob已经写好，报告第一次写入的方式
+                method = method or step
+                try:
+                    os.link(blob_path, target)
+                except FileExistsError:
+                    raise
+                except OSError:
+                    # 文件系统不支持硬链接（如exFAT），退回复制
+                    copy_file(str(blob_path), str(target))
+                return name, method
+            except FileExistsError:
+                # 索引登记之后有文件被放进了目录，占位后换一个文件名
+                self._release(rel_dir, name, keep=True)
+            except Exception:
+                self._release(rel_dir, name)
+                raise
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+批处理阶段日志（预写日志）
+每批文件对应一个追加写入的JSON Lines文件，每个文件完成一个阶段（压缩、转录、备份、写入笔记）
+就写入一条记录并fsync。进程中断后用同样的文件重新运行，已完成的阶段直接使用记录中的结果：
+已付费的转录不会重新上传，已备份的录音不会再备份，已写入的笔记条目不会重复写入。
+整批文件都写入笔记后删除日志
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+JOURNAL_DIR = PROJECT_ROOT / 'temp' / 'journal'
+JOURNAL_MAX_AGE = 7 * 24 * 3600  # 超过7天没有更新的日志视为放弃的批次，打开新日志时清理
+
+# 按处理顺序排列的阶段，记录中带有该阶段的输出
+STAGES = ('compressed', 'transcribed', 'backed_up')
+# 写入笔记的状态：调用osascript之前记下意图，之后记下结果；
+# 只有意图没有结果说明进程在写入途中退出，条目可能已经写入
+NOTES_STAGES = ('appending', 'appended', 'append_failed')
+
+
+def batch_id(audio_files: Iterable[str]) -> str:
+    """同一组文件（与顺序无关）对应同一个批次"""
+    paths = sorted(os.path.abspath(f) for f in audio_files)
+    return hashlib.sha256('\n'.join(paths).encode('utf-8')).hexdigest()[:32]
+
+
+def _key(audio_file: str) -> str:
+    """记录按绝对路径区分文件，用相对路径重新运行同一批次时也能找到"""
+    return os.path.abspath(audio_file)
+
+
+def fingerprint(path: str) -> Optional[List[int]]:
+    """文件的 [大小, 修改时间]，文件不存在时为None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class BatchJournal:
+    """
+    一个批次的阶段日志。state(audio_file) 返回该文件已完成的阶段 {阶段: 记录}，
+    其中 'notes' 为最近一次写入笔记的状态（NOTES_STAGES之一）
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._states = {}
+        self.resumed = self.path.exists()
+        if self.resumed:
+            self._load()
+
+    @classmethod
+    def open(cls, audio_files: Iterable[str], directory: Path = JOURNAL_DIR) -> 'BatchJournal':
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        prune(directory)
+        return cls(directory / f"{batch_id(audio_files)}.jsonl")
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 最后一行可能在写入途中被截断
+                    continue
+                self._apply(record)
+        # 原始文件在中断后被替换成了别的内容，之前的记录不再适用
+        for audio_file, state in list(self._states.items()):
+            current = fingerprint(audio_file)
+            if current is not None and current != state.get('fingerprint'):
+                del self._states[audio_file]
+
+    def _apply(self, record: Dict):
+        audio_file = record.pop('file', None)
+        stage = record.pop('stage', None)
+        if audio_file is None or stage is None:
+            return
+        state = self._states.setdefault(_key(audio_file), {})
+        if 'fingerprint' in record:
+            state.setdefault('fingerprint', record.pop('fingerprint'))
+        if stage in NOTES_STAGES:
+            state['notes'] = stage
+        else:
+            state[stage] = record
+
+    def state(self, audio_file: str) -> Dict:
+        with self._lock:
+            return dict(self._states.get(_key(audio_file), {}))
+
+    def record(self, audio_file: str, stage: str, **data):
+        """记录一个文件完成了某个阶段，返回前已写入磁盘"""
+        self.record_many([(audio_file, stage, data)])
+
+    def record_many(self, records: List[Tuple[str, str, Dict]]):
+        """一次写入多条记录，只fsync一次"""
+        if not records:
+            return
+        lines = []
+        with self._lock:
+            for audio_file, stage, data in records:
+                audio_file = _key(audio_file)
+                record = dict(data, file=audio_file, stage=stage)
+                if audio_file not in self._states:
+                    # 第一条记录带上原始文件指纹，重新运行时用来确认是同一个文件
+                    record['fingerprint'] = fingerprint(audio_file)
+                lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+                self._apply(dict(record))
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def complete(self, audio_files: Iterable[str]) -> bool:
+        """所有文件都已写入笔记时删除日志，返回是否已删除"""
+        with self._lock:
+            if any(self._states.get(_key(f), {}).get('notes') != 'appended' for f in audio_files):
+                return False
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self._states.clear()
+            return True
+
+
+def prune(directory: Path = JOURNAL_DIR, max_age: float = JOURNAL_MAX_AGE) -> int:
+    """删除长时间没有更新的日志，返回删除的数量"""
+    removed = 0
+    cutoff = time.time() - max_age
+    for path in Path(directory).glob('*.jsonl'):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def backed_up_files(audio_files: Iterable[str], directory: Path = JOURNAL_DIR) -> List[str]:
+    """日志中已经完成备份的文件（原始文件可能已被移入备份目录，重新运行时不再需要）"""
+    path = Path(directory) / f"{batch_id(audio_files)}.jsonl"
+    if not path.exists():
+        return []
+    journal = BatchJournal(path)
+    return [f for f in audio_files if 'backed_up' in journal.state(f)]
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+分块断点续传上传
+大文件按块上传，每块到达后直接追加写入磁盘；已接收的字节数就是分块文件的大小，
+客户端断线后查询偏移量即可从断点继续，服务器重启后也能继续
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from pathlib import Path
+from typing import Dict
+
+COPY_BUFFER_SIZE = 1024 * 1024  # 写入磁盘时每次读取的字节数
+MAX_CHUNK_SIZE = 32 * 1024 * 1024  # 单个分块的上限
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024  # init时声明的文件大小上限
+UPLOAD_EXPIRE_SECONDS = 24 * 3600  # 超过这个时间未完成（或提交后未被处理）的上传会被清理
+
+
+class UploadError(Exception):
+    """上传请求无效，status_code 为应返回的HTTP状态码"""
+
+    def __init__(self, message: str, status_code: int = 400, offset: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class ChunkedUploadStore:
+    """
+    每个上传对应两个文件：<id>.part（已接收的数据）和 <id>.json（文件名、总大小等）
+    """
+
+    def __init__(self, root: Path, max_size: int = MAX_UPLOAD_SIZE):
+        self.root = Path(root)
+        self.max_size = max_size
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, upload_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _paths(self, upload_id: str):
+        # upload_id 来自客户端，只接受init生成的格式，防止路径穿越
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError('无效的上传ID', 404)
+        return self.root / f"{upload_id}.part", self.root / f"{upload_id}.json"
+
+    def _load_meta(self, upload_id: str) -> Dict:
+        _, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError('上传不存在或已过期', 404)
+
+    def _save_meta(self, upload_id: str, meta: Dict):
+        _, meta_path = self._paths(upload_id)
+        tmp_path = meta_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+
+    def init(self, filename: str, size: int) -> Dict:
+        """开始一个新的上传"""
+        if size <= 0:
+            raise UploadError('文件大小无效')
+        if size > self.max_size:
+            raise UploadError(f'文件过大（上限 {self.max_size} 字节）', 413)
+        self.cleanup_expired()
+
+        upload_id = uuid.uuid4().hex
+        part_path, _ = self._paths(upload_id)
+        part_path.touch()
+        self._save_meta(upload_id, {
+            'filename': filename,
+            'size': size,
+            'created': time.time(),
+            'committed_path': None,
+        })
+        return self.status(upload_id)
+
+    def status(self, upload_id: str) -> Dict:
+        """已接收的偏移量等信息，客户端据此续传"""
+        meta = self._load_meta(upload_id)
+        part_path, _ = self._paths(upload_id)
+        if meta['committed_path']:
+            offset = meta['size']
+        else:
+            offset = part_path.stat().st_size if part_path.exists() else 0
+        return {
+            'upload_id': upload_id,
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'offset': offset,
+            'committed': bool(meta['committed_path']),
+        }
+
+    def write_chunk(self, upload_id: str, offset: int, stream, length: int = None) -> int:
+        """
+        从 stream 读取一块数据，追加到偏移量 offset 处
+        offset 必须等于已接收的字节数，否则返回409和当前偏移量让客户端重新对齐
+        """
+        if length is not None and length > MAX_CHUNK_SIZE:
+            raise UploadError(f'分块过大（上限 {MAX_CHUNK_SIZE} 字节）', 413)
+
+        with self._lock(upload_id):
+            meta = self._load_meta(upload_id)
+            if meta['committed_path']:
+                raise UploadError('上传已完成', 409, meta['size'])
+
+            part_path, _ = self._paths(upload_id)
+            received = part_path.stat().st_size
+            if offset != received:
+                raise UploadError('偏移量不匹配', 409, received)
+
+            written = 0
+            with open(part_path, 'ab') as f:
+                try:
+                    while True:
+                        data = stream.read(COPY_BUFFER_SIZE)
+                        if not data:
+                            break
+                        written += len(data)
+                        if received + written > meta['size'] or written > MAX_CHUNK_SIZE:
+                            raise UploadError('数据超出声明的文件大小', 400)
+                        f.write(data)
+                except Exception:
+                    # 丢弃这一块不完整的数据，保证偏移量始终落在块边界上
+                    f.truncate(received)
+                    raise
+            return received + written
+
+    def commit(self, upload_id: str, destination_dir: Path) -> str:
+        """
+        所有数据到齐后把分块文件移动到上传目录，返回最终路径
+        重复提交返回同一路径
+        """
+        with self._lock(upload_id):
+            meta = self._load_meta(upload_id)
+            if meta['committed_path']:
+                return meta['committed_path']
+
+            part_path, _ = self._paths(upload_id)
+            received = part_path.stat().st_size
+            if received != meta['size']:
+                raise UploadError('文件尚未上传完整', 409, received)
+
+            timestamp = int(time.time() * 1000)
+            final_path = Path(destination_dir) / f"{timestamp}_{upload_id[:6]}_{meta['filename']}"
+            os.replace(part_path, final_path)
+            meta['committed_path'] = str(final_path)
+            self._save_meta(upload_id, meta)
+            return meta['committed_path']
+
+    def committed_path(self, upload_id: str) -> str:
+        """已提交上传的文件路径，供处理接口引用"""
+        meta = self._load_meta(upload_id)
+        if not meta['committed_path'] or not os.path.exists(meta['committed_path']):
+            raise UploadError('上传尚未提交', 409)
+        return meta['committed_path']
+
+    def release(self, upload_id: str):
+        """文件已交给处理任务，删除上传记录"""
+        part_path, meta_path = self._paths(upload_id)
+        for path in (part_path, meta_path):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+
+    def cleanup_expired(self):
+        """
+        删除超时未完成的上传，以及提交后一直没有被处理接口引用的文件
+        （如提交后关闭了浏览器）；已交给处理任务的上传记录已经删除，不受影响
+        """
+        now = time.time()
+        for meta_path in self.root.glob('*.json'):
+            part_path = meta_path.with_suffix('.part')
+            try:
+                # 分块文件每收到一块都会更新修改时间，提交时会重写记录文件
+                last_active = max(
+                    meta_path.stat().st_mtime,
+                    part_path.stat().st_mtime if part_path.exists() else 0
+                )
+                if now - last_active <= UPLOAD_EXPIRE_SECONDS:
+                    continue
+                with self._lock(meta_path.stem):
+                    committed_path = self._load_meta(meta_path.stem).get('committed_path')
+                    if committed_path:
+                        try:
+                            os.remove(committed_path)
+                        except FileNotFoundError:
+                            pass
+                self.release(meta_path.stem)
+            except (OSError, ValueError, UploadError):
+                continue
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk caches
+Entries are keyed by a SHA-256 of the source audio plus the request
+parameters, stored one file per key, and evicted least-recently-used first
+once the cache grows past its size limit or an entry passes its maximum age
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+CACHE_ROOT = PROJECT_ROOT / 'cache'
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Transcript cache defaults
+TRANSCRIPT_CACHE_MAX_BYTES = 200 * 1024 * 1024  # 200MB
+TRANSCRIPT_CACHE_MAX_AGE = 90 * 24 * 3600  # 90 days
+
+# Compressed audio cache defaults
+COMPRESSED_CACHE_MAX_BYTES = 500 * 1024 * 1024  # 500MB
+COMPRESSED_CACHE_MAX_AGE = 7 * 24 * 3600  # 7 days
+
+# Private links handed out by checkout(); ones a crashed process never
+# removed are swept by evict() after this long
+CHECKOUT_SUFFIX = '.checkout'
+CHECKOUT_MAX_AGE = 24 * 3600
+
+# Digests remembered in memory; long-running processes (--serve, --watch,
+# the web server) keep only the most recently used ones
+DIGEST_MEMO_MAX_ENTRIES = 1024
+
+_digest_lock = threading.Lock()
+_digest_memo = OrderedDict()
+
+
+def file_sha256(path: str) -> str:
+    """
+    SHA-256 of a file's content, read in chunks.
+    Memoized on (path, size, mtime) so a file is only hashed once per run;
+    the memo is an LRU of DIGEST_MEMO_MAX_ENTRIES
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        digest = _digest_memo.get(memo_key)
+        if digest:
+            _digest_memo.move_to_end(memo_key)
+    if digest:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with _digest_lock:
+        _digest_memo[memo_key] = digest
+        _digest_memo.move_to_end(memo_key)
+        while len(_digest_memo) > DIGEST_MEMO_MAX_ENTRIES:
+            _digest_memo.popitem(last=False)
+    return digest
+
+
+def cache_key(content_digest: str, params: Dict) -> str:
+    """Combine a content digest and request parameters into one cache key"""
+    payload = content_digest + json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DiskLRUCache:
+    """
+    Directory-backed LRU cache, one file per entry.
+    An entry's mtime is its last-used time: hits touch the file, and eviction
+    removes expired entries first, then the oldest until under max_bytes
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, max_age: float, suffix: str = ''):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key: str) -> Path:
+        # Two-level fan-out keeps directories small
+        return self.directory / key[:2] / (key + self.suffix)
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Return the entry path on a hit (and mark it recently used), else None"""
+        path = self._entry_path(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+
+        if self.max_age and time.time() - stat.st_mtime > self.max_age:
+            self._remove(path)
+            self._count('misses')
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count('hits')
+        return path
+
+    def store_bytes(self, key: str, data: bytes) -> Path:
+        """Atomically write an entry, then enforce the size/age limits"""
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(Path(tmp_path))
+            raise
+        self.evict()
+        return path
+
+    def store_file(self, key: str, source_path: str) -> Path:
+        """Move a finished file into the cache as an entry (same filesystem)"""
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source_path, path)
+        self.evict()
+        return path
+
+    def staging_path(self, key: str) -> str:
+        """Temp file next to the entry's final location, for building it in place"""
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), suffix='.tmp')
+        os.close(fd)
+        return tmp_path
+
+    def checkout(self, path: Path) -> str:
+        """
+        Private hardlink (or copy, where links aren't supported) of an entry for
+        a caller that reads it later, e.g. an upload. Eviction only unlinks the
+        entry, so the caller's file stays readable; the caller deletes it when
+        done. Raises FileNotFoundError if the entry was evicted in the meantime
+        """
+        path = Path(path)
+        private_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}{CHECKOUT_SUFFIX}")
+        try:
+            os.link(path, private_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copyfile(path, private_path)
+        return str(private_path)
+
+    def _remove(self, path: Path) -> bool:
+        try:
+            path.unlink()
+            return True
+        except OSError:
+            return False
+
+    def _entries(self):
+        if not self.directory.exists():
+            return []
+        entries = []
+        for path in self.directory.glob('*/*' + self.suffix):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Drop expired entries, then least-recently-used ones over max_bytes"""
+        entries = self._entries()
+        now = time.time()
+        for path in self.directory.glob('*/*' + CHECKOUT_SUFFIX):
+            try:
+                if now - path.stat().st_ctime > CHECKOUT_MAX_AGE:
+                    path.unlink()
+            except OSError:
+                continue
+        live = []
+        for mtime, size, path in entries:
+            if self.max_age and now - mtime > self.max_age:
+                if self._remove(path):
+                    self._count('evictions')
+            else:
+                live.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in live)
+        for mtime, size, path in sorted(live):
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                self._count('evictions')
+            total -= size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class TranscriptCache(DiskLRUCache):
+    """
+    Transcription API results keyed by audio content + request parameters
+    (model_id, diarize, ...). Stored as JSON so every entry point can reuse it
+    """
+
+    def __init__(self, directory: Path = CACHE_ROOT / 'transcripts',
+                 max_bytes: int = TRANSCRIPT_CACHE_MAX_BYTES,
+                 max_age: float = TRANSCRIPT_CACHE_MAX_AGE):
+        super().__init__(directory, max_bytes, max_age, suffix='.json')
+
+    def get(self, audio_path: str, params: Dict) -> Optional[Dict]:
+        path = self.lookup(cache_key(file_sha256(audio_path), params))
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Corrupt entry: drop it and treat as a miss
+            self._remove(path)
+            return None
+
+    def put(self, audio_path: str, params: Dict, result: Dict):
+        data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        self.store_bytes(cache_key(file_sha256(audio_path), params), data)
+
+
+class CompressedAudioCache(DiskLRUCache):
+    """
+    Compressed upload artifacts keyed by source audio content + encoder
+    settings, so retries and re-runs skip ffmpeg entirely. Each entry keeps
+    the time its encode took in a small sidecar so hits can report it
+    """
+
+    def __init__(self, directory: Path = CACHE_ROOT / 'compressed',
+                 max_bytes: int = COMPRESSED_CACHE_MAX_BYTES,
+                 max_age: float = COMPRESSED_CACHE_MAX_AGE,
+                 suffix: str = '.mp3'):
+        super().__init__(directory, max_bytes, max_age, suffix=suffix)
+        self.encode_seconds_saved = 0.0
+
+    @staticmethod
+    def _meta_path(path: Path) -> Path:
+        return path.with_name(path.name + '.meta')
+
+    def _remove(self, path: Path) -> bool:
+        removed = super()._remove(path)
+        if removed:
+            super()._remove(self._meta_path(path))
+        return removed
+
+    def key_for(self, audio_path: str, params: Dict) -> str:
+        return cache_key(file_sha256(audio_path), params)
+
+    def get(self, key: str) -> Optional[Path]:
+        """Cached artifact path on a hit; adds its recorded encode time to the savings"""
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(self._meta_path(path), 'r', encoding='utf-8') as f:
+                saved = float(json.load(f).get('encode_seconds', 0))
+        except (OSError, ValueError, TypeError):
+            saved = 0.0
+        with self._lock:
+            self.encode_seconds_saved += saved
+        return path
+
+    def put(self, key: str, artifact_path: str, encode_seconds: float) -> Path:
+        """Move a freshly encoded artifact into the cache"""
+        path = self.store_file(key, artifact_path)
+        with open(self._meta_path(path), 'w', encoding='utf-8') as f:
+            json.dump({'encode_seconds': round(encode_seconds, 3)}, f)
+        return path
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        with self._lock:
+            stats['encode_seconds_saved'] = self.encode_seconds_saved
+        return stats
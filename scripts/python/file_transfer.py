@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Cheap file moves and copies for large recordings
+Moves rename when source and destination share a filesystem. Copies try a
+copy-on-write clone first (FICLONE on Linux, clonefile on macOS/APFS), then
+an in-kernel copy_file_range, and only stream the bytes through userspace
+when neither is available
+"""
+
+import os
+import sys
+import errno
+import shutil
+import ctypes
+import tempfile
+
+from metrics import FILE_TRANSFER_BYTES, FILE_TRANSFERS
+
+# _IOW(0x94, 9, int): clone the whole source file into the destination
+FICLONE = 0x40049409
+
+_clonefile = None
+if sys.platform == 'darwin':
+    try:
+        _clonefile = ctypes.CDLL(None, use_errno=True).clonefile
+        _clonefile.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32)
+    except (OSError, AttributeError):
+        _clonefile = None
+
+
+def _clone(src: str, dst: str) -> bool:
+    """Copy-on-write clone of src over dst; False if the filesystem can't"""
+    if _clonefile is not None:
+        # clonefile refuses to overwrite, so clone beside dst and rename over it
+        fd, tmp_path = tempfile.mkstemp(prefix='.clone_', dir=os.path.dirname(dst) or '.')
+        os.close(fd)
+        os.remove(tmp_path)
+        if _clonefile(os.fsencode(src), os.fsencode(tmp_path), 0) != 0:
+            return False
+        os.replace(tmp_path, dst)
+        return True
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            return False
+    return True
+
+
+def _copy_file_range(src: str, dst: str) -> bool:
+    """In-kernel copy (may be offloaded by the filesystem); False if unsupported"""
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            try:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30))
+            except OSError as e:
+                if e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF):
+                    return False
+                raise
+            if copied == 0:
+                break
+            remaining -= copied
+    return remaining <= 0
+
+
+def _record(method: str, size: int) -> str:
+    FILE_TRANSFERS.inc(method=method)
+    FILE_TRANSFER_BYTES.inc(size, method=method)
+    return method
+
+
+def copy_file(src: str, dst: str) -> str:
+    """
+    Copy src to dst (replacing dst) with metadata, as cheaply as the
+    filesystem allows. Returns the mechanism used
+    """
+    size = os.path.getsize(src)
+    for method, attempt in (('clone', _clone), ('copy_file_range', _copy_file_range)):
+        try:
+            if attempt(src, dst):
+                shutil.copystat(src, dst)
+                return _record(method, size)
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return _record('copy', size)
+
+
+def move_file(src: str, dst: str) -> str:
+    """
+    Move src to dst (replacing dst). Renames on the same filesystem, otherwise
+    copies with copy_file and removes src. Returns the mechanism used
+    """
+    size = os.path.getsize(src)
+    try:
+        os.replace(src, dst)
+        return _record('rename', size)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    method = copy_file(src, dst)
+    os.remove(src)
+    return method
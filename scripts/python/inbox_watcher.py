@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+收件箱目录监视
+常驻进程监视一个目录：文件大小稳定后才视为写入完成，短时间内陆续到达的文件
+合并成一批交给处理函数，处理后移入 processed/ 或 failed/ 子目录。
+目录变化通知优先使用inotify（Linux）或kqueue（macOS），都不可用时定时轮询
+"""
+
+import os
+import time
+import errno
+import select
+import ctypes
+import ctypes.util
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.m4a', '.flac', '.aac', '.ogg'}
+
+SETTLE_SECONDS = 2.0  # 文件大小和修改时间保持不变多久视为写入完成
+BATCH_WINDOW = 5.0  # 最后一个文件到达后再等多久没有新文件就开始处理
+MAX_BATCH = 50  # 单批最多文件数
+POLL_INTERVAL = 2.0  # 轮询模式下扫描目录的间隔（秒）
+EVENT_RESCAN_INTERVAL = 60.0  # 事件模式下没有通知时也定期扫描一次，防止漏掉事件
+PROCESSED_DIR = 'processed'
+FAILED_DIR = 'failed'
+
+# inotify事件：新建、写入、写完关闭、移入
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+
+class InotifyNotifier:
+    """通过ctypes调用inotify，目录中有文件变化时唤醒"""
+
+    name = 'inotify'
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify不可用')
+        # IN_NONBLOCK / IN_CLOEXEC 与 O_NONBLOCK / O_CLOEXEC 取值相同
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1失败')
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f'无法监视目录: {directory}')
+
+    def wait(self, timeout: float) -> bool:
+        """等待变化通知，有通知返回True，超时返回False"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        # 只需要知道"有变化"，事件内容直接丢弃，由调用方重新扫描目录
+        while True:
+            try:
+                if not os.read(self.fd, 64 * 1024):
+                    break
+            except BlockingIOError:
+                break
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class KqueueNotifier:
+    """macOS/BSD上通过kqueue监视目录，目录中新增、删除或重命名文件时唤醒"""
+
+    name = 'kqueue'
+
+    def __init__(self, directory: str):
+        if not hasattr(select, 'kqueue'):
+            raise OSError(errno.ENOSYS, 'kqueue不可用')
+        self.dir_fd = os.open(directory, os.O_RDONLY)
+        self.kq = select.kqueue()
+        self.event = select.kevent(
+            self.dir_fd,
+            filter=select.KQ_FILTER_VNODE,
+            flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+            fflags=select.KQ_NOTE_WRITE | select.KQ_NOTE_EXTEND | select.KQ_NOTE_RENAME
+        )
+        self.kq.control([self.event], 0, 0)
+
+    def wait(self, timeout: float) -> bool:
+        return bool(self.kq.control(None, 16, timeout))
+
+    def close(self):
+        self.kq.close()
+        os.close(self.dir_fd)
+
+
+class PollingNotifier:
+    """没有事件通知时按固定间隔扫描目录"""
+
+    name = 'polling'
+
+    def __init__(self, directory: str, interval: float = POLL_INTERVAL):
+        self.interval = interval
+
+    def wait(self, timeout: float) -> bool:
+        time.sleep(min(timeout, self.interval))
+        return False
+
+    def close(self):
+        pass
+
+
+def create_notifier(directory: str, polling: bool = False):
+    """依次尝试inotify、kqueue，都不可用时退回轮询"""
+    if not polling:
+        for notifier_class in (InotifyNotifier, KqueueNotifier):
+            try:
+                return notifier_class(directory)
+            except (OSError, AttributeError):
+                continue
+    return PollingNotifier(directory)
+
+
+class InboxWatcher:
+    """
+    process_batch(files) 在监视线程中依次处理每一批文件，返回 {文件: 是否成功}；
+    成功的文件移入 processed/，失败的移入 failed/，避免重启后重复处理
+    """
+
+    def __init__(self, inbox: str, process_batch: Callable[[List[str]], Dict[str, bool]],
+                 settle: float = SETTLE_SECONDS, batch_window: float = BATCH_WINDOW,
+                 max_batch: int = MAX_BATCH, polling: bool = False):
+        self.inbox = Path(inbox)
+        self.process_batch = process_batch
+        self.settle = settle
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self.polling = polling
+        self.processed_dir = self.inbox / PROCESSED_DIR
+        self.failed_dir = self.inbox / FAILED_DIR
+        # 文件 -> (大小, 修改时间, 该状态首次出现的时间)
+        self._pending = {}
+        self._ready = []
+        self._last_activity = 0.0
+        # 移动失败的文件记下指纹，避免同一个文件反复处理
+        self._done = set()
+
+    def _scan(self, now: float):
+        """扫描收件箱，更新待稳定文件的状态"""
+        present = set()
+        try:
+            entries = list(os.scandir(self.inbox))
+        except OSError as e:
+            print(f"⚠️ 无法读取收件箱: {str(e)}")
+            return
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            if Path(entry.name).suffix.lower() not in AUDIO_EXTENSIONS:
+                continue
+            path = entry.path
+            present.add(path)
+            if path in self._ready:
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            fingerprint = (stat.st_size, stat.st_mtime_ns)
+            if (path,) + fingerprint in self._done:
+                continue
+            previous = self._pending.get(path)
+            if previous is None or previous[:2] != fingerprint:
+                # 新文件或仍在写入
+                self._pending[path] = fingerprint + (now,)
+                self._last_activity = now
+            elif stat.st_size > 0 and now - previous[2] >= self.settle:
+                del self._pending[path]
+                self._ready.append(path)
+                print(f"✓ 收到文件: {entry.name}")
+        # 写入途中被删除或移走的文件
+        for path in list(self._pending):
+            if path not in present:
+                del self._pending[path]
+
+    def _next_timeout(self, now: float, event_driven: bool) -> float:
+        timeouts = [EVENT_RESCAN_INTERVAL if event_driven else POLL_INTERVAL]
+        if self._pending:
+            # 大小稳定要靠重新stat确认，变化通知不会告诉我们"不再变化"
+            timeouts.append(max(0.2, self.settle / 2))
+        if self._ready:
+            timeouts.append(max(0.0, self._last_activity + self.batch_window - now))
+        return min(timeouts)
+
+    def _should_flush(self, now: float) -> bool:
+        if not self._ready:
+            return False
+        if len(self._ready) >= self.max_batch:
+            return True
+        return not self._pending and now - self._last_activity >= self.batch_window
+
+    def _move(self, path: str, ok: bool):
+        target_dir = self.processed_dir if ok else self.failed_dir
+        source = Path(path)
+        target = target_dir / source.name
+        counter = 1
+        while target.exists():
+            target = target_dir / f"{source.stem}_{counter}{source.suffix}"
+            counter += 1
+        try:
+            stat = source.stat()
+        except OSError:
+            return
+        try:
+            target_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(source, target)
+        except OSError as e:
+            print(f"⚠️ 无法移动 {source.name}: {str(e)}")
+            self._done.add((path, stat.st_size, stat.st_mtime_ns))
+
+    def _flush(self):
+        batch = sorted(self._ready[:self.max_batch])
+        del self._ready[:len(batch)]
+        print(f"\n📥 处理 {len(batch)} 个新文件...")
+        try:
+            results = self.process_batch(batch)
+        except Exception as e:
+            print(f"✗ 批处理失败: {str(e)}")
+            results = {}
+        for path in batch:
+            self._move(path, bool(results.get(path)))
+
+    def run(self, stop: Optional[Callable[[], bool]] = None):
+        """监视收件箱直到 stop() 返回True（或被Ctrl+C中断）"""
+        self.inbox.mkdir(parents=True, exist_ok=True)
+        notifier = create_notifier(str(self.inbox), self.polling)
+        event_driven = not isinstance(notifier, PollingNotifier)
+        print(f"👀 正在监视 {self.inbox}（{notifier.name}），按 Ctrl+C 停止")
+        try:
+            while stop is None or not stop():
+                now = time.monotonic()
+                self._scan(now)
+                if self._should_flush(now):
+                    self._flush()
+                    continue
+                notifier.wait(self._next_timeout(time.monotonic(), event_driven))
+        finally:
+            notifier.close()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+有界任务调度器
+固定数量的工作线程从有上限的队列中取任务；队列满时拒绝新任务，
+由调用方返回 429/503 + Retry-After，而不是无限制地接收工作
+"""
+
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Optional
+
+RETRY_AFTER_MIN = 1  # Retry-After下限（秒）
+RETRY_AFTER_MAX = 300  # Retry-After上限（秒）
+DEFAULT_JOB_SECONDS = 60.0  # 还没有完成过任务时估算的单个任务耗时
+
+
+class QueueFullError(Exception):
+    """队列已满，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"任务队列已满，请在 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """
+    handler(context, job) 在工作线程中处理任务
+    worker_init() 为每个工作线程创建独立的上下文（如VoiceToNotesWorkflow实例），
+    初始化失败时该任务交给 on_error 处理，下个任务再重试初始化
+    """
+
+    def __init__(self, handler: Callable[[Any, Dict], None],
+                 workers: int = 2, max_queue: int = 20,
+                 worker_init: Optional[Callable[[], Any]] = None,
+                 on_error: Optional[Callable[[Dict, Exception], None]] = None):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.worker_init = worker_init
+        self.on_error = on_error
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._avg_job_seconds = None
+        self._threads = []
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"job-worker-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, job: Dict):
+        """加入队列；队列已满时抛出 QueueFullError"""
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFullError(self.retry_after())
+
+    def submit_wait(self, job: Dict):
+        """加入队列，队列已满时阻塞等待（用于重启后恢复任务）"""
+        self._queue.put(job)
+
+    def has_capacity(self) -> bool:
+        return not self._queue.full()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def active_workers(self) -> int:
+        with self._lock:
+            return self._active
+
+    def retry_after(self) -> int:
+        """按平均任务耗时估算队列腾出位置需要的秒数"""
+        with self._lock:
+            job_seconds = self._avg_job_seconds or DEFAULT_JOB_SECONDS
+        estimate = job_seconds * max(1, self.queue_depth()) / self.workers
+        return int(min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, estimate)))
+
+    def _record_duration(self, seconds: float):
+        with self._lock:
+            if self._avg_job_seconds is None:
+                self._avg_job_seconds = seconds
+            else:
+                # 指数移动平均，最近的任务权重更高
+                self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * seconds
+
+    def _worker_loop(self):
+        context = None
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._active += 1
+            started_at = time.time()
+            try:
+                if context is None and self.worker_init is not None:
+                    context = self.worker_init()
+                self.handler(context, job)
+            except Exception as e:
+                print(f"❌ 任务处理错误: {str(e)}")
+                if self.on_error is not None:
+                    self.on_error(job, e)
+            finally:
+                self._record_duration(time.time() - started_at)
+                with self._lock:
+                    self._active -= 1
+                self._queue.task_done()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+按笔记中的顺序流式交付条目
+流水线中的文件完成先后不定，而同一笔记中的条目必须按录音时间排列：
+一个条目只有在同一笔记中排在它前面的条目都已完成（成功或失败）后才能写入，
+不同笔记之间互不等待。写入线程每次取走所有已可写入的条目，合并成一次osascript调用
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+
+class OrderedDelivery:
+    """
+    groups[i] 是第i个任务所属的笔记（任务按在笔记中从上到下的顺序排列）。
+    流水线每完成一个任务调用 resolve(i, 条目或None)，写入线程循环调用 next_batch() 取可写入的条目，
+    返回None表示所有任务都已交付
+    """
+
+    def __init__(self, groups: List[str]):
+        self._cond = threading.Condition()
+        self._results = {}
+        # 每个笔记尚未交付的任务序号（按顺序）
+        self._waiting = {}
+        for index, group in enumerate(groups):
+            self._waiting.setdefault(group, []).append(index)
+        self._unresolved = len(groups)
+        self._ready = []
+
+    def resolve(self, index: int, entry: Optional[Dict]):
+        with self._cond:
+            if index in self._results:
+                return
+            self._results[index] = entry
+            self._unresolved -= 1
+            # 从每个笔记最前面未交付的任务开始，交付已完成的连续一段
+            for waiting in self._waiting.values():
+                while waiting and waiting[0] in self._results:
+                    ready = self._results[waiting.pop(0)]
+                    if ready is not None:
+                        self._ready.append(ready)
+            self._cond.notify_all()
+
+    def next_batch(self) -> Optional[List[Dict]]:
+        """阻塞直到有可写入的条目，返回其中全部（同一笔记内保持顺序）"""
+        with self._cond:
+            while not self._ready and self._unresolved > 0:
+                self._cond.wait()
+            if not self._ready:
+                return None
+            batch, self._ready = self._ready, []
+            return batch
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Apple Notes同步就绪检测
+用可替换的就绪探针代替固定的MIN_SYNC_TIME等待：探针在后台线程中运行，
+与压缩、转录同时进行，一旦报告就绪即可开始写入笔记，最长等待时间可配置
+"""
+
+import time
+import threading
+import subprocess
+from typing import Callable, Optional
+
+import tracing
+
+PROBE_INTERVAL = 3.0  # 两次探测之间的间隔（秒）
+PROBE_TIMEOUT = 30  # 单次osascript探测的超时（秒）
+STABLE_PROBES = 2  # 笔记数量连续多少次不变视为同步完成
+
+# 返回闪念笔记文件夹中的笔记数量；Notes未运行或文件夹不存在时返回标记
+PROBE_SCRIPT = '''
+tell application "Notes"
+    if not running then return "not_running"
+    try
+        return (count of notes of folder "閃念筆記" of folder "Capture") as text
+    on error
+        return "no_folder"
+    end try
+end tell
+'''
+
+
+class OsascriptNotesProbe:
+    """
+    通过osascript查询Apple Notes的就绪探针
+    iCloud同步期间笔记数量会变化，连续几次结果相同即认为同步已稳定
+    """
+
+    def __init__(self, osascript: str = 'osascript', stable_probes: int = STABLE_PROBES):
+        self.osascript = osascript
+        self.stable_probes = stable_probes
+        self._last_value = None
+        self._stable_count = 0
+
+    def __call__(self) -> bool:
+        with tracing.span('osascript_sync_probe'):
+            result = subprocess.run(
+                [self.osascript, '-e', PROBE_SCRIPT],
+                capture_output=True, text=True, timeout=PROBE_TIMEOUT
+            )
+        if result.returncode != 0:
+            return False
+
+        value = result.stdout.strip()
+        if value == 'not_running':
+            self._last_value = None
+            self._stable_count = 0
+            return False
+
+        if value == self._last_value:
+            self._stable_count += 1
+        else:
+            self._last_value = value
+            self._stable_count = 1
+        return self._stable_count >= self.stable_probes
+
+
+class NotesSyncWaiter:
+    """
+    在后台反复调用就绪探针，直到探针报告就绪或达到最长等待时间
+    probe 是任意无参可调用对象，返回True表示可以开始写入笔记
+    """
+
+    def __init__(self, probe: Optional[Callable[[], bool]] = None,
+                 max_wait: float = 45.0, interval: float = PROBE_INTERVAL):
+        self.probe = probe if probe is not None else OsascriptNotesProbe()
+        self.max_wait = max_wait
+        self.interval = interval
+        self.started_at = None
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, before: Optional[Callable[[], None]] = None):
+        """
+        启动后台探测线程；before 在探测前执行（如激活Apple Notes）
+        """
+        self.started_at = time.time()
+
+        def run():
+            if before is not None:
+                try:
+                    before()
+                except Exception as e:
+                    print(f"✗ 同步准备失败: {str(e)}")
+            while not self._stopped.is_set():
+                try:
+                    ready = self.probe()
+                except Exception as e:
+                    print(f"⚠️ 同步探测失败: {str(e)}")
+                    ready = False
+                if ready:
+                    self._ready.set()
+                    return
+                if self.elapsed() >= self.max_wait:
+                    return
+                self._stopped.wait(self.interval)
+
+        self._thread = threading.Thread(target=run, name='notes-sync-probe', daemon=True)
+        self._thread.start()
+        return self
+
+    def elapsed(self) -> float:
+        return time.time() - self.started_at if self.started_at else 0.0
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self) -> bool:
+        """
+        阻塞直到就绪或超过最长等待时间，返回是否由探针确认就绪
+        """
+        remaining = max(0.0, self.max_wait - self.elapsed())
+        ready = self._ready.wait(remaining)
+        self.stop()
+        return ready
+
+    def stop(self):
+        self._stopped.set()
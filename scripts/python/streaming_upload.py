@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Streaming multipart upload helpers
+Builds multipart/form-data request bodies lazily so audio is sent in chunks,
+either from a file on disk or straight from ffmpeg's stdout, without ever
+holding the whole recording (or the whole request body) in memory
+"""
+
+import os
+import time
+import uuid
+import threading
+import subprocess
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List
+
+import requests
+
+from metrics import UPLOAD_BYTES
+
+CHUNK_SIZE = 64 * 1024  # bytes read from the source per body chunk
+
+STDERR_TAIL_LINES = 20  # ffmpeg stderr lines kept for error messages
+
+# File extension -> MIME type sent with the upload
+AUDIO_MIME_TYPES = {
+    '.mp3': 'audio/mpeg',
+    '.ogg': 'audio/ogg',
+    '.opus': 'audio/ogg',
+    '.webm': 'audio/webm',
+    '.wav': 'audio/wav',
+    '.m4a': 'audio/mp4',
+    '.aac': 'audio/aac',
+    '.flac': 'audio/flac',
+}
+
+# Named compression targets for uploads. codec and container are the names
+# ffprobe reports (the container doubles as the ffmpeg muxer), encoder is
+# the ffmpeg encoder; bitrate in bits per second, sample rate in Hz.
+# Opus in voip mode is about half the size of MP3 at similar intelligibility
+ENCODING_PROFILES = {
+    'mp3-32k': {'codec': 'mp3', 'encoder': 'mp3', 'container': 'mp3', 'extension': 'mp3',
+                'bitrate': 32000, 'sample_rate': 16000, 'channels': 1},
+    'opus-24k': {'codec': 'opus', 'encoder': 'libopus', 'container': 'ogg', 'extension': 'ogg',
+                 'bitrate': 24000, 'sample_rate': 16000, 'channels': 1, 'options': ['-application', 'voip']},
+    'opus-16k': {'codec': 'opus', 'encoder': 'libopus', 'container': 'ogg', 'extension': 'ogg',
+                 'bitrate': 16000, 'sample_rate': 16000, 'channels': 1, 'options': ['-application', 'voip']},
+    'opus-12k': {'codec': 'opus', 'encoder': 'libopus', 'container': 'ogg', 'extension': 'ogg',
+                 'bitrate': 12000, 'sample_rate': 16000, 'channels': 1, 'options': ['-application', 'voip']},
+}
+DEFAULT_ENCODING = 'mp3-32k'
+
+
+class StreamingUploadError(Exception):
+    """Raised when the audio source fails while the request body is streaming"""
+
+
+def content_type_for(path: str) -> str:
+    """MIME type for an audio file, from its extension"""
+    return AUDIO_MIME_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+
+
+def get_encoding(name: str = None) -> Dict[str, object]:
+    """
+    Encoding profile by name (default DEFAULT_ENCODING), with its name and
+    the upload MIME type filled in. Raises ValueError for unknown names
+    """
+    name = name or DEFAULT_ENCODING
+    if name not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile '{name}' (choose from: {', '.join(ENCODING_PROFILES)})")
+    profile = dict(ENCODING_PROFILES[name], name=name)
+    profile['mime_type'] = AUDIO_MIME_TYPES['.' + profile['extension']]
+    return profile
+
+
+def compress_params(profile: Dict = None) -> Dict[str, object]:
+    """Compression settings, used to key cached compressed artifacts"""
+    profile = profile or get_encoding()
+    params = {
+        'codec': profile['codec'],
+        'bitrate': profile['bitrate'],
+        'sample_rate': profile['sample_rate'],
+        'channels': profile['channels'],
+    }
+    # Only added when set, so keys for the original MP3 target (and existing cache entries) are unchanged
+    if profile['container'] != profile['codec']:
+        params['container'] = profile['container']
+    if profile.get('options'):
+        params['options'] = list(profile['options'])
+    return params
+
+
+def ffmpeg_compress_command(input_path: str, output_path: str = 'pipe:1',
+                            start: float = None, duration: float = None,
+                            profile: Dict = None) -> List[str]:
+    """
+    FFmpeg command that compresses audio with an encoding profile (default
+    32kbps / 16kHz mono MP3). Writes to stdout when output_path is 'pipe:1';
+    start/duration (seconds) restrict the output to one segment of the input
+    """
+    profile = profile or get_encoding()
+    cmd = ['ffmpeg']
+    if start:
+        cmd += ['-ss', f'{start:.3f}']
+    cmd += ['-i', input_path]
+    if duration is not None:
+        cmd += ['-t', f'{duration:.3f}']
+    cmd += [
+        '-vn',  # audio only
+        '-acodec', profile['encoder'],
+        '-ab', f"{profile['bitrate'] // 1000}k",
+        '-ar', str(profile['sample_rate']),
+        '-ac', str(profile['channels']),
+    ]
+    cmd += list(profile.get('options', []))
+    # Explicit container: pipes and temp names have no extension to infer it from
+    cmd += ['-f', profile['container'], '-y', output_path]
+    return cmd
+
+
+class MultipartStream:
+    """
+    Iterable multipart/form-data body.
+    Form fields are emitted first, then the file part is read from fileobj
+    in CHUNK_SIZE pieces. requests sends an iterable without a length using
+    chunked transfer encoding, so memory use stays constant
+    """
+
+    def __init__(self, fields: Dict[str, str], file_field: str, filename: str,
+                 fileobj, content_type: str, chunk_size: int = CHUNK_SIZE):
+        self.fields = fields
+        self.file_field = file_field
+        self.filename = filename
+        self.fileobj = fileobj
+        self.file_content_type = content_type
+        self.chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.bytes_sent = 0
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        # Same HTML5-style escaping urllib3 applies to form-data names
+        return value.replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+    def __iter__(self):
+        for name, value in self.fields.items():
+            yield (
+                f"--{self.boundary}\r\n"
+                f"Content-Disposition: form-data; name=\"{self._quote(name)}\"\r\n\r\n"
+                f"{value}\r\n"
+            ).encode('utf-8')
+
+        yield (
+            f"--{self.boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{self._quote(self.file_field)}\"; "
+            f"filename=\"{self._quote(self.filename)}\"\r\n"
+            f"Content-Type: {self.file_content_type}\r\n\r\n"
+        ).encode('utf-8')
+
+        while True:
+            chunk = self.fileobj.read(self.chunk_size)
+            if not chunk:
+                break
+            self.bytes_sent += len(chunk)
+            yield chunk
+
+        yield f"\r\n--{self.boundary}--\r\n".encode('utf-8')
+
+
+class FileUpload:
+    """
+    Upload source for a file that already exists on disk (temp-file path)
+    """
+
+    def __init__(self, path: str, content_type: str = None, upload_name: str = None):
+        self.path = path
+        self.upload_name = upload_name or os.path.basename(path)
+        # Defaults to the type implied by the name the server sees
+        self.content_type = content_type or content_type_for(self.upload_name)
+
+    @contextmanager
+    def open(self):
+        with open(self.path, 'rb') as fileobj:
+            yield self.upload_name, fileobj, self.content_type
+
+
+class _FFmpegStdout:
+    """
+    File-like wrapper around ffmpeg's stdout that raises at EOF when ffmpeg
+    exited with an error, so a truncated encode aborts the upload instead of
+    being sent as a complete file
+    """
+
+    def __init__(self, process: subprocess.Popen, stderr_tail: deque, tee=None):
+        self.process = process
+        self.stderr_tail = stderr_tail
+        self.tee = tee
+        self.completed = False
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.process.stdout.read(size)
+        if not data:
+            returncode = self.process.wait()
+            if returncode != 0:
+                raise StreamingUploadError(
+                    f"ffmpeg exited with {returncode}: {' '.join(self.stderr_tail)}"
+                )
+            self.completed = True
+        else:
+            self.bytes_read += len(data)
+            if self.tee is not None:
+                self.tee.write(data)
+        return data
+
+
+class FFmpegUpload:
+    """
+    Upload source that compresses audio on the fly: ffmpeg encodes with the
+    given profile (default MP3) to a pipe and the request body reads from
+    it, so no temp file is written.
+    With tee_path the encoded bytes are also copied to that file as they are
+    sent; tee_complete tells whether the last attempt produced a full copy
+    """
+
+    def __init__(self, input_path: str, upload_name: str = None,
+                 start: float = None, duration: float = None, tee_path: str = None,
+                 profile: Dict = None):
+        self.input_path = input_path
+        self.profile = profile or get_encoding()
+        self.upload_name = upload_name or (
+            os.path.splitext(os.path.basename(input_path))[0] + '.' + self.profile['extension']
+        )
+        self.content_type = self.profile['mime_type']
+        self.start = start
+        self.duration = duration
+        self.tee_path = tee_path
+        self.tee_complete = False
+        self.encode_seconds = None
+        self.encoded_bytes = None
+
+    @contextmanager
+    def open(self):
+        self.tee_complete = False
+        started_at = time.time()
+        process = subprocess.Popen(
+            ffmpeg_compress_command(self.input_path, start=self.start, duration=self.duration,
+                                    profile=self.profile),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+
+        # Drain stderr continuously, otherwise a chatty ffmpeg blocks on a full pipe
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+
+        def drain_stderr():
+            for line in process.stderr:
+                stderr_tail.append(line.decode('utf-8', 'replace').strip())
+
+        drain_thread = threading.Thread(target=drain_stderr, daemon=True)
+        drain_thread.start()
+
+        tee = open(self.tee_path, 'wb') if self.tee_path else None
+        stdout = _FFmpegStdout(process, stderr_tail, tee)
+        try:
+            yield self.upload_name, stdout, self.content_type
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            process.stdout.close()
+            drain_thread.join(timeout=1)
+            if tee is not None:
+                tee.close()
+            if stdout.completed:
+                self.encode_seconds = time.time() - started_at
+                self.encoded_bytes = stdout.bytes_read
+                self.tee_complete = tee is not None
+
+
+def post_multipart(url: str, headers: Dict[str, str], fields: Dict[str, str],
+                   upload, file_field: str = 'file', session: requests.Session = None,
+                   timeout=None) -> requests.Response:
+    """
+    POST fields plus the audio from an upload source as a streamed
+    multipart/form-data body
+    """
+    with upload.open() as (filename, fileobj, content_type):
+        body = MultipartStream(fields, file_field, filename, fileobj, content_type)
+        request_headers = dict(headers)
+        request_headers['Content-Type'] = body.content_type
+        sender = session if session is not None else requests
+        try:
+            return sender.post(url, headers=request_headers, data=body, timeout=timeout)
+        finally:
+            UPLOAD_BYTES.inc(body.bytes_sent)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+任务状态事件
+保存每个任务的最新状态，并把每次状态变化作为带序号的事件推送给订阅者（SSE），
+客户端断线重连时可用最后收到的序号补齐错过的事件；
+传入 store（如 TaskStore）时状态写入持久化存储，内存中只保留有限的事件历史
+"""
+
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+EVENT_HISTORY = 1000  # 保留最近多少条事件供重连补齐
+
+
+class TaskEventBus:
+    """
+    update() 合并任务状态并产生一条事件；wait_events() 阻塞到有新事件或超时
+    """
+
+    def __init__(self, history: int = EVENT_HISTORY, store=None):
+        self.store = store
+        self._states = {}
+        self._events = deque(maxlen=history)
+        self._seq = 0
+        self._condition = threading.Condition()
+
+    def update(self, task_id: str, replace: bool = False, **fields) -> Dict:
+        """
+        更新任务状态（replace=True 时整体替换），返回更新后的状态
+        """
+        with self._condition:
+            current = None if replace else self._load(task_id)
+            state = dict(current) if current else {}
+            state.update(fields)
+            if self.store is not None:
+                self.store.put(task_id, state)
+            else:
+                self._states[task_id] = state
+            self._seq += 1
+            self._events.append((self._seq, task_id, dict(state)))
+            self._condition.notify_all()
+            return dict(state)
+
+    def _load(self, task_id: str) -> Optional[Dict]:
+        if self.store is not None:
+            return self.store.get(task_id)
+        return self._states.get(task_id)
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        with self._condition:
+            state = self._load(task_id)
+            return dict(state) if state is not None else None
+
+    def get_many(self, task_ids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """批量查询，不存在的任务对应None"""
+        with self._condition:
+            if self.store is not None:
+                return self.store.get_many(task_ids)
+            return {
+                task_id: dict(self._states[task_id]) if task_id in self._states else None
+                for task_id in task_ids
+            }
+
+    def discard(self, task_id: str):
+        with self._condition:
+            if self.store is not None:
+                self.store.delete(task_id)
+            else:
+                self._states.pop(task_id, None)
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+    def last_seq(self) -> int:
+        with self._condition:
+            return self._seq
+
+    def wait_events(self, after_seq: int, task_ids: Optional[set] = None,
+                    timeout: float = 15.0) -> Tuple[int, List[Tuple[int, str, Dict]]]:
+        """
+        返回序号大于 after_seq 的事件（只包含 task_ids 中的任务，None表示全部）
+        没有新事件时最多阻塞 timeout 秒；返回 (最新序号, 事件列表)
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > after_seq, timeout)
+            events = [
+                event for event in self._events
+                if event[0] > after_seq and (task_ids is None or event[1] in task_ids)
+            ]
+            return self._seq, events
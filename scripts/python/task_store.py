@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+持久化任务存储
+任务状态和待处理的任务队列保存在WAL模式的SQLite数据库中：
+已结束的任务超过保留时间后自动清理，服务器重启后可以找回排队中和处理中断的任务
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+TASK_TTL_SECONDS = 7 * 24 * 3600  # 已结束任务的保留时间
+PRUNE_INTERVAL = 600  # 两次清理之间的最短间隔（秒）
+FINISHED_STATUSES = ('success', 'error')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id     TEXT PRIMARY KEY,
+    state       TEXT NOT NULL,
+    status      TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_finished_at ON tasks (finished_at);
+CREATE TABLE IF NOT EXISTS jobs (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id     TEXT UNIQUE NOT NULL,
+    job         TEXT NOT NULL,
+    state       TEXT NOT NULL DEFAULT 'queued',
+    enqueued_at REAL NOT NULL,
+    started_at  REAL
+);
+'''
+
+
+class TaskStore:
+    """
+    tasks 表保存每个任务的最新状态（JSON）；jobs 表保存提交给调度器、尚未处理完的任务，
+    seq 即入队顺序，用于计算排队位置和重启后按原顺序重新入队
+    """
+
+    def __init__(self, path: Path, ttl: float = TASK_TTL_SECONDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # 任务状态
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT state FROM tasks WHERE task_id = ?', (task_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, task_ids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        task_ids = list(task_ids)
+        found = {}
+        with self._lock:
+            # SQLite对单条语句的参数个数有限制，分批查询
+            for start in range(0, len(task_ids), 500):
+                batch = task_ids[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                for task_id, state in self._conn.execute(
+                    f'SELECT task_id, state FROM tasks WHERE task_id IN ({placeholders})', batch
+                ):
+                    found[task_id] = json.loads(state)
+        return {task_id: found.get(task_id) for task_id in task_ids}
+
+    def put(self, task_id: str, state: Dict):
+        """写入任务状态；状态变为已结束时记录结束时间，用于过期清理"""
+        now = time.time()
+        status = state.get('status')
+        finished_at = now if status in FINISHED_STATUSES else None
+        with self._lock:
+            self._conn.execute(
+                '''INSERT INTO tasks (task_id, state, status, created_at, updated_at, finished_at)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(task_id) DO UPDATE SET
+                       state = excluded.state,
+                       status = excluded.status,
+                       updated_at = excluded.updated_at,
+                       finished_at = excluded.finished_at''',
+                (task_id, json.dumps(state, ensure_ascii=False), status, now, now, finished_at)
+            )
+        if now - self._last_prune > PRUNE_INTERVAL:
+            self.prune()
+
+    def delete(self, task_id: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM tasks WHERE task_id = ?', (task_id,))
+
+    def prune(self, now: float = None) -> int:
+        """删除结束时间超过保留时间的任务，返回删除的数量"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._last_prune = now
+            cursor = self._conn.execute(
+                'DELETE FROM tasks WHERE finished_at IS NOT NULL AND finished_at < ?',
+                (now - self.ttl,)
+            )
+        return cursor.rowcount
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+
+    # 任务队列
+
+    def save_job(self, job: Dict):
+        """任务提交给调度器前先持久化"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO jobs (task_id, job, state, enqueued_at) VALUES (?, ?, ?, ?)',
+                (job['task_id'], json.dumps(job, ensure_ascii=False), 'queued', time.time())
+            )
+
+    def mark_job_running(self, task_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'running', started_at = ? WHERE task_id = ?",
+                (time.time(), task_id)
+            )
+
+    def finish_job(self, task_id: str):
+        """任务处理完（成功或失败）后从队列中删除"""
+        with self._lock:
+            self._conn.execute('DELETE FROM jobs WHERE task_id = ?', (task_id,))
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        """排队中的任务前面还有几个排队中的任务（从0开始），不在排队时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seq FROM jobs WHERE task_id = ? AND state = 'queued'", (task_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND seq < ?", (row[0],)
+            ).fetchone()[0]
+
+    def pending_jobs(self) -> List[Dict]:
+        """排队中和处理中断的任务，按原入队顺序（处理中的排在前面）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job FROM jobs ORDER BY state = 'queued', seq"
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
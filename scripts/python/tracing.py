@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Lightweight stage tracing
+Code wraps interesting steps in span(stage, file=...). While profiling is
+enabled each span becomes a JSON-lines record (file, stage, start, duration,
+bytes) and is kept for a per-stage summary; otherwise span() is a no-op
+"""
+
+import json
+import os
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_active = None
+_active_lock = threading.Lock()
+
+
+class Span:
+    """Handle yielded by span(); set .bytes once the size is known"""
+
+    __slots__ = ('bytes',)
+
+    def __init__(self, bytes_: Optional[int] = None):
+        self.bytes = bytes_
+
+
+class Tracer:
+    """Collects span records and optionally appends them to a JSONL file"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.records = []
+        self._lock = threading.Lock()
+        self._sink = open(path, 'a', encoding='utf-8') if path else None
+
+    def record(self, stage: str, file: Optional[str], start: float, duration: float,
+               bytes_: Optional[int] = None, error: Optional[str] = None):
+        record = {
+            'file': Path(file).name if file else None,
+            'stage': stage,
+            'start': round(start, 6),
+            'duration': round(duration, 6),
+            'bytes': bytes_,
+            'thread': threading.current_thread().name,
+        }
+        if error:
+            record['error'] = error
+        with self._lock:
+            self.records.append(record)
+            if self._sink is not None:
+                self._sink.write(json.dumps(record, ensure_ascii=False) + '\n')
+                self._sink.flush()
+
+    def summary(self) -> List[Dict]:
+        """Per-stage count, total/mean/p50/p95/max seconds and bytes, in first-seen order"""
+        with self._lock:
+            records = list(self.records)
+        by_stage = {}
+        for record in records:
+            by_stage.setdefault(record['stage'], []).append(record)
+
+        rows = []
+        for stage, stage_records in by_stage.items():
+            durations = sorted(r['duration'] for r in stage_records)
+            rows.append({
+                'stage': stage,
+                'count': len(durations),
+                'total': sum(durations),
+                'mean': sum(durations) / len(durations),
+                'p50': _percentile(durations, 0.50),
+                'p95': _percentile(durations, 0.95),
+                'max': durations[-1],
+                'bytes': sum(r['bytes'] or 0 for r in stage_records),
+                'errors': sum(1 for r in stage_records if r.get('error')),
+            })
+        return rows
+
+    def reset(self):
+        """Forget the records kept for the summary; the JSONL file keeps everything"""
+        with self._lock:
+            self.records = []
+
+    def format_summary(self) -> str:
+        rows = self.summary()
+        if not rows:
+            return '(no spans recorded)'
+        header = f"{'stage':<24}{'count':>6}{'total s':>10}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}{'max s':>9}{'MB':>9}{'err':>5}"
+        lines = [header, '-' * len(header)]
+        for row in rows:
+            lines.append(
+                f"{row['stage']:<24}{row['count']:>6}{row['total']:>10.2f}{row['mean']:>9.3f}"
+                f"{row['p50']:>9.3f}{row['p95']:>9.3f}{row['max']:>9.3f}"
+                f"{row['bytes'] / 1024 / 1024:>9.2f}{row['errors']:>5}"
+            )
+        return '\n'.join(lines)
+
+    def close(self):
+        with self._lock:
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def enable(path: Optional[str] = None) -> Tracer:
+    """Start recording spans (to path as JSON lines, if given)"""
+    global _active
+    with _active_lock:
+        if _active is not None:
+            _active.close()
+        _active = Tracer(path)
+        return _active
+
+
+def disable() -> Optional[Tracer]:
+    """Stop recording; returns the tracer so its summary can still be read"""
+    global _active
+    with _active_lock:
+        tracer, _active = _active, None
+    if tracer is not None:
+        tracer.close()
+    return tracer
+
+
+def active() -> Optional[Tracer]:
+    return _active
+
+
+@contextmanager
+def span(stage: str, file: Optional[str] = None, bytes_: Optional[int] = None):
+    """Time a block as one stage record; failures are recorded with their exception class"""
+    tracer = _active
+    handle = Span(bytes_)
+    if tracer is None:
+        yield handle
+        return
+    start = time.time()
+    started_at = time.perf_counter()
+    error = None
+    try:
+        yield handle
+    except BaseException as e:
+        error = e.__class__.__name__
+        raise
+    finally:
+        tracer.record(stage, file, start, time.perf_counter() - started_at, handle.bytes, error)
+
+
+def file_size(path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
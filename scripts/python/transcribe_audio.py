@@ -6,15 +6,37 @@ Processes audio files through 11Labs API and generates multiple transcript forma
 
 import os
 import json
-import shutil
-import requests
 from pathlib import Path
 from typing import Dict, List, Optional
 import argparse
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from audio_chunking import (
+    CHUNK_SECONDS, CHUNK_WORKERS, detect_silences, plan_chunks, probe_duration, stitch_results
+)
+from disk_cache import TranscriptCache
+from file_transfer import move_file
+from streaming_upload import (
+    DEFAULT_ENCODING, ENCODING_PROFILES, FFmpegUpload, FileUpload, StreamingUploadError, get_encoding
+)
+from transcription_client import (
+    CONNECT_TIMEOUT, MAX_RETRIES, POOL_SIZE, READ_TIMEOUT, TranscriptionClient, TranscriptionError
+)
+import tracing
 
 def load_api_key():
-    """Load API key from api_key.txt file"""
+    """Load API key from the ELEVENLABS_API_KEY environment variable or api_key.txt"""
+    env_key = os.environ.get('ELEVENLABS_API_KEY', '').strip()
+    if env_key:
+        if not env_key.startswith('sk_'):
+            raise ValueError(
+                "Invalid API key format. 11Labs API keys should start with 'sk_'"
+            )
+        return env_key
+    
     # API密钥文件在config目录中
     project_root = Path(__file__).parent.parent.parent
     api_key_file = project_root / 'config' / 'api_key.txt'
@@ -40,43 +62,139 @@ def load_api_key():
     return api_key
 
 class ElevenLabsTranscriber:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, use_cache: bool = True, client_options: Optional[Dict] = None,
+                 encoding: str = DEFAULT_ENCODING):
         self.api_key = api_key
-        self.api_url = "https://api.elevenlabs.io/v1/speech-to-text"
-        self.headers = {
-            "xi-api-key": api_key
-        }
+        # Encoding profile for compressed uploads (codec, bitrate, container, MIME type)
+        self.encoding = get_encoding(encoding)
+        # Pooled keep-alive client with timeouts and retry/backoff
+        self.client = TranscriptionClient(api_key, **(client_options or {}))
+        self.api_url = self.client.api_url
+        self.headers = self.client.headers
+        # Content-addressed transcript cache shared by every entry point
+        self.cache = TranscriptCache() if use_cache else None
     
-    def transcribe_audio(self, audio_path: str) -> Dict:
+    def transcribe_audio(self, audio_path: str, compress: bool = False,
+                         chunk_seconds: Optional[float] = CHUNK_SECONDS,
+                         chunk_workers: int = CHUNK_WORKERS, diarize: bool = True) -> Dict:
         """
-        Transcribe audio file using 11Labs API with exact settings from N8N workflow
+        Transcribe audio file using 11Labs API with exact settings from N8N workflow.
+        The request body is streamed in chunks; with compress=True the audio is
+        piped through ffmpeg into the upload, falling back to the original file
+        if the streaming encode fails.
+        Recordings longer than 1.5x chunk_seconds are split at silences and the
+        chunks transcribed concurrently (chunk_seconds=None/0 disables this).
+        Chunking needs diarize=False: every chunk numbers its speakers on its
+        own, so speaker labels could not be matched up across chunks
         """
         print(f"Transcribing {audio_path}...")
         
-        with open(audio_path, 'rb') as audio_file:
-            files = {
-                'file': (os.path.basename(audio_path), audio_file, 'audio/mpeg')
-            }
-            
-            data = {
-                'model_id': 'scribe_v1',
-                'additional_formats': '[{"format":"srt","include_speakers":true}]',
-                'diarize': 'true'
-            }
-            
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                data=data,
-                files=files
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                print(f"Transcription completed successfully")
+        data = {
+            'model_id': 'scribe_v1',
+            'additional_formats': '[{"format":"srt","include_speakers":%s}]' % ('true' if diarize else 'false'),
+            'diarize': 'true' if diarize else 'false'
+        }
+        
+        if self.cache is not None:
+            cached = self.cache.get(audio_path, data)
+            if cached is not None:
+                print(f"Transcript cache hit, skipping API call")
+                return cached
+        
+        result = None
+        if chunk_seconds and not diarize:
+            result = self.transcribe_in_chunks(audio_path, data, chunk_seconds, chunk_workers)
+        if result is None:
+            result = self.transcribe_whole(audio_path, data, compress)
+        
+        print(f"Transcription completed successfully")
+        if self.cache is not None:
+            self.cache.put(audio_path, data, result)
+        return result
+    
+    def transcribe_whole(self, audio_path: str, data: Dict, compress: bool) -> Dict:
+        """
+        Send the whole recording in a single request
+        """
+        if compress:
+            upload = FFmpegUpload(audio_path, profile=self.encoding)
+            try:
+                with tracing.span('transcribe_streaming', audio_path) as span:
+                    result = self.client.transcribe(upload, data)
+                    span.bytes = upload.encoded_bytes
                 return result
-            else:
-                raise Exception(f"API Error: {response.status_code} - {response.text}")
+            except requests.ReadTimeout:
+                # The audio already reached the API; uploading it again could bill it twice
+                raise
+            except (StreamingUploadError, OSError) as e:
+                print(f"Streaming upload failed ({e}), uploading original file instead")
+        with tracing.span('transcribe', audio_path, tracing.file_size(audio_path)):
+            return self.client.transcribe(FileUpload(audio_path), data)
+    
+    def transcribe_in_chunks(self, audio_path: str, data: Dict, chunk_seconds: float,
+                             chunk_workers: int) -> Optional[Dict]:
+        """
+        Split a long recording at detected silences and transcribe the chunks
+        concurrently, then stitch text, word timestamps and SRT cues back
+        together with global offsets. Returns None when the recording is short
+        enough (or cannot be probed), so the caller sends it in one request.
+        A chunk that still fails after the client's retries is tried once more;
+        if it fails again this also returns None and the whole recording is sent
+        """
+        duration = probe_duration(audio_path)
+        if duration is None or duration <= chunk_seconds * 1.5:
+            return None
+        
+        try:
+            with tracing.span('silence_detect', audio_path):
+                silences = detect_silences(audio_path)
+        except (OSError, RuntimeError) as e:
+            print(f"Silence detection failed ({e}), cutting at fixed intervals")
+            silences = []
+        
+        chunks = plan_chunks(duration, silences, chunk_seconds)
+        print(f"Splitting {duration / 60:.1f} min recording into {len(chunks)} chunks")
+        
+        base_name = Path(audio_path).stem
+        
+        def transcribe_chunk(numbered_chunk):
+            number, (start, end) = numbered_chunk
+            upload = FFmpegUpload(
+                audio_path,
+                upload_name=f"{base_name}_part{number:03d}.{self.encoding['extension']}",
+                start=start,
+                duration=end - start,
+                profile=self.encoding
+            )
+            with tracing.span('transcribe_chunk', upload.upload_name) as span:
+                result = self.client.transcribe(upload, data)
+                span.bytes = upload.encoded_bytes
+            print(f"Chunk {number}/{len(chunks)} done ({start:.0f}s - {end:.0f}s)")
+            return result
+        
+        def try_chunk(numbered_chunk):
+            try:
+                return transcribe_chunk(numbered_chunk)
+            except requests.ReadTimeout:
+                # The chunk reached the API; sending it again could bill it twice
+                raise
+            except (TranscriptionError, StreamingUploadError, requests.RequestException, OSError) as e:
+                print(f"Chunk {numbered_chunk[0]}/{len(chunks)} failed ({e})")
+                return None
+        
+        numbered_chunks = list(enumerate(chunks, 1))
+        with ThreadPoolExecutor(max_workers=max(1, chunk_workers)) as pool:
+            results = list(pool.map(try_chunk, numbered_chunks))
+        
+        for i, result in enumerate(results):
+            if result is None:
+                print(f"Retrying chunk {i + 1}/{len(chunks)}")
+                results[i] = try_chunk(numbered_chunks[i])
+                if results[i] is None:
+                    print("Chunk failed again, transcribing the whole recording instead")
+                    return None
+        
+        return stitch_results(results, [start for start, _ in chunks])
     
     def generate_output_files(self, transcription_result: Dict, base_filename: str, output_dir: str) -> List[str]:
         """
@@ -122,7 +240,9 @@ class ElevenLabsTranscriber:
         
         return output_files
     
-    def process_audio_file(self, audio_path: str, output_base_dir: str = None) -> str:
+    def process_audio_file(self, audio_path: str, output_base_dir: str = None, compress: bool = False,
+                           chunk_seconds: Optional[float] = CHUNK_SECONDS, chunk_workers: int = CHUNK_WORKERS,
+                           diarize: bool = True) -> str:
         """
         Process a single audio file: transcribe and organize outputs
         """
@@ -139,15 +259,20 @@ class ElevenLabsTranscriber:
         output_dir = os.path.join(output_base_dir, base_filename)
         
         # Transcribe audio
-        transcription_result = self.transcribe_audio(audio_path)
+        transcription_result = self.transcribe_audio(
+            audio_path, compress=compress, chunk_seconds=chunk_seconds, chunk_workers=chunk_workers,
+            diarize=diarize
+        )
         
         # Generate output files
-        self.generate_output_files(transcription_result, base_filename, output_dir)
+        with tracing.span('write_outputs', audio_path):
+            self.generate_output_files(transcription_result, base_filename, output_dir)
         
         # Move original audio file to output folder
         destination_path = os.path.join(output_dir, os.path.basename(audio_path))
-        shutil.move(audio_path, destination_path)
-        print(f"Moved original audio to: {destination_path}")
+        with tracing.span('move_original', audio_path, tracing.file_size(audio_path)):
+            method = move_file(audio_path, destination_path)
+        print(f"Moved original audio to: {destination_path} ({method})")
         
         return output_dir
 
@@ -155,6 +280,27 @@ def main():
     parser = argparse.ArgumentParser(description='Transcribe audio files using 11Labs API')
     parser.add_argument('audio_file', help='Path to the audio file to transcribe')
     parser.add_argument('--output-dir', help='Base output directory', default=None)
+    parser.add_argument('--compress', action='store_true',
+                        help='Compress with ffmpeg while uploading (streamed, no temp file)')
+    parser.add_argument('--encoding', choices=list(ENCODING_PROFILES), default=DEFAULT_ENCODING,
+                        help='Codec/bitrate profile used with --compress (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always call the API, ignoring the transcript cache')
+    parser.add_argument('--chunk-seconds', type=float, default=CHUNK_SECONDS,
+                        help='With --no-diarize, split recordings longer than 1.5x this at silences and '
+                             'transcribe the chunks in parallel; 0 disables (default: %(default)s)')
+    parser.add_argument('--no-diarize', action='store_true',
+                        help='Skip speaker labels; allows long recordings to be split into chunks')
+    parser.add_argument('--chunk-workers', type=int, default=CHUNK_WORKERS,
+                        help='Chunks transcribed concurrently (default: %(default)s)')
+    parser.add_argument('--connect-timeout', type=float, default=CONNECT_TIMEOUT,
+                        help='Seconds to wait for the API connection (default: %(default)s)')
+    parser.add_argument('--read-timeout', type=float, default=READ_TIMEOUT,
+                        help='Seconds to wait for the API response (default: %(default)s)')
+    parser.add_argument('--max-retries', type=int, default=MAX_RETRIES,
+                        help='Retries on 429/5xx or dropped connections (default: %(default)s)')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='Write per-stage timing spans to PATH as JSON lines and print a summary')
     
     args = parser.parse_args()
     
@@ -162,14 +308,31 @@ def main():
         print(f"Error: Audio file not found: {args.audio_file}")
         return 1
     
+    if args.profile:
+        tracing.enable(args.profile)
+    
     try:
         # Load API key from api_key.txt
         api_key = load_api_key()
         
-        transcriber = ElevenLabsTranscriber(api_key)
+        transcriber = ElevenLabsTranscriber(
+            api_key,
+            use_cache=not args.no_cache,
+            client_options={
+                'connect_timeout': args.connect_timeout,
+                'read_timeout': args.read_timeout,
+                'max_retries': args.max_retries,
+                'pool_size': max(POOL_SIZE, args.chunk_workers),
+            },
+            encoding=args.encoding
+        )
         # Pass None if no output dir specified, so it uses the default
         output_dir = args.output_dir if args.output_dir else None
-        output_folder = transcriber.process_audio_file(args.audio_file, output_dir)
+        output_folder = transcriber.process_audio_file(
+            args.audio_file, output_dir, compress=args.compress,
+            chunk_seconds=args.chunk_seconds, chunk_workers=args.chunk_workers,
+            diarize=not args.no_diarize
+        )
         print(f"\nProcessing complete! All files saved to: {output_folder}")
         return 0
     except FileNotFoundError as e:
@@ -181,6 +344,11 @@ def main():
     except Exception as e:
         print(f"Error during processing: {str(e)}")
         return 1
+    finally:
+        tracer = tracing.disable()
+        if tracer is not None:
+            print(f"\nProfile ({args.profile}):")
+            print(tracer.format_summary())
 
 if __name__ == "__main__":
     exit(main())
\ No newline at end of file
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+转录文本全文索引
+SQLite FTS5索引 Voice Recordings Backup/YYYY/MM/DD 下的转录备份（Markdown）。
+FTS5自带的分词器把连续的中文当作一个词，这里在写入前把每个中日韩字符拆成单独的词，
+查询时把中文词转成相邻字符的短语查询，任意长度的中文词都能匹配。
+每次保存转录时增量更新；已有的备份用 build() 一次性补建，之后只处理有变化的文件
+"""
+
+import os
+import re
+import html
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+INDEX_FILE = '.transcript_index.db'
+
+# 中日韩统一表意文字（含扩展A和兼容区）、日文假名、韩文音节
+CJK_CHARS = '぀-ヿ㐀-䶿一-鿿가-힯豈-﫿'
+CJK_CHAR = re.compile(f'([{CJK_CHARS}])')
+# 分词时插在中文字符两侧的分隔符：unicode61把控制字符当作分隔，正文中不会出现，生成摘要时原样去掉
+TOKEN_SEPARATOR = '\x1f'
+DATE_DIR = re.compile(r'^(\d{4})/(\d{2})/(\d{2})$')
+
+# 摘要中命中部分的临时标记，转义HTML后替换为<mark>
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 48  # 摘要长度（按词计，中文即字数）
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    id          INTEGER PRIMARY KEY,
+    path        TEXT UNIQUE NOT NULL,
+    date        TEXT,
+    file        TEXT NOT NULL,
+    mtime       REAL NOT NULL,
+    size        INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS transcripts USING fts5(
+    body,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+'''
+
+
+def segment(text: str) -> str:
+    """每个中日韩字符两侧加分隔符，使其成为单独的词；其他文字交给unicode61分词"""
+    return CJK_CHAR.sub(f'{TOKEN_SEPARATOR}\\1{TOKEN_SEPARATOR}', text)
+
+
+def build_query(query: str) -> Optional[str]:
+    """
+    把用户输入转为FTS5查询：空格分隔的每个词都必须出现（AND），
+    每个词作为短语查询，中文词拆成相邻字符，等同于子串匹配
+    """
+    phrases = []
+    for word in query.split():
+        tokens = segment(word).replace(TOKEN_SEPARATOR, ' ').split()
+        if tokens:
+            phrases.append('"' + ' '.join(tokens).replace('"', '""') + '"')
+    return ' '.join(phrases) or None
+
+
+def parse_transcript_markdown(content: str) -> Dict[str, str]:
+    """从save_transcript_backup写出的Markdown中取出文件名和转录正文"""
+    file_match = re.search(r'^# (.+)$', content, re.MULTILINE)
+    body_match = re.search(r'^## 转录内容\n(.*?)(?=^## 元数据|\Z)', content, re.MULTILINE | re.DOTALL)
+    return {
+        'file': file_match.group(1).strip() if file_match else '',
+        'transcript': (body_match.group(1) if body_match else content).strip(),
+    }
+
+
+class TranscriptIndex:
+    """backup_root 下的转录索引；同一个数据库可由多个进程同时读写（WAL）"""
+
+    def __init__(self, backup_root: Path):
+        self.root = Path(backup_root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / INDEX_FILE), check_same_thread=False,
+                                     isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _relative(self, md_path: Path) -> str:
+        return Path(md_path).resolve().relative_to(self.root.resolve()).as_posix()
+
+    @staticmethod
+    def _date_of(relative_path: str) -> Optional[str]:
+        match = DATE_DIR.match(os.path.dirname(relative_path))
+        return '-'.join(match.groups()) if match else None
+
+    def _upsert(self, relative_path: str, file: str, transcript: str, mtime: float, size: int):
+        """写入或替换一个文档，调用方需持有锁"""
+        row = self._conn.execute('SELECT id FROM documents WHERE path = ?', (relative_path,)).fetchone()
+        if row:
+            doc_id = row[0]
+            self._conn.execute('DELETE FROM transcripts WHERE rowid = ?', (doc_id,))
+            self._conn.execute(
+                'UPDATE documents SET file = ?, mtime = ?, size = ? WHERE id = ?',
+                (file, mtime, size, doc_id)
+            )
+        else:
+            doc_id = self._conn.execute(
+                'INSERT INTO documents (path, date, file, mtime, size) VALUES (?, ?, ?, ?, ?)',
+                (relative_path, self._date_of(relative_path), file, mtime, size)
+            ).lastrowid
+        self._conn.execute('INSERT INTO transcripts (rowid, body) VALUES (?, ?)', (doc_id, segment(transcript)))
+
+    def add(self, md_path: Path, file: str, transcript: str):
+        """保存转录备份后调用：索引（或重新索引）这一个文件"""
+        stat = os.stat(md_path)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._upsert(self._relative(md_path), file, transcript, stat.st_mtime, stat.st_size)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def build(self) -> Dict[str, int]:
+        """
+        扫描备份目录补建索引：新增或有变化（修改时间/大小不同）的文件重新索引，已删除的移出索引。
+        返回 {'indexed': N, 'unchanged': N, 'removed': N}
+        """
+        with self._lock:
+            known = {path: (mtime, size) for path, mtime, size in
+                     self._conn.execute('SELECT path, mtime, size FROM documents')}
+
+        seen = set()
+        changed = []
+        for md_path in self.root.glob('[0-9][0-9][0-9][0-9]/[0-9][0-9]/[0-9][0-9]/*.md'):
+            relative_path = md_path.relative_to(self.root).as_posix()
+            seen.add(relative_path)
+            try:
+                stat = md_path.stat()
+            except OSError:
+                continue
+            if known.get(relative_path) != (stat.st_mtime, stat.st_size):
+                changed.append((md_path, relative_path, stat))
+
+        removed = [path for path in known if path not in seen]
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for md_path, relative_path, stat in changed:
+                    try:
+                        parsed = parse_transcript_markdown(md_path.read_text(encoding='utf-8'))
+                    except (OSError, UnicodeDecodeError):
+                        continue
+                    self._upsert(relative_path, parsed['file'] or md_path.name, parsed['transcript'],
+                                 stat.st_mtime, stat.st_size)
+                for relative_path in removed:
+                    row = self._conn.execute('SELECT id FROM documents WHERE path = ?', (relative_path,)).fetchone()
+                    self._conn.execute('DELETE FROM transcripts WHERE rowid = ?', (row[0],))
+                    self._conn.execute('DELETE FROM documents WHERE id = ?', (row[0],))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return {'indexed': len(changed), 'unchanged': len(seen) - len(changed), 'removed': len(removed)}
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """按相关度（bm25）返回 [{file, date, path, snippet, score}]，snippet 中命中部分用<mark>标出"""
+        match = build_query(query)
+        if match is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                '''SELECT d.file, d.date, d.path,
+                          snippet(transcripts, 0, ?, ?, '…', ?),
+                          bm25(transcripts)
+                   FROM transcripts JOIN documents d ON d.id = transcripts.rowid
+                   WHERE transcripts MATCH ?
+                   ORDER BY bm25(transcripts)
+                   LIMIT ? OFFSET ?''',
+                (MARK_START, MARK_END, SNIPPET_TOKENS, match, limit, offset)
+            ).fetchall()
+        results = []
+        for file, date, path, snippet, score in rows:
+            snippet = html.escape(snippet.replace(TOKEN_SEPARATOR, '').strip())
+            results.append({
+                'file': file,
+                'date': date,
+                'path': path,
+                'snippet': snippet.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'),
+                'score': round(-score, 4),
+            })
+        return results
+
+
+def main():
+    # 与工作流默认的备份目录一致
+    default_root = Path(__file__).parent.parent.parent / 'Voice Recordings Backup'
+    parser = argparse.ArgumentParser(description='建立或查询转录备份的全文索引')
+    parser.add_argument('query', nargs='?', help='要搜索的内容（省略则只更新索引）')
+    parser.add_argument('--root', default=str(default_root), help='备份目录 (默认: %(default)s)')
+    parser.add_argument('--limit', type=int, default=20, help='最多显示的结果数 (默认: %(default)s)')
+    args = parser.parse_args()
+
+    index = TranscriptIndex(args.root)
+    started_at = time.time()
+    stats = index.build()
+    print(f"✓ 索引已更新：新增/更新 {stats['indexed']} 个，未变化 {stats['unchanged']} 个，"
+          f"移除 {stats['removed']} 个（{time.time() - started_at:.2f} 秒）")
+
+    if args.query:
+        started_at = time.time()
+        results = index.search(args.query, limit=args.limit)
+        print(f"\n找到 {len(results)} 条结果（{(time.time() - started_at) * 1000:.1f} 毫秒）")
+        for result in results:
+            snippet = result['snippet'].replace('<mark>', '【').replace('</mark>', '】')
+            print(f"\n{result['date']}  {result['file']}\n  {html.unescape(snippet)}")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Pooled HTTP client for the 11Labs speech-to-text API
+One persistent session (keep-alive connection pool) shared by every
+transcription entry point, with connect/read timeouts and jittered
+exponential backoff on 429/5xx and dropped connections. Read timeouts are
+not retried by default: the upload already reached the API, and sending it
+again could transcribe and bill the same audio twice
+"""
+
+import time
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import API_RESPONSES
+from streaming_upload import post_multipart
+
+DEFAULT_API_URL = "https://api.elevenlabs.io/v1/speech-to-text"
+
+CONNECT_TIMEOUT = 10.0  # seconds to establish the connection
+READ_TIMEOUT = 600.0  # seconds to wait for the response; long recordings take a while
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0  # first retry waits up to this many seconds
+BACKOFF_MAX = 60.0  # cap for both computed backoff and Retry-After
+POOL_SIZE = 8  # keep-alive connections kept per host
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TranscriptionError(Exception):
+    """The API answered with a non-success status"""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"API Error: {status_code} - {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delay-seconds or an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class TranscriptionClient:
+    def __init__(self, api_key: str, api_url: str = DEFAULT_API_URL,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT,
+                 max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE,
+                 backoff_max: float = BACKOFF_MAX,
+                 pool_size: int = POOL_SIZE,
+                 retry_read_timeouts: bool = False):
+        self.api_url = api_url
+        self.headers = {
+            "xi-api-key": api_key
+        }
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_read_timeouts = retry_read_timeouts
+
+        # Retries are handled here (bodies are streamed and must be rebuilt
+        # per attempt), so the adapter itself never retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given 0-based attempt"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, upload, params: Dict[str, str]) -> requests.Response:
+        """
+        POST the upload source with form params, retrying on 429/5xx and
+        connection failures (read timeouts only with retry_read_timeouts).
+        The upload is reopened for every attempt.
+        Returns the final response, whatever its status
+        """
+        attempt = 0
+        while True:
+            try:
+                response = post_multipart(
+                    self.api_url, self.headers, params, upload,
+                    session=self.session, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                API_RESPONSES.inc(status=e.__class__.__name__)
+                if isinstance(e, requests.ReadTimeout) and not self.retry_read_timeouts:
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                print(f"Request failed ({e.__class__.__name__}), retrying in {delay:.1f}s "
+                      f"({attempt + 1}/{self.max_retries})")
+            else:
+                API_RESPONSES.inc(status=str(response.status_code))
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if retry_after is not None:
+                    delay = min(retry_after, self.backoff_max)
+                else:
+                    delay = self.backoff_delay(attempt)
+                print(f"API returned {response.status_code}, retrying in {delay:.1f}s "
+                      f"({attempt + 1}/{self.max_retries})")
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def transcribe(self, upload, params: Dict[str, str]) -> Dict:
+        """
+        Transcribe an upload source, returning the parsed JSON result.
+        Raises TranscriptionError on a non-200 response
+        """
+        response = self.post(upload, params)
+        if response.status_code == 200:
+            return response.json()
+        raise TranscriptionError(response.status_code, response.text)
+
+    def close(self):
+        self.session.close()
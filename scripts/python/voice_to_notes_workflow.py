@@ -5,88 +5,142 @@ Voice to Apple Notes Workflow
 """
 
 import os
+import re
 import sys
 import json
 import time
-import shutil
+import tempfile
+import threading
 import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional
 import argparse
 
+import requests
+
 # 添加Python脚本目录到路径
 sys.path.append(str(Path(__file__).parent))
 
+# 命令行快速路径：有常驻进程（--serve）时直接把文件交给它，不必导入下面的模块
+if __name__ == "__main__":
+    from workflow_ipc import forward_cli
+    _exit_code = forward_cli(sys.argv[1:])
+    if _exit_code is not None:
+        sys.exit(_exit_code)
+
 # 导入现有的转录模块
 from transcribe_audio import ElevenLabsTranscriber, load_api_key
+from audio_probe import is_upload_ready, probe_audio
+import audio_metadata
+from inbox_watcher import BATCH_WINDOW, SETTLE_SECONDS, InboxWatcher
+from workflow_ipc import SOCKET_ENV, WorkflowServer, default_socket_path
+from disk_cache import CompressedAudioCache
+from file_transfer import copy_file, move_file
+from backup_store import BackupStore
+from batch_journal import JOURNAL_DIR, BatchJournal
+from transcript_index import TranscriptIndex
+from streaming_upload import (
+    DEFAULT_ENCODING, ENCODING_PROFILES, FFmpegUpload, FileUpload, StreamingUploadError,
+    compress_params, ffmpeg_compress_command, get_encoding
+)
+from notes_sync import NotesSyncWaiter
+from notes_delivery import OrderedDelivery
+from metrics import STAGE_SECONDS
+import tracing
+from transcription_client import (
+    CONNECT_TIMEOUT, MAX_RETRIES, POOL_SIZE, READ_TIMEOUT, TranscriptionError
+)
 
 # 配置常量
-MIN_SYNC_TIME = 45  # 最小同步等待时间（秒）
+MIN_SYNC_TIME = 45  # 同步等待的最长时间（秒），就绪探针报告就绪后提前结束
 BACKUP_ROOT = "Voice Recordings Backup"
 COMPRESSED_SUFFIX = "_compressed"
 PROJECT_ROOT = Path(__file__).parent.parent.parent  # 项目根目录
 
+# 流水线阶段及各阶段默认并发数
+PIPELINE_STAGES = ('compress', 'transcribe', 'backup')
+DEFAULT_CONCURRENCY = {
+    'compress': 2,    # FFmpeg压缩（CPU密集）
+    'transcribe': 4,  # API上传与转录（网络等待为主）
+    'backup': 2,      # 本地备份复制（磁盘IO）
+}
+
+# 网页上传保存文件时添加的前缀："<13位毫秒时间戳>_<6位随机十六进制>_"（旧版本没有随机部分）
+UPLOAD_PREFIX = re.compile(r'^\d{13}_(?:[0-9a-f]{6}_)?')
+
+# 单个文件经历的状态，通过 on_stage(audio_file, stage) 回调通知调用方
+FILE_STAGES = ('queued', 'compressing', 'transcribing', 'backing_up', 'appending', 'done', 'failed')
+
 class VoiceToNotesWorkflow:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, concurrency: Optional[Dict[str, int]] = None,
+                 stream_upload: bool = True, use_cache: bool = True,
+                 client_options: Optional[Dict] = None,
+                 notes_probe: Optional[Callable[[], bool]] = None,
+                 sync_timeout: float = MIN_SYNC_TIME,
+                 on_stage: Optional[Callable[[str, str], None]] = None,
+                 backup_root: Optional[str] = None,
+                 disposable_inputs: bool = False,
+                 journal_dir: Optional[str] = None,
+                 encoding: str = DEFAULT_ENCODING):
         self.api_key = api_key
-        self.transcriber = ElevenLabsTranscriber(api_key)
+        # 上传用的编码配置（编码器、码率、采样率、容器），上传的MIME类型随之确定
+        self.encoding = get_encoding(encoding)
+        # 输入文件处理后会被删除（如网页上传的临时文件）时，备份直接移动而不是复制
+        self.disposable_inputs = disposable_inputs
+        # 本地备份根目录，默认为项目目录下的 BACKUP_ROOT
+        self.backup_root = Path(backup_root) if backup_root else PROJECT_ROOT / BACKUP_ROOT
+        # 每个文件进入新阶段时调用 on_stage(audio_file, stage)，stage 取自 FILE_STAGES
+        self.on_stage = on_stage
+        # Apple Notes同步就绪探针（默认通过osascript探测），以及最长等待时间
+        self.notes_probe = notes_probe
+        self.sync_timeout = sync_timeout
+        # 流式上传：FFmpeg输出直接写入上传请求，不落地临时文件
+        self.stream_upload = stream_upload
         self.start_time = None
+        self.concurrency = dict(DEFAULT_CONCURRENCY)
+        if concurrency:
+            self.concurrency.update(concurrency)
+        # 连接池至少要容纳所有并发转录线程
+        client_options = dict(client_options or {})
+        client_options.setdefault('pool_size', max(POOL_SIZE, self.concurrency['transcribe']))
+        self.transcriber = ElevenLabsTranscriber(
+            api_key, use_cache=use_cache, client_options=client_options, encoding=self.encoding['name']
+        )
+        # 与ElevenLabsTranscriber共用同一个连接池客户端
+        self.client = self.transcriber.client
+        # 转录缓存：同一录音重复提交时直接返回已有转录
+        self.cache = self.transcriber.cache
+        # 压缩缓存：重试和重跑时跳过FFmpeg
+        self.compressed_cache = CompressedAudioCache(suffix='.' + self.encoding['extension']) if use_cache else None
+        self.passthrough_count = 0
+        self._stats_lock = threading.Lock()
+        # 备份存储：音频按内容去重，文件名分配通过索引完成（并发备份之间由索引事务互斥）
+        self.backup_store = BackupStore(self.backup_root)
+        # 转录全文索引，每次保存转录备份时增量更新
+        self.transcript_index = TranscriptIndex(self.backup_root)
+        # 批处理阶段日志目录：中断的批次重新运行时从日志中的阶段继续
+        self.journal_dir = Path(journal_dir) if journal_dir else JOURNAL_DIR
         
     def extract_date_from_file(self, file_path: str) -> datetime:
         """
         从文件中提取日期
-        优先级：1. 文件名中的日期 2. 文件创建时间
+        优先级：1. 文件名中的日期 2. 录音文件内嵌的创建时间 3. 文件创建时间
         """
-        # 尝试从文件名提取日期 (假设格式如: recording_20250716_143025.m4a)
-        import re
-        filename = Path(file_path).stem
-        
-        # 尝试匹配各种日期格式
-        patterns = [
-            r'(\d{4})(\d{2})(\d{2})',  # YYYYMMDD
-            r'(\d{4})-(\d{2})-(\d{2})',  # YYYY-MM-DD
-            r'(\d{4})_(\d{2})_(\d{2})',  # YYYY_MM_DD
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, filename)
-            if match:
-                year, month, day = match.groups()
-                try:
-                    # 验证日期是否有效
-                    date = datetime(int(year), int(month), int(day))
-                    # 确保日期在合理范围内（2000年到2100年）
-                    if 2000 <= date.year <= 2100:
-                        return date
-                except ValueError:
-                    # 日期无效，继续尝试其他模式
-                    continue
-        
-        # 如果文件名中没有日期，使用文件创建时间
-        stat = os.stat(file_path)
-        # 在macOS上，使用birthtime（创建时间）
-        creation_time = stat.st_birthtime if hasattr(stat, 'st_birthtime') else stat.st_mtime
-        return datetime.fromtimestamp(creation_time)
+        return audio_metadata.scan(file_path)['date']
     
     def compress_audio(self, input_path: str, output_path: str) -> bool:
         """
         使用FFmpeg压缩音频文件
         """
-        cmd = [
-            'ffmpeg',
-            '-i', input_path,
-            '-vn',  # 仅提取音频
-            '-acodec', 'mp3',
-            '-ab', '32k',  # 32kbps比特率
-            '-ar', '16000',  # 16kHz采样率
-            '-ac', '1',  # 单声道
-            '-y',  # 覆盖输出文件
-            output_path
-        ]
+        # 按编码配置压缩（默认 32kbps / 16kHz / 单声道 MP3）
+        cmd = ffmpeg_compress_command(input_path, output_path, profile=self.encoding)
         
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            with tracing.span('compress', input_path) as span:
+                result = subprocess.run(cmd, capture_output=True, text=True)
+                span.bytes = tracing.file_size(output_path)
             if result.returncode == 0:
                 print(f"✓ 压缩成功: {Path(output_path).name}")
                 return True
@@ -109,7 +163,8 @@ class VoiceToNotesWorkflow:
         '''
         
         try:
-            subprocess.run(['osascript', '-e', script], capture_output=True)
+            with tracing.span('osascript_activate'):
+                subprocess.run(['osascript', '-e', script], capture_output=True)
             print("✓ Apple Notes已激活，开始同步...")
         except Exception as e:
             print(f"✗ 激活Apple Notes失败: {str(e)}")
@@ -129,43 +184,106 @@ class VoiceToNotesWorkflow:
         month = date.strftime("%m")
         day = date.strftime("%d")
         
-        backup_dir = PROJECT_ROOT / BACKUP_ROOT / year / month / day
-        backup_dir.mkdir(parents=True, exist_ok=True)
+        backup_dir = self.backup_root / year / month / day
+        with tracing.span('backup_mkdir'):
+            backup_dir.mkdir(parents=True, exist_ok=True)
         
         return str(backup_dir)
     
-    def transcribe_audio_simple(self, audio_path: str) -> str:
+    # 纯文本转录的请求参数：不需要SRT格式和说话人识别
+    SIMPLE_TRANSCRIBE_DATA = {
+        'model_id': 'scribe_v1',
+        'diarize': 'false'  # 不需要说话人识别
+    }
+    
+    def transcribe_audio_simple(self, audio_path: str, upload_name: str = None) -> str:
         """
         转录音频，只返回纯文本（无时间戳）
+        文件按块流式读取上传，不会整个读入内存
         """
-        print(f"正在转录: {Path(audio_path).name}")
+        upload = FileUpload(audio_path, content_type=self.encoding['mime_type'], upload_name=upload_name)
+        print(f"正在转录: {upload.upload_name}")
         
-        import requests
+        with tracing.span('transcribe', upload.upload_name, tracing.file_size(audio_path)):
+            return self._request_transcript(upload)
+    
+    def transcribe_audio_streaming(self, audio_path: str) -> str:
+        """
+        边压缩边上传：FFmpeg的stdout直接作为上传请求体，不写临时文件
+        启用压缩缓存时同时把压缩结果写入缓存，供重试和重跑使用
+        FFmpeg失败或连接中断时抛出异常，由调用方回退到临时文件方式
+        """
+        print(f"正在转录（流式）: {Path(audio_path).name}")
         
-        with open(audio_path, 'rb') as audio_file:
-            files = {
-                'file': (os.path.basename(audio_path), audio_file, 'audio/mpeg')
-            }
-            
-            # 修改配置：不需要SRT格式和说话人识别
-            data = {
-                'model_id': 'scribe_v1',
-                'diarize': 'false'  # 不需要说话人识别
-            }
-            
-            response = requests.post(
-                self.transcriber.api_url,
-                headers=self.transcriber.headers,
-                data=data,
-                files=files
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get('text', '')
-            else:
-                print(f"API错误: {response.status_code} - {response.text}")
-                return ""
+        upload = FFmpegUpload(audio_path, profile=self.encoding)
+        key = None
+        if self.compressed_cache is not None:
+            try:
+                key = self.compressed_cache.key_for(audio_path, compress_params(self.encoding))
+                upload.tee_path = self.compressed_cache.staging_path(key)
+            except OSError as e:
+                print(f"⚠️ 压缩缓存不可用: {str(e)}")
+        
+        try:
+            with tracing.span('transcribe_streaming', audio_path) as span:
+                transcript = self._request_transcript(upload, streaming=True)
+                span.bytes = upload.encoded_bytes
+            if upload.encode_seconds is not None:
+                # 流式模式下压缩在转录阶段内进行，单独记录编码时间，便于判断瓶颈是否在压缩
+                # （FFmpeg的输出随上传读取，编码时间包含等待网络的时间）
+                STAGE_SECONDS.observe(upload.encode_seconds, stage='compress_streaming')
+            if upload.tee_complete:
+                # 转录已经付费，写缓存失败（磁盘满、权限）不能让调用方回退重新上传
+                try:
+                    self.compressed_cache.put(key, upload.tee_path, upload.encode_seconds or 0.0)
+                except OSError as e:
+                    print(f"⚠️ 写入压缩缓存失败: {str(e)}")
+                    self._remove_temp_file(upload.tee_path)
+            return transcript
+        finally:
+            if upload.tee_path and not upload.tee_complete:
+                self._remove_temp_file(upload.tee_path)
+    
+    def _request_transcript(self, upload, streaming: bool = False) -> str:
+        """
+        通过共享的连接池客户端上传（429/5xx自动退避重试），返回转录文本
+        """
+        try:
+            result = self.client.transcribe(upload, dict(self.SIMPLE_TRANSCRIBE_DATA))
+        except TranscriptionError as e:
+            if streaming and e.status_code == 411:
+                # 服务端不接受分块传输编码
+                raise StreamingUploadError("服务器不支持分块上传 (411)")
+            print(f"API错误: {e.status_code} - {e.body}")
+            return ""
+        return result.get('text', '')
+    
+    def get_cached_transcript(self, audio_path: str) -> Optional[str]:
+        """
+        按原始音频内容查询转录缓存，命中时连压缩和上传都可以跳过
+        """
+        if self.cache is None:
+            return None
+        try:
+            cached = self.cache.get(audio_path, self.SIMPLE_TRANSCRIBE_DATA)
+        except OSError as e:
+            print(f"⚠️ 读取转录缓存失败: {str(e)}")
+            return None
+        if cached and cached.get('text'):
+            print(f"✓ 命中转录缓存: {Path(audio_path).name}")
+            return cached['text']
+        return None
+    
+    def cache_transcript(self, audio_path: str, transcript: str):
+        """
+        保存转录结果到缓存（键为原始音频内容 + 请求参数）
+        """
+        if self.cache is None:
+            return
+        try:
+            self.cache.put(audio_path, self.SIMPLE_TRANSCRIBE_DATA, {'text': transcript})
+        except OSError as e:
+            print(f"⚠️ 写入转录缓存失败: {str(e)}")
     
     def check_or_create_note(self, note_title: str) -> bool:
         """
@@ -179,7 +297,8 @@ class VoiceToNotesWorkflow:
         ]
         
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            with tracing.span('osascript_check_note'):
+                result = subprocess.run(cmd, capture_output=True, text=True)
             if result.returncode == 0:
                 status = result.stdout.strip()
                 if status == "created":
@@ -203,7 +322,7 @@ class VoiceToNotesWorkflow:
             return False
         
         # 处理文本中的特殊字符
-        escaped_transcript = transcript.replace('"', '\\"').replace('\n', '<br>')
+        escaped_transcript = self.escape_for_notes(transcript)
         
         # 如果提供了备份文件名，使用它；否则从audio_path提取
         if backup_filename:
@@ -224,7 +343,8 @@ class VoiceToNotesWorkflow:
         ]
         
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            with tracing.span('osascript_append', audio_path):
+                result = subprocess.run(cmd, capture_output=True, text=True)
             if result.returncode == 0 and result.stdout.strip() == "success":
                 print(f"✓ 已添加到笔记: {note_title}")
                 return True
@@ -235,6 +355,119 @@ class VoiceToNotesWorkflow:
             print(f"✗ 错误: {str(e)}")
             return False
     
+    @staticmethod
+    def escape_for_notes(transcript: str) -> str:
+        """
+        处理转录文本中的特殊字符，换行转为<br>
+        """
+        return transcript.replace('"', '\\"').replace('\n', '<br>')
+    
+    @STAGE_SECONDS.timed(stage='notes_append')
+    def append_batch_to_apple_notes(self, entries: List[Dict]) -> List[bool]:
+        """
+        批量写入Apple Notes：所有条目写入清单文件，只调用一次osascript
+        entries 按在笔记中从上到下的顺序排列，返回每个条目是否成功
+        """
+        if not entries:
+            return []
+        
+        def clean(value: str) -> str:
+            # 清单以制表符分隔字段、换行分隔条目
+            return value.replace('\t', ' ').replace('\r', '').replace('\n', '<br>')
+        
+        temp_dir = PROJECT_ROOT / "temp"
+        temp_dir.mkdir(exist_ok=True)
+        fd, manifest_path = tempfile.mkstemp(prefix='notes_batch_', suffix='.txt', dir=str(temp_dir))
+        
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for index, entry in enumerate(entries):
+                    f.write('\t'.join([
+                        str(index),
+                        clean(entry['note_title']),
+                        clean(entry.get('backup_filename') or Path(entry.get('compressed_audio') or '').name),
+                        clean(self.escape_for_notes(entry['transcript'])),
+                        clean(entry.get('after') or '')
+                    ]) + '\n')
+            
+            cmd = [
+                'osascript',
+                str(PROJECT_ROOT / 'scripts' / 'applescript' / 'notes_simple_audio.applescript'),
+                'batch_append',
+                manifest_path
+            ]
+            with tracing.span('osascript_batch_append', bytes_=tracing.file_size(manifest_path)):
+                result = subprocess.run(cmd, capture_output=True, text=True)
+        except Exception as e:
+            print(f"✗ 批量写入失败: {str(e)}")
+            return [False] * len(entries)
+        finally:
+            self._remove_temp_file(manifest_path)
+        
+        if result.returncode != 0:
+            print(f"✗ 批量写入失败: {result.stderr or result.stdout}")
+            return [False] * len(entries)
+        
+        # 解析每个条目的结果：序号<TAB>success 或 序号<TAB>Error: 原因
+        statuses = {}
+        for line in result.stdout.splitlines():
+            index, sep, status = line.partition('\t')
+            if sep and index.strip().isdigit():
+                statuses[int(index)] = status.strip()
+        
+        succeeded = []
+        for index, entry in enumerate(entries):
+            status = statuses.get(index, '无返回结果')
+            label = entry.get('backup_filename') or entry['note_title']
+            if status == 'success':
+                print(f"✓ 已添加到笔记: {entry['note_title']} ({label})")
+                succeeded.append(True)
+            else:
+                print(f"✗ 添加失败: {entry['note_title']} ({label}): {status}")
+                succeeded.append(False)
+        
+        return succeeded
+    
+    def skip_written_entries(self, journal: BatchJournal, entries: List[Dict]) -> List[Dict]:
+        """
+        上次运行在写入笔记途中退出的条目（日志中只有写入意图、没有结果），
+        先检查笔记中是否已有同名条目，已有的记为已写入，返回仍需写入的条目
+        """
+        in_doubt = {}
+        for entry in entries:
+            if journal.state(entry['audio_file']).get('notes') == 'appending':
+                in_doubt.setdefault(entry['note_title'], []).append(entry)
+        if not in_doubt:
+            return entries
+        
+        written = set()
+        for note_title, note_entries in in_doubt.items():
+            cmd = [
+                'osascript',
+                str(PROJECT_ROOT / 'scripts' / 'applescript' / 'notes_simple_audio.applescript'),
+                'find_entries',
+                note_title
+            ] + [entry['backup_filename'] for entry in note_entries]
+            try:
+                with tracing.span('osascript_find_entries'):
+                    result = subprocess.run(cmd, capture_output=True, text=True)
+            except Exception as e:
+                print(f"⚠️ 无法检查笔记中已有的条目: {str(e)}")
+                continue
+            if result.returncode != 0 or result.stdout.startswith('Error'):
+                print(f"⚠️ 无法检查笔记中已有的条目: {result.stderr or result.stdout}")
+                continue
+            present = set(line.strip() for line in result.stdout.splitlines())
+            for entry in note_entries:
+                if entry['backup_filename'] in present:
+                    written.add(entry['audio_file'])
+                    print(f"✓ 笔记中已有该条目，不再重复写入: {note_title} ({entry['backup_filename']})")
+        
+        self._journal_record_many(journal, [(audio_file, 'appended', {}) for audio_file in written])
+        for audio_file in written:
+            self.report_stage(audio_file, 'done')
+        return [entry for entry in entries if entry['audio_file'] not in written]
+    
     def save_transcript_backup(self, backup_dir: str, filename: str, transcript: str):
         """
         保存转录文本的本地备份（Markdown格式）
@@ -253,10 +486,19 @@ class VoiceToNotesWorkflow:
 - 转录时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 """
         
-        with open(md_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        data = content.encode('utf-8')
+        with tracing.span('transcript_backup', filename, len(data)):
+            with open(md_path, 'wb') as f:
+                f.write(data)
         
         print(f"✓ 转录备份已保存: {md_filename}")
+        
+        # 更新全文索引，失败不影响备份
+        try:
+            with tracing.span('transcript_index', filename):
+                self.transcript_index.add(md_path, filename, transcript)
+        except Exception as e:
+            print(f"⚠️ 更新搜索索引失败: {str(e)}")
     
     def process_audio_files(self, audio_files: List[str]):
         """
@@ -266,137 +508,587 @@ class VoiceToNotesWorkflow:
         
         print(f"\n开始处理 {len(audio_files)} 个音频文件...")
         
-        # 1. 激活Apple Notes开始同步
-        self.activate_apple_notes()
+        # 1. 激活Apple Notes开始同步，就绪探测在后台与转录同时进行
+        sync_waiter = NotesSyncWaiter(
+            probe=self.notes_probe,
+            max_wait=self.sync_timeout
+        ).start(before=self.activate_apple_notes)
+        
+        for audio_file in audio_files:
+            self.report_stage(audio_file, 'queued')
+        
+        # 2. 打开本批次的阶段日志：同一批文件上次处理中断时，已完成的阶段直接使用日志中的结果
+        journal = BatchJournal.open(audio_files, self.journal_dir)
+        if journal.resumed:
+            print("♻️ 继续上次中断的批次，已完成的阶段不再重复")
         
-        # 2. 按日期组织文件
+        # 3. 读取元数据（每个文件只stat一次并读取文件头中的录音时间），按日期组织文件
         files_by_date = {}
         for audio_file in audio_files:
             try:
-                date = self.extract_date_from_file(audio_file)
-                date_key = date.strftime('%Y-%m-%d')
+                backed_up = journal.state(audio_file).get('backed_up')
+                if backed_up:
+                    # 已备份的文件使用日志中的日期（原始文件可能已被移入备份目录）
+                    metadata = {
+                        'date': datetime.fromisoformat(backed_up['date']),
+                        'recorded_at': datetime.fromisoformat(backed_up['recorded_at']),
+                    }
+                else:
+                    with tracing.span('metadata_scan', file=audio_file):
+                        metadata = audio_metadata.scan(audio_file)
+                date_key = metadata['date'].strftime('%Y-%m-%d')
                 if date_key not in files_by_date:
                     files_by_date[date_key] = []
-                files_by_date[date_key].append((audio_file, date))
+                files_by_date[date_key].append((audio_file, metadata))
                 print(f"✓ 文件 {Path(audio_file).name} -> 日期 {date_key}")
             except Exception as e:
                 print(f"✗ 无法处理文件 {Path(audio_file).name}: {str(e)}")
+                self.report_stage(audio_file, 'failed')
                 continue
         
-        # 3. 处理每个日期的文件
-        all_results = []
-        
+        # 4. 按日期和录音时间正序排列（最早的先处理），交给流水线并发处理
+        jobs = []
         for date_key, file_list in files_by_date.items():
-            print(f"\n处理日期: {date_key}")
+            file_list.sort(key=lambda x: x[1]['recorded_at'])
+            print(f"\n处理日期: {date_key} ({len(file_list)} 个文件)")
+            for audio_file, metadata in file_list:
+                jobs.append({
+                    'audio_file': audio_file,
+                    'date': metadata['date'],
+                    'recorded_at': metadata['recorded_at'],
+                    'journal': journal,
+                    'resume': journal.state(audio_file),
+                })
+        
+        # 5. 流水线每完成一个文件就交给写入线程：同一笔记中排在它前面的条目都完成后立即写入Apple Notes，
+        #    不必等整批文件转录完成；第一次写入前等待同步就绪
+        delivery = OrderedDelivery([self.format_date_for_notes(job['date']) for job in jobs])
+        notes_writer = threading.Thread(
+            target=self.deliver_to_notes,
+            args=(delivery, journal, sync_waiter),
+            name='vtn-notes',
+            daemon=True
+        )
+        notes_writer.start()
+        
+        def on_result(index: int, result: Optional[Dict]):
+            if result is None:
+                self.report_stage(jobs[index]['audio_file'], 'failed')
+            delivery.resolve(index, result)
+        
+        try:
+            self.run_pipeline(jobs, on_result=on_result)
+        finally:
+            notes_writer.join()
+        if not journal.complete(audio_files):
+            print("⚠️ 部分文件未完成，用同样的文件重新运行会从中断处继续")
+        
+        if self.cache is not None:
+            stats = self.cache.stats()
+            print(f"\n转录缓存: 命中 {stats['hits']} 次，未命中 {stats['misses']} 次")
+        if self.compressed_cache is not None:
+            stats = self.compressed_cache.stats()
+            print(f"压缩缓存: 命中 {stats['hits']} 次，节省编码时间 {stats['encode_seconds_saved']:.1f} 秒")
+        if self.passthrough_count:
+            print(f"直接上传（无需压缩）: {self.passthrough_count} 个文件")
+        
+        # 每批结束时输出本批次的性能汇总并清空（--watch / --serve 常驻时不必等到进程退出）
+        tracer = tracing.active()
+        if tracer is not None:
+            print(f"\n各阶段耗时（详细记录: {tracer.path}）:")
+            print(tracer.format_summary())
+            tracer.reset()
+        
+        print("\n✓ 所有处理完成！")
+    
+    def wait_for_notes_sync(self, sync_waiter: NotesSyncWaiter):
+        """
+        等待Apple Notes同步就绪（最多等待sync_timeout秒，从激活Notes时算起）
+        """
+        if not sync_waiter.is_ready():
+            print(f"\n等待Apple Notes同步就绪（最多 {max(0.0, self.sync_timeout - sync_waiter.elapsed()):.1f} 秒）...")
+        with STAGE_SECONDS.time(stage='sync_wait'):
+            sync_ready = sync_waiter.wait()
+        if sync_ready:
+            print(f"✓ Apple Notes同步就绪（用时 {sync_waiter.elapsed():.1f} 秒）")
+        else:
+            print(f"⚠️ 未确认同步就绪，已达到最长等待时间 {self.sync_timeout:g} 秒，继续更新笔记")
+    
+    def deliver_to_notes(self, delivery: OrderedDelivery, journal: BatchJournal, sync_waiter: NotesSyncWaiter):
+        """
+        写入线程：按 delivery 给出的顺序写入Apple Notes，每次把所有已可写入的条目合并为一次osascript调用
+        新条目插在本批次已写入该笔记的最后一个条目之后，最终顺序与整批一次写入相同（最早的在最上面）
+        """
+        last_written = {}  # 笔记标题 -> 本批次最后写入的条目文件名，作为下一次写入的锚点
+        synced = False
+        total = failed = 0
+        while True:
+            batch = delivery.next_batch()
+            if batch is None:
+                break
+            
+            # 上次运行中已写入笔记的条目不再写入
+            pending = []
+            for result in batch:
+                if journal.state(result['audio_file']).get('notes') == 'appended':
+                    print(f"✓ 上次运行时已写入笔记: {result['note_title']} ({result['backup_filename']})")
+                    last_written[result['note_title']] = result['backup_filename']
+                    self.report_stage(result['audio_file'], 'done')
+                else:
+                    pending.append(result)
+            if not pending:
+                continue
             
-            # 按时间正序排序（最早的先处理）
-            file_list.sort(key=lambda x: self.extract_time_from_file(x[0]))
+            if not synced:
+                self.wait_for_notes_sync(sync_waiter)
+                synced = True
+                print("\n开始更新Apple Notes...")
             
-            for audio_file, date in file_list:
-                result = self.process_single_file(audio_file, date)
-                if result:
-                    all_results.append(result)
-        
-        # 4. 确保达到最小同步时间
-        elapsed_time = time.time() - self.start_time
-        remaining_wait = max(0, MIN_SYNC_TIME - elapsed_time)
-        
-        if remaining_wait > 0:
-            print(f"\n等待 {remaining_wait:.1f} 秒以确保同步完成...")
-            time.sleep(remaining_wait)
-        
-        # 5. 更新Apple Notes
-        print("\n开始更新Apple Notes...")
-        # 反转结果列表，使最早的在最上面
-        for result in reversed(all_results):
-            self.append_to_apple_notes(
-                result['note_title'],
-                result['compressed_audio'],
-                result['transcript'],
-                result.get('backup_filename')  # 传递备份文件名
-            )
+            try:
+                remaining = self.skip_written_entries(journal, pending)
+                remaining_files = set(r['audio_file'] for r in remaining)
+                for result in pending:
+                    if result['audio_file'] not in remaining_files:
+                        last_written[result['note_title']] = result['backup_filename']
+                for result in remaining:
+                    result['after'] = last_written.get(result['note_title'], '')
+                    self.report_stage(result['audio_file'], 'appending')
+                
+                # 先记下写入意图：osascript途中进程退出时，重新运行会先检查笔记中是否已有该条目
+                self._journal_record_many(journal, [(r['audio_file'], 'appending', {}) for r in remaining])
+                succeeded = self.append_batch_to_apple_notes(remaining)
+                self._journal_record_many(journal, [
+                    (r['audio_file'], 'appended' if ok else 'append_failed', {})
+                    for r, ok in zip(remaining, succeeded)
+                ])
+            except Exception as e:
+                print(f"✗ 写入Apple Notes失败: {str(e)}")
+                remaining, succeeded = pending, [False] * len(pending)
+            
+            for result, ok in zip(remaining, succeeded):
+                if ok:
+                    last_written[result['note_title']] = result['backup_filename']
+                self.report_stage(result['audio_file'], 'done' if ok else 'failed')
+            total += len(succeeded)
+            failed += len(succeeded) - sum(succeeded)
         
-        print("\n✓ 所有处理完成！")
+        if not synced:
+            sync_waiter.stop()
+        if failed:
+            print(f"\n⚠️ {failed}/{total} 条笔记写入失败")
+    
+    @staticmethod
+    def _journal_record_many(journal: Optional[BatchJournal], records: List[Tuple[str, str, Dict]]):
+        """
+        写入阶段日志，失败只影响中断后的恢复，不影响本次处理
+        """
+        if journal is None or not records:
+            return
+        try:
+            journal.record_many(records)
+        except OSError as e:
+            print(f"⚠️ 写入阶段日志失败: {str(e)}")
+    
+    def _journal_record(self, job: Dict, stage: str, **data):
+        self._journal_record_many(job.get('journal'), [(job['audio_file'], stage, data)])
+    
+    def report_stage(self, audio_file: str, stage: str):
+        """
+        通知调用方文件进入新阶段，回调出错不影响处理
+        """
+        if self.on_stage is None:
+            return
+        try:
+            self.on_stage(audio_file, stage)
+        except Exception as e:
+            print(f"⚠️ 状态回调失败: {str(e)}")
     
     def extract_time_from_file(self, file_path: str) -> float:
         """
         从文件提取时间用于排序
         """
-        # 可以从文件名或创建时间提取
-        stat = os.stat(file_path)
-        return stat.st_birthtime if hasattr(stat, 'st_birthtime') else stat.st_mtime
+        return audio_metadata.scan(file_path)['recorded_at'].timestamp()
     
-    def process_single_file(self, audio_file: str, date: datetime) -> Optional[Dict]:
+    def run_pipeline(self, jobs: List[Dict],
+                     on_result: Optional[Callable[[int, Optional[Dict]], None]] = None) -> List[Optional[Dict]]:
         """
-        处理单个音频文件
+        分阶段流水线：压缩、转录、备份各自使用独立的有界线程池
+        一个文件完成上一阶段后立即进入下一阶段，不必等待整批文件
+        每个文件完成（或失败）时立即调用 on_result(在jobs中的序号, 结果)
+        返回结果与jobs顺序一致，失败的文件对应None
         """
-        print(f"\n--- 处理文件: {Path(audio_file).name} ---")
+        pools = {
+            stage: ThreadPoolExecutor(
+                max_workers=max(1, self.concurrency.get(stage, 1)),
+                thread_name_prefix=f"vtn-{stage}"
+            )
+            for stage in PIPELINE_STAGES
+        }
         
         try:
-            # 1. 创建备份目录
-            backup_dir = self.create_backup_structure(date)
+            futures = []
+            for job in jobs:
+                future = pools['compress'].submit(self.compress_stage, job)
+                future = self._chain_stage(future, pools['transcribe'], self.transcribe_stage)
+                future = self._chain_stage(future, pools['backup'], self.backup_stage)
+                if on_result is not None:
+                    future.add_done_callback(
+                        lambda f, index=len(futures): on_result(index, None if f.exception() else f.result())
+                    )
+                futures.append(future)
             
-            # 2. 压缩音频到临时目录
+            return [future.result() for future in futures]
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True)
+    
+    @staticmethod
+    def _chain_stage(upstream: Future, pool: ThreadPoolExecutor, stage_fn) -> Future:
+        """
+        上游阶段完成后把job提交到下一阶段的线程池
+        上游返回None（该文件已失败）时直接跳过后续阶段
+        """
+        downstream = Future()
+        
+        def forward(stage_future: Future):
+            error = stage_future.exception()
+            if error is not None:
+                downstream.set_exception(error)
+            else:
+                downstream.set_result(stage_future.result())
+        
+        def on_upstream_done(upstream_future: Future):
+            error = upstream_future.exception()
+            if error is not None:
+                downstream.set_exception(error)
+                return
+            job = upstream_future.result()
+            if job is None:
+                downstream.set_result(None)
+                return
+            pool.submit(stage_fn, job).add_done_callback(forward)
+        
+        upstream.add_done_callback(on_upstream_done)
+        return downstream
+    
+    @STAGE_SECONDS.timed(stage='compress')
+    def compress_stage(self, job: Dict) -> Optional[Dict]:
+        """
+        阶段1：准备上传用的音频
+        依次尝试：转录缓存 → 已符合要求直接上传 → 压缩缓存 → 压缩
+        流式上传模式下压缩与上传在转录阶段同时进行，这里不做压缩
+        """
+        audio_file = job['audio_file']
+        print(f"\n--- 处理文件: {Path(audio_file).name} ---")
+        self.report_stage(audio_file, 'compressing')
+        job['upload_path'] = None
+        job['temp_upload'] = False
+        
+        resume = job.get('resume') or {}
+        if 'transcribed' in resume:
+            print(f"✓ 使用上次运行时的转录: {Path(audio_file).name}")
+            job['transcript'] = resume['transcribed']['transcript']
+            return job
+        compressed = resume.get('compressed', {})
+        # 上次使用了不同的编码配置时重新压缩
+        if (compressed.get('encoding') == self.encoding['name'] and compressed.get('path')
+                and os.path.exists(compressed['path']) and self.hold_cached_upload(job, compressed['path'])):
+            print(f"✓ 使用上次运行时的压缩文件: {Path(audio_file).name}")
+            return job
+        
+        cached = self.get_cached_transcript(audio_file)
+        if cached:
+            job['transcript'] = cached
+            self._journal_record(job, 'transcribed', transcript=cached)
+            return job
+        
+        ready_path = self.find_ready_upload(audio_file)
+        if ready_path == audio_file:
+            job['upload_path'] = ready_path
+            return job
+        if ready_path and self.hold_cached_upload(job, ready_path):
+            return job
+        
+        if self.stream_upload:
+            return job
+        
+        if not self.prepare_compressed_upload(job, audio_file):
+            print(f"跳过文件: {audio_file} (压缩失败)")
+            return None
+        return job
+    
+    def prepare_compressed_upload(self, job: Dict, audio_file: str) -> bool:
+        """
+        压缩音频并设置任务的上传文件，压缩失败时返回False
+        """
+        upload_path, is_temp = self.compress_for_upload(audio_file)
+        if upload_path is None:
+            return False
+        if is_temp:
+            job['upload_path'] = upload_path
+            job['temp_upload'] = True
+            return True
+        return self.hold_cached_upload(job, upload_path)
+    
+    def hold_cached_upload(self, job: Dict, cached_path: str) -> bool:
+        """
+        上传压缩缓存中的文件：记入阶段日志，并改用该文件的硬链接上传（转录后删除），
+        其他任务写入缓存触发淘汰时不会删掉正在上传的文件。缓存文件已被淘汰时返回False
+        """
+        upload_path, is_temp = cached_path, False
+        if self.compressed_cache is not None:
+            try:
+                upload_path, is_temp = self.compressed_cache.checkout(cached_path), True
+            except OSError as e:
+                if not isinstance(e, FileNotFoundError):
+                    print(f"⚠️ 读取压缩缓存失败: {str(e)}")
+                return False
+        # 日志记录缓存中的文件，硬链接转录后即删除
+        self._journal_record(job, 'compressed', path=cached_path, encoding=self.encoding['name'])
+        job['upload_path'] = upload_path
+        job['temp_upload'] = is_temp
+        return True
+    
+    def find_ready_upload(self, audio_file: str) -> Optional[str]:
+        """
+        不需要运行FFmpeg就能上传的文件：
+        原始文件已符合编码配置（如低码率单声道MP3）时直接上传，否则查找压缩缓存
+        """
+        if is_upload_ready(probe_audio(audio_file), self.encoding):
+            print(f"✓ 已符合上传要求，跳过压缩: {Path(audio_file).name}")
+            with self._stats_lock:
+                self.passthrough_count += 1
+            return audio_file
+        
+        if self.compressed_cache is not None:
+            try:
+                key = self.compressed_cache.key_for(audio_file, compress_params(self.encoding))
+                cached_path = self.compressed_cache.get(key)
+            except OSError as e:
+                print(f"⚠️ 读取压缩缓存失败: {str(e)}")
+                return None
+            if cached_path is not None:
+                print(f"✓ 命中压缩缓存: {Path(audio_file).name}")
+                return str(cached_path)
+        
+        return None
+    
+    def compress_for_upload(self, audio_file: str) -> Tuple[Optional[str], bool]:
+        """
+        压缩音频用于上传，返回 (文件路径, 是否为需要删除的临时文件)
+        启用压缩缓存时直接压缩到缓存目录，重试和重跑时不必再次压缩
+        """
+        if self.compressed_cache is None:
+            return self.compress_to_temp(audio_file), True
+        
+        try:
+            key = self.compressed_cache.key_for(audio_file, compress_params(self.encoding))
+            staging_path = self.compressed_cache.staging_path(key)
+        except OSError as e:
+            print(f"⚠️ 压缩缓存不可用: {str(e)}")
+            return self.compress_to_temp(audio_file), True
+        
+        started_at = time.time()
+        if not self.compress_audio(audio_file, staging_path):
+            self._remove_temp_file(staging_path)
+            return None, False
+        
+        try:
+            cached_path = self.compressed_cache.put(key, staging_path, time.time() - started_at)
+        except OSError as e:
+            print(f"⚠️ 写入压缩缓存失败: {str(e)}")
+            return staging_path, True
+        return str(cached_path), False
+    
+    def compress_to_temp(self, audio_file: str) -> Optional[str]:
+        """
+        压缩音频到临时目录，返回临时文件路径，失败返回None
+        """
+        try:
             temp_dir = PROJECT_ROOT / "temp"
             temp_dir.mkdir(exist_ok=True)
-            compressed_name = Path(audio_file).stem + COMPRESSED_SUFFIX + '.mp3'
-            compressed_path = temp_dir / compressed_name
+            # 并发处理时同名文件不能共用一个临时文件
+            fd, compressed_path = tempfile.mkstemp(
+                prefix=Path(audio_file).stem + '_',
+                suffix=f"{COMPRESSED_SUFFIX}.{self.encoding['extension']}",
+                dir=str(temp_dir)
+            )
+            os.close(fd)
             
-            if not self.compress_audio(audio_file, str(compressed_path)):
-                print(f"跳过文件: {audio_file} (压缩失败)")
+            if not self.compress_audio(audio_file, compressed_path):
+                self._remove_temp_file(compressed_path)
                 return None
             
-            # 3. 转录音频
-            transcript = self.transcribe_audio_simple(str(compressed_path))
+            return compressed_path
+            
+        except Exception as e:
+            print(f"✗ 处理失败: {str(e)}")
+            return None
+    
+    @STAGE_SECONDS.timed(stage='transcribe')
+    def transcribe_stage(self, job: Dict) -> Optional[Dict]:
+        """
+        阶段2：转录音频，完成后清理临时压缩文件
+        流式上传失败时回退为先压缩到文件再上传
+        """
+        audio_file = job['audio_file']
+        if job.get('transcript'):
+            # 压缩阶段已命中缓存
+            return job
+        
+        self.report_stage(audio_file, 'transcribing')
+        
+        # 缓存中的压缩文件以哈希命名，上传时仍使用原文件名
+        upload_name = f"{Path(audio_file).stem}{COMPRESSED_SUFFIX}.{self.encoding['extension']}"
+        if job['upload_path'] == audio_file:
+            upload_name = Path(audio_file).name
+        
+        try:
+            if job['upload_path'] is None:
+                try:
+                    transcript = self.transcribe_audio_streaming(audio_file)
+                except requests.ReadTimeout:
+                    # 音频已经上传到服务器，改用临时文件重新上传可能重复转录计费
+                    raise
+                except Exception as e:
+                    print(f"⚠️ 流式上传失败，改用临时文件: {str(e)}")
+                    with STAGE_SECONDS.time(stage='compress'):
+                        self.prepare_compressed_upload(job, audio_file)
+                    if job['upload_path'] is None:
+                        print(f"跳过文件: {audio_file} (压缩失败)")
+                        return None
+                    transcript = self.transcribe_audio_simple(job['upload_path'], upload_name)
+            else:
+                transcript = self.transcribe_audio_simple(job['upload_path'], upload_name)
+            
             if not transcript:
                 print(f"跳过文件: {audio_file} (转录失败)")
                 return None
             
-            # 4. 保存原始音频到备份目录
-            # 获取原始文件名（移除可能的时间戳前缀）
-            original_filename = Path(audio_file).name
-            # 如果文件名包含时间戳前缀（格式：timestamp_filename），移除它
-            if '_' in original_filename and original_filename.split('_')[0].isdigit():
-                parts = original_filename.split('_', 1)
-                if len(parts) > 1:
-                    original_filename = parts[1]
+            self.cache_transcript(audio_file, transcript)
+            self._journal_record(job, 'transcribed', transcript=transcript)
+            job['transcript'] = transcript
+            return job
             
-            # 检查文件是否已存在，如果存在则添加计数器
-            backup_audio_path = Path(backup_dir) / original_filename
-            counter = 1
-            while backup_audio_path.exists():
-                stem = Path(original_filename).stem
-                suffix = Path(original_filename).suffix
-                backup_audio_path = Path(backup_dir) / f"{stem}_({counter}){suffix}"
-                counter += 1
+        except Exception as e:
+            print(f"✗ 处理失败: {str(e)}")
+            return None
+        finally:
+            # 清理临时压缩文件（转录完成后不再需要）
+            if job['temp_upload'] and self._remove_temp_file(job['upload_path']):
+                print(f"✓ 已清理临时压缩文件")
+    
+    @STAGE_SECONDS.timed(stage='backup')
+    def backup_stage(self, job: Dict) -> Optional[Dict]:
+        """
+        阶段3：备份原始音频和转录文本，返回Apple Notes所需数据
+        """
+        audio_file = job['audio_file']
+        date = job['date']
+        transcript = job['transcript']
+        
+        backed_up = (job.get('resume') or {}).get('backed_up')
+        if backed_up:
+            print(f"✓ 上次运行时已备份: {backed_up['backup_filename']}")
+            return self.notes_entry(audio_file, backed_up['note_title'], transcript, date,
+                                    backed_up['backup_filename'])
+        
+        self.report_stage(audio_file, 'backing_up')
+        
+        try:
+            # 1. 创建备份目录
+            backup_dir = self.create_backup_structure(date)
             
-            shutil.copy2(audio_file, backup_audio_path)
-            print(f"✓ 原始音频已备份: {backup_audio_path.name}")
+            # 2. 保存原始音频到备份目录（按内容去重，已备份过的录音不再写入数据）
+            # 同一文件系统内移动只是重命名；复制时优先使用写时复制克隆，都不行才真正复制数据
+            transfer = move_file if self.disposable_inputs else copy_file
+            with tracing.span('backup_copy', audio_file, tracing.file_size(audio_file)):
+                backup_filename, method = self.backup_store.store(
+                    audio_file, backup_dir, self.original_filename(audio_file), transfer
+                )
+            print(f"✓ 原始音频已备份: {backup_filename} ({method})")
             
-            # 5. 保存转录文本备份（使用相同的原始文件名）
-            self.save_transcript_backup(backup_dir, backup_audio_path.name, transcript)
+            # 3. 保存转录文本备份（使用相同的原始文件名）
+            self.save_transcript_backup(backup_dir, backup_filename, transcript)
             
-            # 6. 准备Apple Notes数据
+            # 4. 准备Apple Notes数据
             note_title = self.format_date_for_notes(date)
+            self._journal_record(
+                job, 'backed_up',
+                note_title=note_title,
+                backup_filename=backup_filename,
+                date=date.isoformat(),
+                recorded_at=(job.get('recorded_at') or date).isoformat()
+            )
             
-            # 7. 清理压缩文件（转录完成后不再需要）
-            try:
-                os.remove(compressed_path)
-                print(f"✓ 已清理临时压缩文件")
-            except:
-                pass
-            
-            return {
-                'note_title': note_title,
-                'compressed_audio': '',  # 不再需要，因为已删除
-                'transcript': transcript,
-                'date': date,
-                'backup_filename': backup_audio_path.name  # 添加备份后的文件名
-            }
+            return self.notes_entry(audio_file, note_title, transcript, date, backup_filename)
             
         except Exception as e:
             print(f"✗ 处理失败: {str(e)}")
             return None
+    
+    @staticmethod
+    def notes_entry(audio_file: str, note_title: str, transcript: str, date: datetime,
+                    backup_filename: str) -> Dict:
+        """
+        备份阶段的结果，即写入Apple Notes所需的数据
+        """
+        return {
+            'audio_file': audio_file,
+            'note_title': note_title,
+            'compressed_audio': '',  # 不再需要，因为已删除
+            'transcript': transcript,
+            'date': date,
+            'backup_filename': backup_filename  # 添加备份后的文件名
+        }
+    
+    @staticmethod
+    def original_filename(audio_file: str) -> str:
+        """
+        原始文件名，移除网页上传时添加的前缀（毫秒时间戳_随机后缀_filename）
+        """
+        name = Path(audio_file).name
+        return UPLOAD_PREFIX.sub('', name, count=1) or name
+    
+    @staticmethod
+    def _remove_temp_file(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+    
+    def process_single_file(self, audio_file: str, date: datetime) -> Optional[Dict]:
+        """
+        处理单个音频文件（不经过流水线，依次执行各阶段）
+        """
+        job = {'audio_file': audio_file, 'date': date}
+        for stage_fn in (self.compress_stage, self.transcribe_stage, self.backup_stage):
+            job = stage_fn(job)
+            if job is None:
+                return None
+        return job
+
+def parse_concurrency(values: Optional[List[str]]) -> Dict[str, int]:
+    """
+    解析 --concurrency 参数，格式为 阶段=并发数，如 transcribe=4
+    """
+    concurrency = {}
+    for value in values or []:
+        stage, sep, count = value.partition('=')
+        stage = stage.strip()
+        if not sep or stage not in PIPELINE_STAGES:
+            raise ValueError(
+                f"无效的并发设置: {value} (可选阶段: {', '.join(PIPELINE_STAGES)})"
+            )
+        try:
+            workers = int(count)
+        except ValueError:
+            raise ValueError(f"无效的并发数: {value}")
+        if workers < 1:
+            raise ValueError(f"并发数必须大于0: {value}")
+        concurrency[stage] = workers
+    return concurrency
 
 def main():
     parser = argparse.ArgumentParser(
@@ -404,31 +1096,198 @@ def main():
     )
     parser.add_argument(
         'audio_files',
-        nargs='+',
+        nargs='*',
         help='要处理的音频文件路径'
     )
+    parser.add_argument(
+        '--watch',
+        metavar='DIR',
+        help='常驻监视收件箱目录，新文件写入完成后自动分批处理（处理后移入 processed/ 或 failed/）'
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='作为常驻进程在Unix套接字上等待提交；之后只带文件参数运行本脚本会直接交给常驻进程处理'
+    )
+    parser.add_argument(
+        '--socket',
+        metavar='PATH',
+        help=f'常驻进程的套接字路径 (默认: ${SOCKET_ENV} 或 {default_socket_path()})'
+    )
+    parser.add_argument(
+        '--no-wait',
+        action='store_true',
+        help='交给常驻进程后立即返回，不等待处理完成'
+    )
+    parser.add_argument(
+        '--local',
+        action='store_true',
+        help='即使常驻进程在运行也在本进程中处理'
+    )
+    parser.add_argument(
+        '--settle',
+        type=float,
+        default=SETTLE_SECONDS,
+        help='监视模式下文件大小保持不变多少秒视为写入完成 (默认: %(default)s)'
+    )
+    parser.add_argument(
+        '--batch-window',
+        type=float,
+        default=BATCH_WINDOW,
+        help='监视模式下最后一个文件到达后等待多少秒再开始处理，期间到达的文件合并为一批 (默认: %(default)s)'
+    )
+    parser.add_argument(
+        '--poll',
+        action='store_true',
+        help='监视模式下不使用inotify/kqueue，改为定时扫描目录（适用于网络盘）'
+    )
+    parser.add_argument(
+        '--concurrency',
+        action='append',
+        metavar='STAGE=N',
+        help='设置流水线阶段的并发数，可重复使用，'
+             f'如 --concurrency transcribe=4 (阶段: {", ".join(PIPELINE_STAGES)})'
+    )
+    
+    parser.add_argument(
+        '--no-stream',
+        action='store_true',
+        help='不使用流式上传，先压缩到临时文件再上传'
+    )
+    parser.add_argument(
+        '--encoding',
+        choices=list(ENCODING_PROFILES),
+        default=DEFAULT_ENCODING,
+        help='上传前压缩使用的编码配置，opus在低码率下体积约为MP3的一半 (默认: %(default)s)'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='忽略转录缓存，总是调用API'
+    )
+    
+    parser.add_argument(
+        '--connect-timeout',
+        type=float,
+        default=CONNECT_TIMEOUT,
+        help='连接API的超时秒数 (默认: %(default)s)'
+    )
+    parser.add_argument(
+        '--read-timeout',
+        type=float,
+        default=READ_TIMEOUT,
+        help='等待API响应的超时秒数 (默认: %(default)s)'
+    )
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=MAX_RETRIES,
+        help='遇到429/5xx或连接中断时的最大重试次数 (默认: %(default)s)'
+    )
+    
+    parser.add_argument(
+        '--sync-timeout',
+        type=float,
+        default=MIN_SYNC_TIME,
+        help='等待Apple Notes同步就绪的最长秒数 (默认: %(default)s)'
+    )
+    
+    parser.add_argument(
+        '--profile',
+        metavar='PATH',
+        help='把各阶段耗时记录以JSON Lines格式写入PATH，并在结束时打印汇总表'
+    )
     
     args = parser.parse_args()
     
+    try:
+        concurrency = parse_concurrency(args.concurrency)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if args.serve and (args.audio_files or args.watch):
+        parser.error('--serve 不能与音频文件或 --watch 同时使用')
+    if not args.audio_files and not args.watch and not args.serve:
+        parser.error('请指定要处理的音频文件，或使用 --watch DIR / --serve')
+    
     # 验证文件存在
     for audio_file in args.audio_files:
         if not os.path.exists(audio_file):
             print(f"错误: 文件不存在 - {audio_file}")
             return 1
     
+    if args.profile:
+        tracing.enable(args.profile)
+    
     try:
         # 加载API密钥
         api_key = load_api_key()
         
-        # 创建工作流实例并处理文件
-        workflow = VoiceToNotesWorkflow(api_key)
-        workflow.process_audio_files(args.audio_files)
+        # 常驻模式：阶段变化推送给提交文件的客户端
+        server = WorkflowServer(args.socket) if args.serve else None
+        
+        # 监视模式下记录每个文件的最终阶段，用于决定移入processed/还是failed/
+        final_stages = {}
+        
+        def record_stage(audio_file, stage):
+            if stage in ('done', 'failed'):
+                final_stages[audio_file] = stage
+        
+        # 创建工作流实例并处理文件；监视模式下同一个实例（和连接池）在整个进程中复用
+        workflow = VoiceToNotesWorkflow(
+            api_key,
+            on_stage=server.report_stage if server else (record_stage if args.watch else None),
+            concurrency=concurrency,
+            stream_upload=not args.no_stream,
+            use_cache=not args.no_cache,
+            client_options={
+                'connect_timeout': args.connect_timeout,
+                'read_timeout': args.read_timeout,
+                'max_retries': args.max_retries,
+            },
+            sync_timeout=args.sync_timeout,
+            encoding=args.encoding
+        )
+        if server is not None:
+            try:
+                server.serve_forever(workflow)
+            except KeyboardInterrupt:
+                print("\n常驻进程已停止")
+            return 0
+        
+        if args.audio_files:
+            workflow.process_audio_files(args.audio_files)
+        
+        if args.watch:
+            def process_batch(files):
+                final_stages.clear()
+                workflow.process_audio_files(files)
+                return {f: final_stages.get(f) == 'done' for f in files}
+            
+            watcher = InboxWatcher(
+                args.watch,
+                process_batch,
+                settle=args.settle,
+                batch_window=args.batch_window,
+                polling=args.poll
+            )
+            try:
+                watcher.run()
+            except KeyboardInterrupt:
+                print("\n已停止监视")
         
         return 0
         
     except Exception as e:
         print(f"错误: {str(e)}")
         return 1
+    finally:
+        tracer = tracing.disable()
+        # 批次结束时已输出汇总，这里只输出之后（或中途出错时）剩下的记录
+        if tracer is not None and tracer.records:
+            print(f"\n各阶段耗时（详细记录: {args.profile}）:")
+            print(tracer.format_summary())
 
 if __name__ == "__main__":
     exit(main())
\ No newline at end of file
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+常驻工作流进程与命令行之间的本地通信
+--serve 模式在Unix域套接字上监听，由同一个已初始化的工作流依次处理提交的文件；
+命令行检测到常驻进程时只发送文件路径，毫秒级完成提交，否则退回在本进程中处理。
+客户端部分只使用标准库，不导入requests等模块，保证启动快
+
+协议：每条消息一行JSON
+  客户端 -> {"files": [绝对路径...], "wait": true}
+  服务端 -> {"accepted": true, "position": N} 或 {"error": "...", "retry_after": N}
+         -> {"file": 路径, "stage": 阶段} ...（wait为true时）
+         -> {"finished": true, "results": {路径: 是否成功}}
+"""
+
+import os
+import json
+import signal
+import socket
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+SOCKET_ENV = 'VOICE_NOTES_SOCKET'
+CONNECT_TIMEOUT = 0.5  # 连接常驻进程的超时（秒），连不上就在本进程中处理
+MAX_QUEUE = 20  # 常驻进程最多排队的提交数
+
+STAGE_LABELS = {
+    'queued': '排队中',
+    'compressing': '正在压缩',
+    'transcribing': '正在转录',
+    'backing_up': '正在备份',
+    'appending': '正在写入Apple Notes',
+    'done': '完成',
+    'failed': '失败',
+}
+
+
+def default_socket_path() -> str:
+    """套接字路径：VOICE_NOTES_SOCKET，默认在系统临时目录（Unix套接字路径长度有限，不放在项目目录下）"""
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.environ.get(SOCKET_ENV) or os.path.join(tempfile.gettempdir(), f'voice_to_notes-{uid}.sock')
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _send(conn: socket.socket, message: Dict):
+    conn.sendall((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+
+
+def forward_cli(argv: List[str]) -> Optional[int]:
+    """
+    命令行只包含文件（以及 --no-wait / --socket）且常驻进程在运行时，把文件交给它处理并返回退出码；
+    返回None表示需要在本进程中处理（有其他选项、文件不存在或没有常驻进程）
+    """
+    files = []
+    wait = True
+    socket_path = None
+    args = iter(argv)
+    for arg in args:
+        if arg == '--no-wait':
+            wait = False
+        elif arg == '--socket':
+            socket_path = next(args, None)
+        elif arg.startswith('-'):
+            return None
+        else:
+            files.append(arg)
+    if not files or not all(os.path.isfile(f) for f in files):
+        return None
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(CONNECT_TIMEOUT)
+    try:
+        conn.connect(socket_path or default_socket_path())
+    except OSError:
+        conn.close()
+        return None
+
+    with conn:
+        conn.settimeout(None)
+        _send(conn, {'files': [os.path.abspath(f) for f in files], 'wait': wait})
+        reader = conn.makefile('r', encoding='utf-8')
+        reply = json.loads(reader.readline() or '{}')
+        if not reply.get('accepted'):
+            message = reply.get('error', '常驻进程没有响应')
+            if reply.get('retry_after'):
+                message += f"（{reply['retry_after']} 秒后重试）"
+            print(f"✗ {message}")
+            return 1
+        position = reply.get('position', 0)
+        print(f"✓ 已提交 {len(files)} 个文件给常驻进程" + (f"，前面还有 {position} 个任务" if position else ''))
+        if not wait:
+            return 0
+
+        for line in reader:
+            message = json.loads(line)
+            if message.get('finished'):
+                if message.get('error'):
+                    print(f"✗ 处理失败: {message['error']}")
+                results = message.get('results', {})
+                failed = sum(1 for ok in results.values() if not ok)
+                if failed:
+                    print(f"\n⚠️ {failed}/{len(files)} 个文件处理失败")
+                else:
+                    print("\n✓ 所有处理完成！")
+                return 1 if failed or message.get('error') else 0
+            stage = message.get('stage')
+            mark = '✗' if stage == 'failed' else '✓'
+            print(f"{mark} {os.path.basename(message.get('file', ''))}: {STAGE_LABELS.get(stage, stage)}")
+
+    print("✗ 与常驻进程的连接中断")
+    return 1
+
+
+class WorkflowServer:
+    """
+    在Unix域套接字上接收提交，由一个工作线程用同一个工作流实例依次处理。
+    创建工作流时把 report_stage 作为 on_stage 回调传入，阶段变化会推送给等待中的客户端
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, max_queue: int = MAX_QUEUE):
+        self.socket_path = socket_path or default_socket_path()
+        self.max_queue = max_queue
+        self.scheduler = None
+        self._current = None
+
+    def report_stage(self, audio_file: str, stage: str):
+        job = self._current
+        if job is None or audio_file not in job['files']:
+            return
+        if stage in ('done', 'failed'):
+            job['results'][audio_file] = stage == 'done'
+        self._notify(job, {'file': audio_file, 'stage': stage})
+
+    def _notify(self, job: Dict, message: Dict):
+        with job['lock']:
+            if job['conn'] is None:
+                return
+            try:
+                _send(job['conn'], message)
+            except OSError:
+                # 客户端已断开，任务继续处理
+                job['conn'] = None
+
+    def _finish(self, job: Dict, error: Optional[str] = None):
+        message = {'finished': True, 'results': job['results']}
+        if error:
+            message['error'] = error
+        self._notify(job, message)
+        with job['lock']:
+            if job['conn'] is not None:
+                job['conn'].close()
+                job['conn'] = None
+
+    def _run_job(self, workflow, job: Dict):
+        self._current = job
+        try:
+            workflow.process_audio_files(job['files'])
+        finally:
+            self._current = None
+        self._finish(job)
+
+    def _job_failed(self, job: Dict, error: Exception):
+        self._finish(job, str(error))
+
+    def _handle(self, conn: socket.socket):
+        from job_scheduler import QueueFullError
+        try:
+            request = json.loads(conn.makefile('r', encoding='utf-8').readline() or '{}')
+        except (OSError, ValueError):
+            conn.close()
+            return
+        files = request.get('files')
+        if not isinstance(files, list) or not files or not all(isinstance(f, str) for f in files):
+            _send(conn, {'error': '缺少文件'})
+            conn.close()
+            return
+        missing = [f for f in files if not os.path.isfile(f)]
+        if missing:
+            _send(conn, {'error': f'文件不存在: {missing[0]}'})
+            conn.close()
+            return
+
+        wait = bool(request.get('wait', True))
+        job = {'files': files, 'results': {}, 'conn': conn if wait else None, 'lock': threading.Lock()}
+        # 持有锁直到回复发出，保证客户端先收到accepted再收到阶段事件
+        with job['lock']:
+            try:
+                self.scheduler.submit(job)
+            except QueueFullError as e:
+                _send(conn, {'error': str(e), 'retry_after': e.retry_after})
+                conn.close()
+                return
+            print(f"📥 收到 {len(files)} 个文件")
+            position = max(0, self.scheduler.queue_depth() - 1 + self.scheduler.active_workers())
+            _send(conn, {'accepted': True, 'position': position})
+            if not wait:
+                conn.close()
+
+    def _check_stale_socket(self):
+        """已有常驻进程在监听时报错，残留的套接字文件直接删除"""
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        probe.settimeout(CONNECT_TIMEOUT)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+        else:
+            raise RuntimeError(f'常驻进程已在运行: {self.socket_path}')
+        finally:
+            probe.close()
+
+    def serve_forever(self, workflow):
+        """用已创建好的工作流处理提交，直到Ctrl+C"""
+        from job_scheduler import JobScheduler
+        self.scheduler = JobScheduler(
+            self._run_job,
+            workers=1,
+            max_queue=self.max_queue,
+            worker_init=lambda: workflow,
+            on_error=self._job_failed
+        ).start()
+
+        self._check_stale_socket()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)  # 套接字只允许当前用户访问
+        try:
+            listener.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        listener.listen(16)
+        # kill/launchd停止进程时也清理套接字文件
+        signal.signal(signal.SIGTERM, _interrupt)
+        print(f"🚀 常驻进程已启动，监听 {self.socket_path}，按 Ctrl+C 停止")
+        try:
+            while True:
+                conn, _ = listener.accept()
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
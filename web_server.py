@@ -10,21 +10,28 @@ import json
 import tempfile
 import shutil
 from pathlib import Path
-from flask import Flask, request, jsonify, send_from_directory, render_template_string
+from flask import Flask, Response, request, jsonify, send_from_directory, render_template_string
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import subprocess
-import threading
-import queue
 import time
+import uuid
+import threading
 
 # 添加项目根目录到Python路径
 PROJECT_ROOT = Path(__file__).parent
 sys.path.append(str(PROJECT_ROOT / 'scripts' / 'python'))
 
 # 导入工作流模块
-from voice_to_notes_workflow import VoiceToNotesWorkflow
+from voice_to_notes_workflow import BACKUP_ROOT, VoiceToNotesWorkflow
 from transcribe_audio import load_api_key
+from job_scheduler import JobScheduler, QueueFullError
+from chunked_upload import MAX_UPLOAD_SIZE as DEFAULT_MAX_UPLOAD_SIZE, ChunkedUploadStore, UploadError
+from task_events import TaskEventBus
+from task_store import TaskStore, TASK_TTL_SECONDS
+from metrics import REGISTRY, Counter, Gauge
+from transcript_index import TranscriptIndex
+from batch_journal import backed_up_files
 
 # Flask应用配置
 app = Flask(__name__)
@@ -35,15 +42,138 @@ UPLOAD_FOLDER = PROJECT_ROOT / 'temp' / 'uploads'
 UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'm4a', 'flac', 'aac', 'ogg'}
 
-# 处理队列
-processing_queue = queue.Queue()
-results = {}
+# 调度器配置：工作线程数和等待队列上限（可通过环境变量调整）
+WORKER_COUNT = int(os.environ.get('VOICE_NOTES_WORKERS', '2'))
+MAX_QUEUE_DEPTH = int(os.environ.get('VOICE_NOTES_MAX_QUEUE', '20'))
+
+# 任务数据库：已结束的任务保留 VOICE_NOTES_TASK_TTL 秒
+TASK_DB_PATH = Path(os.environ.get('VOICE_NOTES_TASK_DB', str(PROJECT_ROOT / 'temp' / 'tasks.db')))
+TASK_TTL = float(os.environ.get('VOICE_NOTES_TASK_TTL', str(TASK_TTL_SECONDS)))
+
+# 服务端口；转录接口地址、备份目录和同步等待时间可覆盖（用于测试环境）
+SERVER_PORT = int(os.environ.get('VOICE_NOTES_PORT', '8181'))
+API_URL = os.environ.get('VOICE_NOTES_API_URL')
+BACKUP_ROOT_DIR = os.environ.get('VOICE_NOTES_BACKUP_ROOT')
+SYNC_TIMEOUT = os.environ.get('VOICE_NOTES_SYNC_TIMEOUT')
+
+# 上传前压缩使用的编码配置，如 opus-24k（默认 MP3 32kbps）
+ENCODING = os.environ.get('VOICE_NOTES_ENCODING')
+
+# 转录全文索引（与工作流写入的是同一个数据库）
+transcript_index = TranscriptIndex(Path(BACKUP_ROOT_DIR) if BACKUP_ROOT_DIR else PROJECT_ROOT / BACKUP_ROOT)
+SEARCH_MAX_LIMIT = 100
+
+# 分块上传：未完成的上传保存在这里，提交后移入UPLOAD_FOLDER
+# VOICE_NOTES_MAX_UPLOAD 为单个文件的大小上限（字节）
+MAX_UPLOAD_SIZE = int(os.environ.get('VOICE_NOTES_MAX_UPLOAD', str(DEFAULT_MAX_UPLOAD_SIZE)))
+upload_store = ChunkedUploadStore(UPLOAD_FOLDER / 'partial', max_size=MAX_UPLOAD_SIZE)
+
+# 任务状态：保存在SQLite中，每次变化都会推送给 /events 的订阅者
+task_store = TaskStore(TASK_DB_PATH, ttl=TASK_TTL)
+tasks = TaskEventBus(store=task_store)
+# 工作流处理中的文件路径 -> 该文件的任务ID
+file_task_ids = {}
+EVENT_KEEPALIVE_SECONDS = 15  # SSE连接空闲时发送心跳的间隔
+HEALTH_CACHE_SECONDS = 30  # 健康检查结果的缓存时间
+
+# 任务计数，阶段耗时、上传字节数和API状态码由工作流和转录客户端记录
+JOBS_TOTAL = Counter('voice_notes_jobs_total', '已处理的任务数（按结果：success / partial / error）', ['result'])
+
+STAGE_MESSAGES = {
+    'queued': '排队中',
+    'compressing': '正在压缩...',
+    'transcribing': '正在转录...',
+    'backing_up': '正在备份...',
+    'appending': '正在写入Apple Notes...',
+    'done': '处理完成',
+    'failed': '处理失败',
+}
 
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_upload(file) -> tuple:
+    """保存上传的文件，返回 (保存路径, 原始文件名, 时间戳)"""
+    filename = secure_filename(file.filename)
+    timestamp = int(time.time() * 1000)
+    # 同一毫秒内同名上传也不能共用路径（阶段回调按路径查找任务）
+    unique_filename = f"{timestamp}_{uuid.uuid4().hex[:6]}_{filename}"
+    filepath = UPLOAD_FOLDER / unique_filename
+    file.save(str(filepath))
+    return str(filepath), filename, timestamp
+
+def remove_files(file_paths):
+    """清理临时上传文件"""
+    for filepath in file_paths:
+        try:
+            os.remove(filepath)
+        except:
+            pass
+
+def queue_full_response(error: QueueFullError):
+    """队列已满：返回503并告知客户端多久后重试"""
+    response = jsonify({
+        'error': '服务器繁忙，请稍后重试',
+        'retry_after': error.retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def upload_error_response(error: UploadError):
+    """分块上传出错：返回状态码，偏移量不匹配时带上服务器已接收的偏移量"""
+    body = {'error': str(error)}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return jsonify(body), error.status_code
+
+def claim_uploads(upload_ids) -> tuple:
+    """
+    取出已提交的分块上传，返回 (文件路径列表, 文件名列表)
+    任何一个无效都不取出，抛出 UploadError
+    """
+    file_paths = []
+    for upload_id in upload_ids:
+        file_paths.append(upload_store.committed_path(upload_id))
+    for upload_id in upload_ids:
+        upload_store.release(upload_id)
+    filenames = [os.path.basename(fp).split('_', 2)[2] for fp in file_paths]
+    return file_paths, filenames
+
+def new_task_id(prefix='task'):
+    return f"{prefix}_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}"
+
+def enqueue_job(task_id, file_paths, filenames, file_task_list):
+    """
+    登记任务状态并提交给调度器；file_task_list 为每个文件各自的任务ID
+    队列已满时撤销登记、删除文件并抛出 QueueFullError
+    """
+    filename = ', '.join(filenames)
+    for filepath, name, file_task in zip(file_paths, filenames, file_task_list):
+        tasks.update(file_task, replace=True, status='queued', stage='queued',
+                     filename=name, message=STAGE_MESSAGES['queued'], job_id=task_id)
+    if task_id not in file_task_list:
+        tasks.update(task_id, replace=True, status='queued', filename=filename,
+                     count=len(file_paths), task_ids=list(file_task_list), job_id=task_id)
+    job = {
+        'task_id': task_id,
+        'files': file_paths,
+        'filename': filename,
+        'file_tasks': dict(zip(file_paths, file_task_list))
+    }
+    # 先持久化再入队，服务器重启后可以找回
+    task_store.save_job(job)
+    try:
+        scheduler.submit(job)
+    except QueueFullError:
+        task_store.finish_job(task_id)
+        for file_task in set(file_task_list) | {task_id}:
+            tasks.discard(file_task)
+        remove_files(file_paths)
+        raise
+
 @app.route('/')
 def index():
     """返回主页面"""
@@ -52,6 +182,9 @@ def index():
 @app.route('/process', methods=['POST'])
 def process_audio():
     """处理上传的音频文件"""
+    if 'upload_id' in request.form:
+        return process_chunked_upload(request.form['upload_id'])
+    
     if 'audio' not in request.files:
         return jsonify({'error': '没有找到音频文件'}), 400
     
@@ -61,17 +194,19 @@ def process_audio():
         return jsonify({'error': '没有选择文件'}), 400
     
     if file and allowed_file(file.filename):
+        # 队列已满时在保存文件之前就拒绝
+        if not scheduler.has_capacity():
+            return queue_full_response(QueueFullError(scheduler.retry_after()))
+        
         # 保存上传的文件
-        filename = secure_filename(file.filename)
-        timestamp = int(time.time() * 1000)
-        unique_filename = f"{timestamp}_{filename}"
-        filepath = UPLOAD_FOLDER / unique_filename
-        file.save(str(filepath))
+        filepath, filename, timestamp = save_upload(file)
         
         # 添加到处理队列
-        task_id = f"task_{timestamp}"
-        processing_queue.put((task_id, str(filepath), filename))
-        results[task_id] = {'status': 'queued', 'filename': filename}
+        task_id = f"task_{timestamp}_{uuid.uuid4().hex[:6]}"
+        try:
+            enqueue_job(task_id, [filepath], [filename], [task_id])
+        except QueueFullError as e:
+            return queue_full_response(e)
         
         return jsonify({
             'success': True,
@@ -81,134 +216,347 @@ def process_audio():
     
     return jsonify({'error': '不支持的文件类型'}), 400
 
+def process_chunked_upload(upload_id):
+    """/process 处理已通过分块上传提交的文件"""
+    if not scheduler.has_capacity():
+        return queue_full_response(QueueFullError(scheduler.retry_after()))
+    
+    try:
+        file_paths, filenames = claim_uploads([upload_id])
+    except UploadError as e:
+        return upload_error_response(e)
+    
+    task_id = new_task_id()
+    try:
+        enqueue_job(task_id, file_paths, filenames, [task_id])
+    except QueueFullError as e:
+        return queue_full_response(e)
+    
+    return jsonify({
+        'success': True,
+        'task_id': task_id,
+        'message': f'文件 {filenames[0]} 已加入处理队列'
+    })
+
+@app.route('/upload/init', methods=['POST'])
+def upload_init():
+    """开始分块上传：{filename, size} -> {upload_id, offset}"""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename', '')))
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': '不支持的文件类型'}), 400
+    try:
+        size = int(data.get('size', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': '文件大小无效'}), 400
+    
+    try:
+        return jsonify(upload_store.init(filename, size))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """查询已接收的偏移量，客户端断线后据此续传"""
+    try:
+        return jsonify(upload_store.status(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/upload/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """上传一块数据，请求体为原始字节，?offset= 为这一块的起始位置"""
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': '缺少偏移量'}), 400
+    
+    try:
+        received = upload_store.write_chunk(
+            upload_id, offset, request.stream, request.content_length
+        )
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'upload_id': upload_id, 'offset': received})
+
+@app.route('/upload/<upload_id>/commit', methods=['POST'])
+def upload_commit(upload_id):
+    """所有分块到齐后提交，之后可在 /process 或 /batch_process 中引用"""
+    try:
+        upload_store.commit(upload_id, UPLOAD_FOLDER)
+        return jsonify(upload_store.status(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+
 @app.route('/status/<task_id>')
 def get_status(task_id):
     """获取任务状态"""
-    if task_id in results:
-        return jsonify(results[task_id])
+    state = tasks.get(task_id)
+    if state is not None:
+        return jsonify(with_queue_position(state))
     return jsonify({'error': '任务不存在'}), 404
 
+def with_queue_position(state):
+    """排队中的任务附带前面还有几个任务"""
+    if state.get('status') == 'queued' and state.get('job_id'):
+        position = task_store.queue_position(state['job_id'])
+        if position is not None:
+            state = dict(state, queue_position=position)
+    return state
+
+@app.route('/status', methods=['POST'])
+def get_status_bulk():
+    """一次查询多个任务：{task_ids: [...]} -> {tasks: {task_id: 状态或null}}"""
+    data = request.get_json(silent=True) or {}
+    task_ids = data.get('task_ids')
+    if not isinstance(task_ids, list):
+        return jsonify({'error': '缺少task_ids'}), 400
+    states = tasks.get_many(str(task_id) for task_id in task_ids)
+    return jsonify({'tasks': {
+        task_id: with_queue_position(state) if state else None
+        for task_id, state in states.items()
+    }})
+
+@app.route('/events')
+def task_event_stream():
+    """
+    Server-Sent Events：推送任务状态变化
+    ?task_ids=a,b 只订阅指定任务（省略则订阅全部）；重连时根据 Last-Event-ID 补发错过的事件
+    """
+    task_filter = request.args.get('task_ids')
+    task_ids = {t for t in task_filter.split(',') if t} if task_filter else None
+    try:
+        after_seq = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        after_seq = None
+    
+    def stream():
+        seq = after_seq
+        if seq is None or seq > tasks.last_seq():
+            # 新连接（或服务器重启前的事件序号）先发送当前状态，之后只推送变化
+            seq = tasks.last_seq()
+            if task_ids:
+                for task_id, state in tasks.get_many(sorted(task_ids)).items():
+                    if state is not None:
+                        payload = dict(state, task_id=task_id)
+                        yield f"id: {seq}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        while True:
+            latest, events = tasks.wait_events(seq, task_ids, EVENT_KEEPALIVE_SECONDS)
+            if not events and latest == seq:
+                yield ": keepalive\n\n"
+            for event_seq, task_id, state in events:
+                payload = dict(state, task_id=task_id)
+                yield f"id: {event_seq}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            seq = latest
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/batch_process', methods=['POST'])
 def batch_process():
-    """批量处理音频文件"""
+    """
+    批量处理音频文件
+    返回的 task_ids 按请求中 upload_ids[] 再 files[] 的顺序排列，每个文件一个ID，
+    无效的文件对应null；batch_id 为整批的任务ID
+    """
     files = request.files.getlist('files[]')
+    upload_ids = request.form.getlist('upload_ids[]')
     
-    if not files:
+    if not files and not upload_ids:
         return jsonify({'error': '没有找到文件'}), 400
     
-    # 保存所有文件并准备处理
-    file_paths = []
+    # 队列已满时在保存文件之前就拒绝
+    if not scheduler.has_capacity():
+        return queue_full_response(QueueFullError(scheduler.retry_after()))
+    
+    # 先取出已分块上传的大文件，再保存其余文件
+    try:
+        file_paths, filenames = claim_uploads(upload_ids)
+    except UploadError as e:
+        return upload_error_response(e)
+    task_ids = [new_task_id() for _ in file_paths]
     for file in files:
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            timestamp = int(time.time() * 1000)
-            unique_filename = f"{timestamp}_{filename}"
-            filepath = UPLOAD_FOLDER / unique_filename
-            file.save(str(filepath))
-            file_paths.append(str(filepath))
+            filepath, filename, _ = save_upload(file)
+            file_paths.append(filepath)
+            filenames.append(filename)
+            task_ids.append(new_task_id())
+        else:
+            task_ids.append(None)
     
     if not file_paths:
         return jsonify({'error': '没有有效的音频文件'}), 400
     
-    # 在后台线程中处理
-    def process_batch():
-        try:
-            print(f"📋 开始批量处理 {len(file_paths)} 个文件...")
-            for fp in file_paths:
-                print(f"  - {os.path.basename(fp)}")
-            
-            # 加载API密钥
-            api_key = load_api_key()
-            print(f"✅ API密钥已加载")
-            
-            # 创建工作流实例
-            workflow = VoiceToNotesWorkflow(api_key)
-            
-            # 处理所有文件
-            workflow.process_audio_files(file_paths)
-            
-            print(f"✅ 批量处理完成")
-            
-            # 清理临时文件
-            for filepath in file_paths:
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
-                    
-        except Exception as e:
-            print(f"❌ 批量处理错误: {str(e)}")
-            import traceback
-            traceback.print_exc()
-    
-    # 启动处理线程
-    thread = threading.Thread(target=process_batch)
-    thread.daemon = True
-    thread.start()
+    # 整批作为一个任务提交，保持按日期分组和排序；每个文件另有自己的任务ID
+    batch_id = new_task_id('batch')
+    try:
+        enqueue_job(batch_id, file_paths, filenames, [t for t in task_ids if t])
+    except QueueFullError as e:
+        return queue_full_response(e)
     
     return jsonify({
         'success': True,
+        'task_id': batch_id,
+        'batch_id': batch_id,
+        'task_ids': task_ids,
         'message': f'已开始处理 {len(file_paths)} 个文件',
         'count': len(file_paths)
     })
 
-def process_worker():
-    """后台处理工作线程"""
-    try:
-        # 加载API密钥
-        api_key = load_api_key()
-        workflow = VoiceToNotesWorkflow(api_key)
-    except Exception as e:
-        print(f"❌ 初始化错误: {str(e)}")
-        import traceback
-        traceback.print_exc()
+def report_file_stage(audio_file, stage):
+    """工作流的阶段回调：更新对应文件的任务状态"""
+    task_id = file_task_ids.get(audio_file)
+    if task_id is None:
         return
+    if stage == 'done':
+        status = 'success'
+    elif stage == 'failed':
+        status = 'error'
+    elif stage == 'queued':
+        status = 'queued'
+    else:
+        status = 'processing'
+    tasks.update(task_id, status=status, stage=stage, message=STAGE_MESSAGES.get(stage, stage))
+
+def create_workflow():
+    """每个工作线程使用独立的工作流实例"""
+    api_key = load_api_key()
+    options = {}
+    if SYNC_TIMEOUT is not None:
+        options['sync_timeout'] = float(SYNC_TIMEOUT)
+    if ENCODING:
+        options['encoding'] = ENCODING
+    return VoiceToNotesWorkflow(
+        api_key,
+        on_stage=report_file_stage,
+        client_options={'api_url': API_URL} if API_URL else None,
+        backup_root=BACKUP_ROOT_DIR,
+        # 上传的临时文件处理完就删除，备份时直接移动，省去一次完整复制
+        disposable_inputs=True,
+        **options
+    )
+
+def run_job(workflow, job):
+    """在调度器工作线程中处理一个任务（单个文件或一批文件）"""
+    task_id = job['task_id']
+    file_paths = job['files']
+    file_task_ids.update(job['file_tasks'])
+    is_batch = task_id not in job['file_tasks'].values()
+    task_store.mark_job_running(task_id)
     
-    while True:
-        try:
-            # 从队列获取任务
-            task_id, filepath, original_filename = processing_queue.get(timeout=1)
-            
-            # 更新状态
-            results[task_id] = {
-                'status': 'processing',
-                'filename': original_filename,
-                'message': '正在处理...'
-            }
-            
-            try:
-                # 处理单个文件
-                workflow.process_audio_files([filepath])
-                
-                # 更新状态为成功
-                results[task_id] = {
-                    'status': 'success',
-                    'filename': original_filename,
-                    'message': '处理完成'
-                }
-                
-                # 清理临时文件
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
-                    
-            except Exception as e:
-                # 更新状态为失败
-                results[task_id] = {
-                    'status': 'error',
-                    'filename': original_filename,
-                    'message': f'处理失败: {str(e)}'
-                }
-            
-        except queue.Empty:
-            continue
-        except Exception as e:
-            print(f"处理工作线程错误: {str(e)}")
+    # 更新状态
+    if is_batch:
+        tasks.update(task_id, status='processing', message='正在处理...')
+    
+    print(f"📋 开始处理 {len(file_paths)} 个文件...")
+    for fp in file_paths:
+        print(f"  - {os.path.basename(fp)}")
+    
+    try:
+        workflow.process_audio_files(file_paths)
+    finally:
+        for fp in file_paths:
+            file_task_ids.pop(fp, None)
+    
+    # 单个文件的最终状态由阶段回调给出，整批任务在这里汇总
+    failed = sum(1 for state in tasks.get_many(job['file_tasks'].values()).values()
+                 if state and state.get('status') == 'error')
+    if is_batch:
+        tasks.update(
+            task_id,
+            status='success' if not failed else 'error',
+            message='处理完成' if not failed else f'{failed}/{len(file_paths)} 个文件处理失败'
+        )
+    print(f"✅ 处理完成")
+    if not failed:
+        JOBS_TOTAL.inc(result='success')
+    else:
+        # 部分文件失败的批次单独计数，不算作成功
+        JOBS_TOTAL.inc(result='error' if failed >= len(file_paths) else 'partial')
+    
+    # 清理临时文件
+    remove_files(file_paths)
+    task_store.finish_job(task_id)
+
+def job_failed(job, error):
+    """任务失败（包括工作流初始化失败）"""
+    message = f'处理失败: {str(error)}'
+    JOBS_TOTAL.inc(result='error')
+    for task_id in set(job['file_tasks'].values()) | {job['task_id']}:
+        state = tasks.get(task_id) or {}
+        if state.get('status') not in ('success', 'error'):
+            tasks.update(task_id, status='error', stage='failed', message=message)
+    remove_files(job['files'])
+    task_store.finish_job(job['task_id'])
+
+# 所有上传接口共用的有界调度器
+scheduler = JobScheduler(
+    run_job,
+    workers=WORKER_COUNT,
+    max_queue=MAX_QUEUE_DEPTH,
+    worker_init=create_workflow,
+    on_error=job_failed
+)
+
+# 调度器状态在每次抓取时读取
+Gauge('voice_notes_queue_depth', '等待处理的任务数').set_function(lambda: scheduler.queue_depth())
+Gauge('voice_notes_active_workers', '正在处理任务的工作线程数').set_function(lambda: scheduler.active_workers())
+Gauge('voice_notes_workers', '工作线程总数').set_function(lambda: scheduler.workers)
+Gauge('voice_notes_queue_capacity', '等待队列上限').set_function(lambda: scheduler.max_queue)
+
+@app.route('/search')
+def search_transcripts():
+    """
+    全文搜索转录备份：?q=关键词&limit=20&offset=0
+    返回按相关度排序的结果，snippet 中命中部分用<mark>标出
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': '缺少搜索内容'}), 400
+    try:
+        limit = min(SEARCH_MAX_LIMIT, max(1, int(request.args.get('limit', 20))))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'error': 'limit和offset必须是整数'}), 400
+    
+    started_at = time.perf_counter()
+    results = transcript_index.search(query, limit=limit, offset=offset)
+    return jsonify({
+        'query': query,
+        'results': results,
+        'took_ms': round((time.perf_counter() - started_at) * 1000, 2)
+    })
+
+def build_transcript_index():
+    """补建已有转录备份的索引（只处理新增或有变化的文件）"""
+    try:
+        stats = transcript_index.build()
+        if stats['indexed'] or stats['removed']:
+            print(f"🔎 搜索索引已更新: 新增/更新 {stats['indexed']} 个，移除 {stats['removed']} 个")
+    except Exception as e:
+        print(f"⚠️ 建立搜索索引失败: {str(e)}")
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus文本格式的运行指标"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+_health_cache = {'checked_at': 0.0, 'result': None}
+_health_lock = threading.Lock()
 
 @app.route('/health')
 def health_check():
-    """健康检查端点"""
+    """健康检查端点（结果缓存 HEALTH_CACHE_SECONDS 秒，避免每次探测都启动FFmpeg）"""
+    with _health_lock:
+        if _health_cache['result'] is None or time.time() - _health_cache['checked_at'] > HEALTH_CACHE_SECONDS:
+            _health_cache['result'] = check_health()
+            _health_cache['checked_at'] = time.time()
+        return jsonify(_health_cache['result'])
+
+def check_health():
+    """检查API密钥和FFmpeg是否可用"""
     try:
         # 检查API密钥
         api_key = load_api_key()
@@ -223,28 +571,51 @@ def health_check():
     except:
         has_ffmpeg = False
     
-    return jsonify({
+    return {
         'status': 'ok' if (has_api_key and has_ffmpeg) else 'error',
         'has_api_key': has_api_key,
         'has_ffmpeg': has_ffmpeg,
         'upload_folder': str(UPLOAD_FOLDER),
         'project_root': str(PROJECT_ROOT)
-    })
+    }
+
+def recover_jobs():
+    """
+    重新提交上次运行时排队中或处理中断的任务（上传文件仍在上传目录中）
+    已备份的上传文件会被移入备份目录，阶段日志中有备份记录的文件不算丢失，从日志继续处理
+    在后台线程中执行，队列已满时等待而不是丢弃
+    """
+    pending = task_store.pending_jobs()
+    if not pending:
+        return
+    print(f"♻️ 恢复 {len(pending)} 个未完成的任务")
+    for job in pending:
+        backed_up = set(backed_up_files(job['files']))
+        missing = [fp for fp in job['files'] if not os.path.exists(fp) and fp not in backed_up]
+        if missing:
+            job_failed(job, FileNotFoundError(f"上传文件已丢失: {os.path.basename(missing[0])}"))
+            continue
+        for file_task in set(job['file_tasks'].values()) | {job['task_id']}:
+            if tasks.get(file_task) is not None:
+                tasks.update(file_task, status='queued', message=STAGE_MESSAGES['queued'])
+        scheduler.submit_wait(job)
 
-# 启动处理工作线程
-worker_thread = threading.Thread(target=process_worker)
-worker_thread.daemon = True
-worker_thread.start()
+# 启动处理工作线程，并恢复重启前未完成的任务
+scheduler.start()
+threading.Thread(target=recover_jobs, name='job-recovery', daemon=True).start()
+threading.Thread(target=build_transcript_index, name='transcript-index', daemon=True).start()
+threading.Thread(target=upload_store.cleanup_expired, name='upload-cleanup', daemon=True).start()
 
 if __name__ == '__main__':
     print("🚀 启动闪念笔记Web服务器...")
     print(f"📁 项目目录: {PROJECT_ROOT}")
     print(f"📂 上传目录: {UPLOAD_FOLDER}")
+    print(f"⚙️  工作线程: {WORKER_COUNT}，队列上限: {MAX_QUEUE_DEPTH}")
     print("")
-    print("🌐 访问地址: http://localhost:8181")
+    print(f"🌐 访问地址: http://localhost:{SERVER_PORT}")
     print("   或打开浏览器访问上述地址")
     print("")
     print("按 Ctrl+C 停止服务器")
     
     # 启动服务器
-    app.run(host='0.0.0.0', port=8181, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=SERVER_PORT, debug=False, threaded=True)
\ No newline at end of file